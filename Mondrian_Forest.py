@@ -2,28 +2,56 @@ import random
 import copy
 import warnings
 import math
+import concurrent.futures
+
+import numpy as np
 
 import core.utils as utils
 from core.LeafNode import LeafNode
 from core.SplitNode import SplitNode
+from core.SharedArray import SharedArray
 from Mondrian_Tree import Mondrian_Tree
 
 class Mondrian_Forest:
 
     '''
     Main class for Mondrian Forest, a forest of Mondrian Trees
+
+    Args:
+        linear_dims (list): A p dim list of 2 dim lists indicating the upper and 
+        lower bounds of the entire space.
+        num_trees (int): Number of Mondrian Trees in the forest.
+        engine (str): Tree structure storage used by every tree, 'node' or 'flat'. See
+        Mondrian_Tree.
+        growth (str): How every tree is grown, 'walk', 'fenwick', 'top_down' or 'lazy'. See
+        Mondrian_Tree.
+        n_jobs (int): Number of processes update_life_time grows the trees in. Every tree
+        has its own random number generators, so the forest is the same for any n_jobs.
     '''
 
-    def __init__(self, linear_dims, num_trees):
+    def __init__(self, linear_dims, num_trees, engine='node', growth='walk', n_jobs=1):
         self._linear_dims = linear_dims
         self._num_dimensions = len(linear_dims)
         self._num_trees = num_trees
+        self._engine = engine
+        self._growth = growth
+        self._n_jobs = n_jobs
         self.tree_list = []
         for _ in range(num_trees):
-            self.tree_list.append(Mondrian_Tree(self._linear_dims))
+            self.tree_list.append(
+                Mondrian_Tree(self._linear_dims, engine=self._engine, growth=self._growth))
 
-        self.points = None
         self.labels = None
+        self.labelled_mask = np.zeros(0, dtype=bool)
+        self._points_array = np.zeros([0, self._num_dimensions])
+        self._points_list = None
+        self._shared_points = None
+
+        # Growable storage the point and label arrays are views of, see Mondrian_Tree
+
+        self._points_store = self._points_array
+        self._labels_store = None
+        self._labelled_mask_store = None
         self._num_points = 0
         self._num_labelled = 0
         self._avg_num_leaves = 1
@@ -46,6 +74,81 @@ class Mondrian_Forest:
             self._num_dimensions, self._life_time, self._num_trees, self._num_points, 
             self._num_labelled))
 
+    def __getstate__(self):
+        '''Points held in a SharedArray are pickled by handle rather than by value.'''
+
+        state = self.__dict__.copy()
+        state['_points_list'] = None
+        if self._shared_points is not None:
+            state['_points_array'] = None
+            state['_points_store'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._shared_points is not None:
+            self._points_store = self._shared_points.array
+            self._points_array = self._points_store
+
+    @property
+    def points(self):
+        '''The points as a list of lists, made the first time it is asked for and shared
+        with every tree.
+        '''
+
+        if self._points_list is None and self.labels is not None:
+            self._points_list = self._points_array.tolist()
+            for tree in self.tree_list:
+                tree._points_list = self._points_list
+        return self._points_list
+
+    def fork(self):
+        '''Returns a copy of the forest made of forks of its trees (see Mondrian_Tree.fork).
+        The two forests share the split structure of every tree and the point and label
+        arrays until one of them labels points, adds data or grows.
+        '''
+
+        forked = copy.copy(self)
+        forked.tree_list = [tree.fork() for tree in self.tree_list]
+        forked._points_list = None
+        if self._al_avg_weights_adjustment is not None:
+            forked._al_avg_weights_adjustment = self._al_avg_weights_adjustment.copy()
+
+        if self.labels is not None:
+            for forest in [self, forked]:
+                forest._points_array = forest._points_store[:forest._num_points]
+                forest.labels = forest._labels_store[:forest._num_points]
+                forest.labelled_mask = forest._labelled_mask_store[:forest._num_points]
+                forest._link_trees()
+        return forked
+
+    def truncate(self, life_time):
+        '''Returns a fork of the forest with every tree pruned back to a smaller life time,
+        see Mondrian_Tree.truncate.
+        '''
+
+        if life_time > self._life_time:
+            raise ValueError('Life time {} is larger than the life time of the forest {}'.format(
+                life_time, self._life_time))
+
+        truncated = self.fork()
+        truncated.update_life_time(life_time)
+        return truncated
+
+    def _own_labels(self):
+        '''Copies the label arrays if they are shared with a fork, before writing to them,
+        and points every tree at the copies.
+        '''
+
+        if self._labels_store is None or self._labels_store.flags.writeable:
+            return
+
+        self._labels_store = self.labels.copy()
+        self._labelled_mask_store = self.labelled_mask.copy()
+        self.labels = self._labels_store
+        self.labelled_mask = self._labelled_mask_store
+        self._link_trees()
+
     def _test_point(self, new_point):
         '''Tests an input point, raising errors if it's a bad type and converting it from
         a numpy array to a list if needed 
@@ -78,129 +181,312 @@ class Mondrian_Forest:
     # Growing and adding data
 
     def update_life_time(self, new_life_time, set_seeds = None):
+        '''Grows every tree up to new_life_time. Tree i is seeded with set_seeds[i]; without
+        set_seeds a seed for each tree is spawned from one SeedSequence (drawn from the global
+        random module, so random.seed still makes the forest reproducible). With n_jobs > 1
+        the trees are grown in a process pool and handed back. A smaller life time prunes
+        every tree back, see Mondrian_Tree.update_life_time.
+        '''
 
-        self._avg_num_leaves = 0
-        for i, tree in enumerate(self.tree_list):
-            if set_seeds is not None:
+        if set_seeds is None and new_life_time < self._life_time:
+
+            # Pruning draws nothing, so the trees keep their random number generators
+
+            set_seeds = [None] * self._num_trees
+        elif set_seeds is None:
+            seed_seq = np.random.SeedSequence(random.getrandbits(128))
+            set_seeds = [int(child.generate_state(1, np.uint64)[0])
+                for child in seed_seq.spawn(self._num_trees)]
+
+        if self._n_jobs > 1 and self._num_trees > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self._n_jobs) as executor:
+                self.tree_list = list(executor.map(_grow_tree, self.tree_list, 
+                    [new_life_time] * self._num_trees, set_seeds[:self._num_trees]))
+
+            # The trees come back with their own copies of the data, so share ours again
+
+            if self.labels is not None:
+                self._link_trees()
+        else:
+            for i, tree in enumerate(self.tree_list):
                 tree.update_life_time(new_life_time, set_seeds[i])
-            else:
-                tree.update_life_time(new_life_time)
+
+        self._life_time = new_life_time
+        self._avg_num_leaves = 0
+        for tree in self.tree_list:
             self._avg_num_leaves += tree._num_leaves
         self._avg_num_leaves = self._avg_num_leaves / self._num_trees
 
-    def input_data(self, all_data, labelled_indices, labels):
+    def input_data(self, all_data, labelled_indices, labels, copy_data=False, shared=False):
+        '''Puts the same data into every tree, see Mondrian_Tree.input_data. The trees all
+        share the forest's points and labels rather than holding copies, and a float numpy
+        array is only copied if copy_data is True.
 
-        all_data = copy.deepcopy(all_data)
-        labelled_indices = copy.deepcopy(labelled_indices)
-        labels = copy.deepcopy(labels)
+        With shared=True the points are put in a core.SharedArray: the forest and every
+        tree hold the same read only array, and pickling the forest or its trees (e.g. to
+        grow with n_jobs > 1 or to send to joblib workers) only sends a handle to it.
+        '''
 
-        if len(all_data) < len(labelled_indices):
-            raise ValueError('Cannot have more labelled indices than points')
+        points, labelled_array, labels = utils.prepare_data(
+            all_data, labelled_indices, labels, self._num_dimensions, copy_data)
 
-        if len(labelled_indices) != len(labels):
-            raise ValueError('Labelled indices list and labels list must be same length')
+        self._points_array = points
+        self._points_list = None
+        self._num_points = len(points)
+        self._num_labelled = len(labels)
 
-        for point in all_data:
-            if len(point) != self._num_dimensions:
-                raise ValueError('All data points must be of the dimension on which this \
-                    Mondrian Tree is built ({})'.format(self._num_dimensions))
+        # Making the label array, with NaN in places where we don't have the label
 
-        if str(type(all_data)) == "<class 'numpy.ndarray'>":
-            if self._verbose:
-                print('Converting all_data to list of lists internally')
-            all_data = all_data.tolist()
+        self.labels = np.full(self._num_points, np.nan)
+        self.labels[labelled_array] = labels
+        self.labelled_mask = np.zeros(self._num_points, dtype=bool)
+        self.labelled_mask[labelled_array] = True
 
-        if str(type(labelled_indices)) == "<class 'numpy.ndarray'>":
-            if self._verbose:
-                print('Converting labelled_indices to list internally')
-            labelled_indices = labelled_indices.tolist()
+        self._shared_points = None
+        if shared:
+            self._shared_points = SharedArray(self._points_array)
+            self._points_array = self._shared_points.array
+        self._points_store = self._points_array
+        self._labels_store = self.labels
+        self._labelled_mask_store = self.labelled_mask
 
-        if str(type(labels)) == "<class 'numpy.ndarray'>":
-            if self._verbose:
-                print('Converting labels to list internally')
-            labels = labels.tolist()
-
-        self.points = all_data
-        self._num_points = len(self.points)
-        self._num_labelled = len(labels)
+        for tree in self.tree_list:
+            tree.input_data(self._points_array, labelled_array, labels)
+        self._link_trees()
 
-        # Making a label list, with None in places where we don't have the label
+    def _link_trees(self):
+        '''Points every tree at the forest's point and label arrays (and their storage), so
+        the data is held once however many trees there are.
+        '''
 
-        temp = [None] * self._num_points
-        for i,ind in enumerate(labelled_indices):
-            temp[ind] = labels[i]
-        self.labels = temp
+        for tree in self.tree_list:
+            tree._points_list = self._points_list
+            tree._shared_points = self._shared_points
+            for name in ['_points_array', 'labels', 'labelled_mask', '_points_store', 
+                '_labels_store', '_labelled_mask_store']:
+                setattr(tree, name, getattr(self, name))
 
-        for i, tree in enumerate(self.tree_list):
-            tree.input_data(all_data, labelled_indices, labels, copy_data = False)
-            tree.points = self.points
-            tree.labels = self.labels
-            
     def label_point(self, index, value):
 
         value = copy.copy(value)
         index = copy.copy(index)
         self._num_labelled += 1
+        self._own_labels()
         for tree in self.tree_list:
             tree.label_point(index, value)
 
+    def label_points(self, indices, values):
+        '''Labels a batch of points in every tree, see Mondrian_Tree.label_points. The
+        shared label arrays are filled in once and each tree only moves the points between
+        its leaf index lists and updates its statistics.
+        '''
+
+        if self.labels is None:
+            raise RuntimeError('No data in the forest')
+
+        indices, values = utils.prepare_labels(indices, values, self.labelled_mask)
+        if len(indices) == 0:
+            return
+
+        self._own_labels()
+        self.labels[indices] = values
+        self.labelled_mask[indices] = True
+        self._num_labelled += len(indices)
+        for tree in self.tree_list:
+            tree._label_leaf_points(indices, values)
+
     def add_data_point(self, new_point, label = None):
 
-        new_point = copy.deepcopy(new_point)
-        label = copy.deepcopy(label)
         new_point = self._test_point(new_point)
+        self.add_data_points([new_point], None if label is None else [label])
 
-        if self.points is None:
-            point_index = 0
-            self.points = [new_point]
-            self.labels = [label]
-        else:
-            point_index = len(self.labels)
-            self.points.append(new_point)
-            self.labels.append(label)
-
-        self._num_points += 1
-        if label is not None:
-            self._num_labelled += 1
+    def add_data_points(self, new_points, labels = None):
+        '''Adds a chunk of points to every tree, see Mondrian_Tree.add_data_points. The
+        shared point and label arrays are appended to once, then every tree routes the whole
+        chunk and updates its statistics.
+        '''
 
+        new_points, labels = utils.prepare_new_points(new_points, labels, self._num_dimensions)
+        if len(new_points) == 0:
+            return
+
+        first_index = self._num_points
+        if self.labels is None:
+            self._labels_store = np.zeros(0)
+            self._labelled_mask_store = np.zeros(0, dtype=bool)
+        self._points_store = utils.append_rows(self._points_store, first_index, new_points)
+        self._labels_store = utils.append_rows(self._labels_store, first_index, labels)
+        self._labelled_mask_store = utils.append_rows(
+            self._labelled_mask_store, first_index, ~np.isnan(labels))
+        self._num_points = first_index + len(new_points)
+        self._num_labelled += int((~np.isnan(labels)).sum())
+        self._points_array = self._points_store[:self._num_points]
+        self.labels = self._labels_store[:self._num_points]
+        self.labelled_mask = self._labelled_mask_store[:self._num_points]
+        if self._points_list is not None:
+            self._points_list.extend(new_points.tolist())
+
+        # The points array is the forest's own now, even if the old one was shared
+        self._shared_points = None
+
+        self._link_trees()
         for tree in self.tree_list:
-            leaf = tree._root.leaf_for_point(new_point)
-            if label is None:
-                leaf.unlabelled_index.append(point_index)
-                tree._num_points += 1
-            else:
-                leaf.labelled_index.append(point_index)
-                tree._num_points += 1
-                tree._num_labelled += 1
-
-            tree._full_leaf_marginal_list_up_to_date = False
-            if label is not None:
-                tree._full_leaf_mean_list_up_to_date = False
-                tree._full_leaf_var_list_up_to_date = False
+            tree._place_new_points(first_index, new_points, labels)
 
     ###########################################
 
     # Using the forest
 
-    def predict(self, new_point):
+    def predict(self, new_point, n_threads=1):
+        '''Make prediction for a data point by averaging the predictions of every tree. If a
+        list (or 2 dim array) of points is given, each tree routes all of the points in one go
+        and the leaf means are gathered into a (num_trees, num_points) array, which is averaged
+        with one reduction and returned as a list. n_threads > 1 spreads the trees over a
+        thread pool.
+        '''
+
+        # Every tree holds the same labels, so the global mean only needs working out once
 
-        tree_preds = []
+        self.tree_list[0].set_default_pred_global_mean()
+        default_value = self.tree_list[0].prediction_default_value
         for tree in self.tree_list:
-            tree.set_default_pred_global_mean()
-            tree_preds.append(tree.predict(new_point))
+            tree.prediction_default_value = default_value
 
-        if type(tree_preds[0]) is not list:
+        is_list = isinstance(new_point, list) and len(new_point) != 0 and isinstance(
+            new_point[0], list)
+        if not is_list and not (isinstance(new_point, np.ndarray) and new_point.ndim == 2):
+            tree_preds = [tree.predict(new_point) for tree in self.tree_list]
             return(sum(tree_preds)/self._num_trees)
 
+        data_points = np.asarray(new_point, dtype=float)
+        preds, fallback = self._average_tree_means(
+            lambda tree: _fill_empty(*tree._leaf_means_for_points(data_points), default_value), 
+            len(data_points), n_threads)
+        if fallback.any():
+            self.tree_list[0]._warn_empty_leaf()
+        return(preds.tolist())
+
+    def predict_pool(self, indices, n_threads=1):
+        '''Make predictions for points already in the forest, given by their indices, by
+        averaging the predictions of every tree. Each tree reads the points' leaves off its
+        stored point to leaf map instead of routing them, see Mondrian_Tree.predict_pool.
+        Returns a list of predictions.
+        '''
+
+        self.tree_list[0].set_default_pred_global_mean()
+        default_value = self.tree_list[0].prediction_default_value
+        for tree in self.tree_list:
+            tree.prediction_default_value = default_value
+
+        indices = np.asarray(indices, dtype=np.intp).reshape(-1)
+        preds, fallback = self._average_tree_means(
+            lambda tree: _fill_empty(*tree._pool_means(indices), default_value), 
+            len(indices), n_threads)
+        if fallback.any():
+            self.tree_list[0]._warn_empty_leaf()
+        return(preds.tolist())
+
+    def predict_points(self, new_points, fallback='global_mean', n_threads=1):
+        '''Vectorized predictions of the forest for a list (or 2 dim array) of points which
+        never warns. Every tree predicts the points in its empty leaves by fallback, see
+        Mondrian_Tree.predict_points, and the trees are averaged. Returns the predictions and
+        a boolean array marking the points that fell back in any tree, as numpy arrays.
+        '''
+
+        data_points = np.asarray(new_points, dtype=float)
+        return self._average_tree_means(
+            lambda tree: tree.predict_points(data_points, fallback=fallback), 
+            len(data_points), n_threads)
+
+    def _average_tree_means(self, tree_preds, num_points, n_threads):
+        '''Gathers tree_preds(tree), a pair of predictions and a boolean array marking the
+        ones that fell back, for every tree into a (num_trees, num_points) array and averages
+        it with one reduction. Returns the averages and a boolean array marking the points
+        that fell back in any tree.
+        '''
+
+        preds_matrix = np.empty([self._num_trees, num_points])
+
+        def predict_tree(i):
+            preds_matrix[i], empty = tree_preds(self.tree_list[i])
+            return empty
+
+        if n_threads > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=n_threads) as executor:
+                empties = list(executor.map(predict_tree, range(self._num_trees)))
         else:
-            preds = []
-            for j in range(len(tree_preds[0])):
-                val = 0
-                for i in range(self._num_trees):
-                    val += tree_preds[i][j]
-                val = val / self._num_trees
-                preds.append(val)
-            return(preds)
+            empties = [predict_tree(i) for i in range(self._num_trees)]
+
+        fallback = np.zeros(num_points, dtype=bool)
+        for empty in empties:
+            fallback |= empty
+        return preds_matrix.sum(axis=0) / self._num_trees, fallback
+
+    def predict_life_times(self, new_points, life_times):
+        '''Predictions of the forest for a list (or 2 dim array) of points at each of several
+        life times no larger than the forest's, see Mondrian_Tree.predict_life_times. Returns
+        a (len(life_times), num_points) numpy array.
+        '''
+
+        preds, any_empty = self._life_time_preds(new_points, life_times)
+        if any_empty:
+            self.tree_list[0]._warn_empty_leaf()
+        return preds
+
+    def _life_time_preds(self, new_points, life_times):
+        '''Works out predict_life_times, with points in nodes without labels predicted by the
+        global mean. Also returns whether there were any.
+        '''
+
+        self.tree_list[0].set_default_pred_global_mean()
+        default_value = self.tree_list[0].prediction_default_value
+
+        preds = np.zeros([len(life_times), len(new_points)])
+        any_empty = False
+        for tree in self.tree_list:
+            tree.prediction_default_value = default_value
+            tree_preds, empty = tree._life_time_means(new_points, life_times)
+            tree_preds[empty] = default_value
+            preds += tree_preds
+            any_empty = any_empty or empty.any()
+        return preds / self._num_trees, any_empty
+
+    def life_time_error_curve(self, new_points, new_labels, life_times=None, num_life_times=100):
+        '''Held out mean squared error of the forest's predictions for the labelled points
+        new_points at each of a grid of life times, see Mondrian_Tree.life_time_error_curve.
+        Returns the life times and the errors as numpy arrays.
+        '''
+
+        if life_times is None:
+            life_times = np.linspace(0, self._life_time, num_life_times + 1)[1:]
+        life_times = np.asarray(life_times, dtype=float)
+        new_labels = np.asarray(new_labels, dtype=float)
+        if len(new_labels) != len(new_points):
+            raise ValueError('Need a label for every point')
+
+        preds, _ = self._life_time_preds(new_points, life_times)
+        return life_times, ((preds - new_labels)**2).mean(axis=1)
+
+    def loo_residuals(self):
+        '''Leave one out residuals of the labelled points, in index order: each point is
+        predicted by the average over the trees of its leave one out prediction, see
+        Mondrian_Tree.loo_residuals.
+        '''
+
+        if self.labels is None:
+            return np.zeros(0)
+
+        preds = np.zeros(self._num_labelled)
+        for tree in self.tree_list:
+            preds += tree._loo_preds()
+        return self.labels[self.labelled_mask] - preds / self._num_trees
+
+    def loo_error(self):
+        '''Mean squared leave one out error of the labelled points, see loo_residuals.'''
+
+        if self._num_labelled == 0:
+            raise RuntimeError('No labelled data in the forest')
+        return float((self.loo_residuals()**2).mean())
 
     ###########################################
 
@@ -208,23 +494,33 @@ class Mondrian_Forest:
     # methods here will start with al_ so you know they're active learning related.
 
     def al_average_point_probabilities_adjustment(self, num_samples_total):
+        '''Averages the adjusted point probabilities of every tree. Each tree writes its
+        probabilities straight into its own row of a (num_trees, num_points) array, which is
+        then averaged with one reduction. Returns the average as a numpy array, which is
+        also kept in _al_avg_weights_adjustment.
+        '''
 
-        weights_list = []
-        for tree in self.tree_list:
+        weights_matrix = np.empty([self._num_trees, self._num_points])
+        for i, tree in enumerate(self.tree_list):
             tree.al_set_default_var_global_var()
             tree.al_calculate_leaf_proportions()
-            tree.al_calculate_point_probabilities_adjustment(num_samples_total)
-            weights_list.append(tree._al_point_weights_adjustment)
-
-        avg_weights = [0]*self._num_points
-        for i in range(self._num_points):
-            for j in range(self._num_trees):
-                val = weights_list[j][i]
-                if val is not None:
-                    avg_weights[i] += val
-                
-        avg_weights = [x/self._num_trees for x in avg_weights]
+            tree.al_calculate_point_probabilities_adjustment(num_samples_total, 
+                out=weights_matrix[i])
+
+        # Summing over the first axis adds the rows in order, as the old loop did
+
+        avg_weights = weights_matrix.sum(axis=0) / self._num_trees
         self._al_avg_weights_adjustment = avg_weights
+        return avg_weights
+
+def _fill_empty(preds, empty, default_value):
+    '''Sets the predictions marked empty to default_value.'''
 
+    preds[empty] = default_value
+    return preds, empty
 
+def _grow_tree(tree, new_life_time, set_seed):
+    '''Grows one tree of a forest, at module level so a process pool can pickle it.'''
 
+    tree.update_life_time(new_life_time, set_seed)
+    return tree
@@ -2,10 +2,21 @@ import random
 import copy
 import warnings
 import math
+import itertools
+import heapq
+
+import numpy as np
 
 import core.utils as utils
 from core.LeafNode import LeafNode
 from core.SplitNode import SplitNode
+from core.FlatTree import FlatTree
+from core.FenwickTree import FenwickTree
+
+# Attributes a fork shares with the tree it came from until one of them writes to them
+
+_SHARED_ATTRIBUTES = {'_points_array', '_points_store', 'labels', '_labels_store', 
+    'labelled_mask', '_labelled_mask_store', '_point_leaf', '_point_leaf_store', '_points_list'}
 
 class Mondrian_Tree:
 
@@ -18,22 +29,115 @@ class Mondrian_Tree:
         outside this space (probably!) but no partitions will take place outside this
         space so any partitioning will just be from infinite continuations of edge 
         partitions.
+        seed (int): Seed for the random module.
+        engine (str): How the tree structure is stored. 'node' (default) builds a graph of
+        LeafNode and SplitNode objects reachable from _root. 'flat' stores the structure in
+        numpy arrays (see core.FlatTree) which is far lighter for large trees. In the flat
+        engine _root is None and leaves are handed out as FlatLeaf views.
+        growth (str): How update_life_time picks the next leaf to split. 'walk' (default)
+        walks down from the root choosing children by subtree_linear_dim. 'fenwick' keeps
+        a Fenwick tree over the leaf linear dims so each pick is one O(log L) search; the
+        trees have the same distribution but differ from 'walk' for a given seed, and
+        subtree_linear_dim is then only kept up to date on the leaves. 'top_down' generates
+        the same process top down: every leaf independently draws its own split time,
+        dimension and location, and all the leaves at one depth are drawn together with
+        numpy (random numbers then come from a numpy Generator seeded by set_seed). 'lazy'
+        is 'top_down' restricted to the data: only leaves holding points are split, and
+        empty leaves are left pending until a point lands in them (through input_data or
+        add_data_point), at which point they are grown up to the life time. By the memoryless
+        property this gives the same distribution over the cells that hold data, but trees
+        on sparse high dimensional data stay orders of magnitude smaller.
     '''
 
-    def __init__(self, linear_dims, seed=None):
+    def __init__(self, linear_dims, seed=None, engine='node', growth='walk'):
 
         if seed is not None:
             random.seed(seed)
-            
+
+        # Every tree draws from its own random number generators, so trees never share a
+        # stream and can be grown side by side (e.g. in separate processes)
+
+        self._rng = random.Random(seed if seed is not None else random.getrandbits(64))
+
+        if engine not in ['node', 'flat']:
+            raise ValueError('Invalid engine {}, must be \'node\' or \'flat\''.format(engine))
+
+        if growth not in ['walk', 'fenwick', 'top_down', 'lazy']:
+            raise ValueError(
+                'Invalid growth {}, must be \'walk\', \'fenwick\', \'top_down\' or '
+                '\'lazy\''.format(growth))
+
         self._linear_dims = linear_dims
-        self._root = LeafNode(linear_dims = self._linear_dims)
+        self._engine = engine
+        self._growth = growth
+        if engine == 'node':
+            self._root = LeafNode(linear_dims = self._linear_dims)
+            self._root.leaf_id = 0
+            self._flat = None
+        else:
+            self._root = None
+            self._flat = FlatTree(self._linear_dims)
         self._num_dimensions = len(linear_dims)
 
-        self.points = None
+        # In the node engine every leaf is given an id when it is made, so vectorized
+        # routing can hand back integer arrays. The flat engine just uses its node ids.
+
+        self._leaf_nodes = {0: self._root}
+        self._next_leaf_id = 1
+
+        # Only used with growth='fenwick'. Slot i of the sampler holds the linear dim of the
+        # leaf _leaf_sampler_ids[i], and _leaf_sampler_slots maps leaf ids back to slots.
+
+        self._leaf_sampler = None
+        self._leaf_sampler_ids = []
+        self._leaf_sampler_slots = {}
+
+        # Used with growth='top_down' and 'lazy'. With 'lazy', _pending_leaves maps the id of
+        # every empty leaf that has not been grown yet to the time it was last grown to.
+
+        self._top_down_rng = None
+        self._pending_leaves = {}
+
         self.labels = None
+        self._points_array = np.zeros([0, self._num_dimensions])
+        self._points_list = None
         self._num_points = 0
+
+        # _points_array, labels, labelled_mask and _point_leaf are views of the first
+        # _num_points rows of these storage arrays, which double in size when they fill up,
+        # so adding points is amortized O(1) per point.
+
+        self._points_store = self._points_array
+        self._labels_store = None
+        self._labelled_mask_store = None
+        self._point_leaf_store = None
+
+        # Once there is data, labels is a float array with NaN for the unlabelled points and
+        # labelled_mask marks the labelled ones. The count, sum and sum of squared deviations
+        # of all the labels are kept up to date as labels come in.
+
+        self.labelled_mask = np.zeros(0, dtype=bool)
+        self._label_sum = 0.0
+        self._label_m2 = 0.0
+
+        # Set when the points live in a core.SharedArray (see Mondrian_Forest.input_data), in
+        # which case points and _points_array are both the read only array it maps
+
+        self._shared_points = None
+
+        # The id of the leaf each point is in, kept up to date as leaves split, so finding
+        # the leaf of a point in the tree never needs routing
+
+        self._point_leaf = np.zeros(0, dtype=np.intp)
+        self._point_leaf_store = self._point_leaf
         self._num_labelled = 0
 
+        # Set when the structure, leaf index lists and _point_leaf are shared with a fork,
+        # see fork
+
+        self._structure_shared = False
+        self._node_copies = None
+
         self._life_time = 0
         self._num_leaves = 1
 
@@ -46,8 +150,41 @@ class Mondrian_Tree:
         self._full_leaf_var_list_up_to_date = False
         self._full_leaf_marginal_list_up_to_date = False
 
+        # Leaf sorted layout of the pool indices, aligned with _full_leaf_list. The labelled
+        # points of leaf i are _labelled_layout[_labelled_offsets[i]:][:_labelled_counts[i]],
+        # and the same for the unlabelled points.
+
+        self._labelled_layout = np.zeros(0, dtype=np.intp)
+        self._labelled_offsets = np.zeros(0, dtype=np.intp)
+        self._labelled_counts = np.zeros(0, dtype=np.intp)
+        self._unlabelled_layout = np.zeros(0, dtype=np.intp)
+        self._unlabelled_offsets = np.zeros(0, dtype=np.intp)
+        self._unlabelled_counts = np.zeros(0, dtype=np.intp)
+        self._leaf_layout_up_to_date = False
+
+        # Running statistics of every leaf, indexed by leaf id: the number of points, the
+        # number of labels and the mean and sum of squared deviations of the labels, which
+        # are updated with Welford's method as labels come in.
+
+        self._leaf_num_points = np.zeros(1, dtype=np.intp)
+        self._leaf_num_labelled = np.zeros(1, dtype=np.intp)
+        self._leaf_label_mean = np.zeros(1)
+        self._leaf_label_m2 = np.zeros(1)
+        self._full_leaf_ids = np.zeros(0, dtype=np.intp)
+
         self.prediction_default_value = 0
 
+        # The leaf proportions are kept as unnormalized weights, aligned with _full_leaf_list,
+        # and their sum. Leaves whose data has changed since the weights were calculated are
+        # in _al_dirty_leaves, so only those need recalculating.
+
+        self._al_leaf_weights = None
+        self._al_leaf_vars = None
+        self._al_normalizer = 0
+        self._al_num_nonzero_var = 0
+        self._al_default_var_used = None
+        self._al_num_points_used = 0
+        self._al_dirty_leaves = set()
         self._al_proportions = []
         self._al_proportions_up_to_date = False
         self.al_default_var = 0
@@ -57,6 +194,21 @@ class Mondrian_Tree:
 
         self._verbose = False # useful for debugging or seeing how things work
 
+    @property
+    def _al_proportions(self):
+        if self._al_proportions_list is None:
+            self._al_proportions_list = (self._al_leaf_weights / self._al_normalizer).tolist()
+        return self._al_proportions_list
+
+    @_al_proportions.setter
+    def _al_proportions(self, al_proportions):
+        '''Setting the proportions directly means the weights have to be recalculated from
+        scratch the next time al_calculate_leaf_proportions is called.
+        '''
+
+        self._al_proportions_list = al_proportions
+        self._al_leaf_weights = None
+
     def __str__(self):
         # Add more as needed
         return (
@@ -69,6 +221,207 @@ class Mondrian_Tree:
             self._num_dimensions, self._num_leaves, self._life_time, self._num_points, 
             self._num_labelled))
 
+    def __getstate__(self):
+        '''Points held in a SharedArray are pickled by handle rather than by value.'''
+
+        state = self.__dict__.copy()
+        state['_points_list'] = None
+        if self._shared_points is not None:
+            state['_points_array'] = None
+            state['_points_store'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._shared_points is not None:
+            self._points_store = self._shared_points.array
+            self._points_array = self._points_store
+
+    @property
+    def points(self):
+        '''The points as a list of lists. The tree itself only uses _points_array, so the
+        list is only made the first time it is asked for.
+        '''
+
+        if self._points_list is None and self.labels is not None:
+            self._points_list = self._points_array.tolist()
+        return self._points_list
+
+    def fork(self):
+        '''Returns a copy of the tree to carry on with separately (e.g. to compare labelling
+        strategies from the same starting point) without deep copying it. The fork shares
+        the split structure, the leaf index lists and the point and label arrays with this
+        tree, and only its leaf statistics and caches are copied. Whichever tree first labels
+        points, adds data or grows takes its own copy of the shared parts at that point.
+        '''
+
+        self._share_data()
+        forked = copy.copy(self)
+        forked._points_list = None
+        for name, value in list(forked.__dict__.items()):
+            if name in _SHARED_ATTRIBUTES:
+                continue
+            if isinstance(value, np.ndarray):
+                setattr(forked, name, value.copy())
+            elif isinstance(value, (list, dict, set)):
+                setattr(forked, name, copy.copy(value))
+        forked._rng = copy.copy(self._rng)
+        forked._top_down_rng = copy.deepcopy(self._top_down_rng)
+        return forked
+
+    def truncate(self, life_time):
+        '''Returns a fork of the tree pruned back to a smaller life time (see fork and
+        update_life_time). Grow once to the largest life time wanted, and the tree, its leaf
+        statistics and active learning allocations at any smaller one come from truncate
+        without growing again.
+        '''
+
+        if life_time > self._life_time:
+            raise ValueError('Life time {} is larger than the life time of the tree {}'.format(
+                life_time, self._life_time))
+
+        truncated = self.fork()
+        truncated.update_life_time(life_time)
+        return truncated
+
+    def _share_data(self):
+        '''Marks the structure and the data as shared with a fork. The storage arrays are
+        made read only, so utils.append_rows moves them to new arrays when points are added
+        and _own_labels copies them before labels are written.
+        '''
+
+        self._structure_shared = True
+        self._node_copies = None
+        if self.labels is None:
+            return
+
+        for name in ['_points_store', '_labels_store', '_labelled_mask_store', 
+            '_point_leaf_store']:
+            getattr(self, name).flags.writeable = False
+        self._points_array = self._points_store[:self._num_points]
+        self.labels = self._labels_store[:self._num_points]
+        self.labelled_mask = self._labelled_mask_store[:self._num_points]
+        self._point_leaf = self._point_leaf_store[:self._num_points]
+
+    def _own_labels(self):
+        '''Copies the label arrays if they are shared with a fork, before writing to them.'''
+
+        if self._labels_store is None or self._labels_store.flags.writeable:
+            return
+
+        self._labels_store = self.labels.copy()
+        self._labelled_mask_store = self.labelled_mask.copy()
+        self.labels = self._labels_store
+        self.labelled_mask = self._labelled_mask_store
+
+    def _own_leaves(self, leaf_ids):
+        '''Gives the tree its own index lists for the given leaves if the structure is shared
+        with a fork, before points are moved into or between them. In the node engine each
+        leaf is copied together with its path up to the root, and the rest of the tree stays
+        shared. In the flat engine only the leaves' index lists are copied.
+        '''
+
+        if not self._structure_shared:
+            return
+
+        if self._engine == 'flat':
+            if self._node_copies is None:
+                self._flat = copy.copy(self._flat)
+                self._flat.labelled_index = list(self._flat.labelled_index)
+                self._flat.unlabelled_index = list(self._flat.unlabelled_index)
+                self._full_leaf_list = [self._flat.leaf(leaf.leaf_id) 
+                    for leaf in self._full_leaf_list]
+                self._node_copies = {}
+            for leaf_id in leaf_ids:
+                if leaf_id not in self._node_copies:
+                    self._node_copies[leaf_id] = None
+                    for index_lists in [self._flat.labelled_index, self._flat.unlabelled_index]:
+                        index_lists[leaf_id] = list(index_lists[leaf_id])
+            return
+
+        # _node_copies maps the id of every shared node this tree has copied, and of every
+        # copy, to a (node, copy) pair. The pair holds the old node, so its id is not reused.
+
+        if self._node_copies is None:
+            self._node_copies = {}
+        copies = self._node_copies
+        for leaf_id in leaf_ids:
+            node = self._leaf_nodes[leaf_id]
+            if id(node) in copies:
+                continue
+
+            old_child = None
+            new_child = None
+            while node is not None and id(node) not in copies:
+                new_node = _copy_node(node)
+                copies[id(node)] = (node, new_node)
+                copies[id(new_node)] = (new_node, new_node)
+                if new_child is None:
+                    new_node.labelled_index = list(node.labelled_index)
+                    new_node.unlabelled_index = list(node.unlabelled_index)
+                    self._leaf_nodes[leaf_id] = new_node
+                    pos = node.full_leaf_list_pos
+                    if (pos is not None and pos < len(self._full_leaf_list) and 
+                        self._full_leaf_list[pos] is node):
+                        self._full_leaf_list[pos] = new_node
+                else:
+                    _replace_child(new_node, old_child, new_child)
+                    new_child.parent_node = new_node
+                old_child = node
+                new_child = new_node
+                node = node.parent_node
+
+            if node is None:
+                self._root = new_child
+            else:
+                parent = copies[id(node)][1]
+                _replace_child(parent, old_child, new_child)
+                new_child.parent_node = parent
+
+    def _own_structure(self):
+        '''Copies the split structure, the leaf index lists and the leaf of each point if
+        they are shared with a fork, before the tree grows or is refilled. Cell bounds are
+        never changed in place, so the copied nodes keep sharing them.
+        '''
+
+        if not self._structure_shared:
+            return
+        self._structure_shared = False
+        self._node_copies = None
+
+        if self._engine == 'flat':
+            self._flat = self._flat.copy()
+        else:
+
+            # Parents are taken from the walk down, as the parent pointers of shared nodes
+            # below a copied path still point at the nodes the path was copied from
+
+            self._leaf_nodes = {}
+            stack = [(self._root, None)]
+            with utils.paused_gc():
+                while stack:
+                    node, new_parent = stack.pop()
+                    new_node = _copy_node(node)
+                    new_node.parent_node = new_parent
+                    if new_parent is None:
+                        self._root = new_node
+                    elif new_parent.left_child is node:
+                        new_parent.left_child = new_node
+                    else:
+                        new_parent.right_child = new_node
+
+                    if node.is_leaf():
+                        new_node.labelled_index = list(node.labelled_index)
+                        new_node.unlabelled_index = list(node.unlabelled_index)
+                        self._leaf_nodes[node.leaf_id] = new_node
+                    else:
+                        stack.extend([(node.right_child, new_node), (node.left_child, new_node)])
+
+        self._full_leaf_list = [self._leaf(leaf.leaf_id) for leaf in self._full_leaf_list]
+        self._leaf_sampler = copy.deepcopy(self._leaf_sampler)
+        self._point_leaf_store = self._point_leaf.copy()
+        self._point_leaf = self._point_leaf_store
+
     def _test_point(self, new_point):
         '''Tests an input point, raising errors if it's a bad type and converting it from
         a numpy array to a list if needed 
@@ -108,15 +461,13 @@ class Mondrian_Tree:
         '''Function for updating the tree with a new life time parameter, potentially 
         growing the tree. Grows until the next split would occur after the new life
         time, moving any data within the tree into the new leaves.
+
+        A smaller life time prunes the tree back instead, see _prune.
         '''
 
         new_life_time = copy.copy(new_life_time)
 
-        if new_life_time < self._life_time:
-            raise ValueError('The new life time {} must be larger than the old one {}.\
-                This implementation does not support pruning of trees'.format(
-                new_life_time, self._life_time))
-
+        self._own_structure()
         old_life_time = self._life_time
         self._life_time = new_life_time
 
@@ -127,180 +478,774 @@ class Mondrian_Tree:
         self._full_leaf_mean_list_up_to_date = False
         self._full_leaf_var_list_up_to_date = False
         self._full_leaf_marginal_list_up_to_date = False
+        self._leaf_layout_up_to_date = False
+        self._al_leaf_weights = None
         self._active_learning_proportions_up_to_date = False
 
-        # We add new splits until the next split is after the new life time
-
         if set_seed is not None:
-            random.seed(set_seed)
-
-        next_split_time = old_life_time + random.expovariate(self._root.subtree_linear_dim)
-        while next_split_time < self._life_time:
-
-            # We need to pick which leaf to split. We move down the tree, moving left or 
-            # right proportional to the linear_dim of all leaves in that subtree 
-            # which is the subtree_linear_dim parameter of each node.
+            self._rng = random.Random(set_seed)
 
-            self._num_leaves += 1
-
-            curr_node = self._root
-            while not curr_node.is_leaf():
+        if self._growth in ['top_down', 'lazy'] and (
+            set_seed is not None or self._top_down_rng is None):
+            self._top_down_rng = np.random.default_rng(
+                set_seed if set_seed is not None else self._rng.getrandbits(64))
 
-                left_prob = curr_node.left_child.subtree_linear_dim
-                right_prob = curr_node.right_child.subtree_linear_dim
+        if new_life_time < old_life_time:
+            self._prune(new_life_time)
+            return
 
-                left_prob = left_prob / (left_prob + right_prob)
-                right_prob = right_prob / (left_prob + right_prob)
+        if self._growth in ['top_down', 'lazy']:
+            leaf_ids = [leaf.leaf_id for leaf in self._leaves()]
+            start_times = [self._pending_leaves.pop(leaf_id, old_life_time) for leaf_id in leaf_ids]
+            self._grow_top_down(leaf_ids, start_times)
+            return
 
-                rand_split_val = random.random()
+        # We add new splits until the next split is after the new life time. Seeding the
+        # tree's own Random gives the same stream random.seed(set_seed) used to.
 
-                if self._verbose:
-                    print(
-                        'Probability of going left is {}\n\
-                        Probability of going right is {}\n\
-                        Random value is {}').format(left_prob, right_prob, rand_split_val)
+        rng = self._rng
+        next_split_time = old_life_time + rng.expovariate(self._total_linear_dim())
+        while next_split_time < self._life_time:
 
-                if rand_split_val < left_prob:
-                    curr_node = curr_node.left_child
-                    if self._verbose:
-                        print('Going left')
+            self._num_leaves += 1
 
-                else:
-                    curr_node = curr_node.right_child
-                    if self._verbose:
-                        print('Going right')
+            curr_node = self._pick_leaf_to_split()
 
             # Now that we're at the leaf we are going to split, we need to split this leaf.
             # We pick the dimension to split on proportional to it's length, and then pick
             # a split point uniformly on that dimension
 
+            linear_dims = curr_node.linear_dims
             dimension_probs = []
-            for pair in curr_node.linear_dims:
+            for pair in linear_dims:
                 dimension_probs.append(abs(pair[1] - pair[0])/curr_node.subtree_linear_dim)
 
-            split_dim = utils.choices(range(self._num_dimensions), weights=dimension_probs)[0]
-            split_interval = curr_node.linear_dims[split_dim]
-            split_val = random.uniform(split_interval[0], split_interval[1])
+            split_dim = utils.choices(range(self._num_dimensions), weights=dimension_probs,
+                rng=rng)[0]
+            split_interval = linear_dims[split_dim]
+            split_val = rng.uniform(split_interval[0], split_interval[1])
+
+            self._split_leaf(curr_node, split_dim, split_val, next_split_time)
+
+            next_split_time = next_split_time + rng.expovariate(self._total_linear_dim())
+
+    def _grow_top_down(self, leaf_ids, start_times):
+        '''Grows the given leaves breadth first. By the memoryless property of the exponential
+        distribution, each leaf starting from its start time (and each new leaf from the
+        time it was made) splits after an independent Exp(linear dim) time. For the whole
+        frontier of leaves at once we draw split times, pick split dimensions proportional
+        to side length and split values uniformly; leaves whose split time is after the
+        life time stop, the rest are split and their children become the next frontier.
+
+        With growth='lazy' leaves without data are taken off the frontier and left pending.
+        '''
+
+        rng = self._top_down_rng
+        start_times = np.array(start_times, dtype=float)
+        if self._engine == 'flat':
+            frontier = np.array(leaf_ids, dtype=np.intp)
+            lower = self._flat.lower[frontier]
+            upper = self._flat.upper[frontier]
+        else:
+            frontier = [self._leaf_nodes[leaf_id] for leaf_id in leaf_ids]
+            bounds = np.array([leaf.linear_dims for leaf in frontier], dtype=float)
+            bounds = bounds.reshape(len(frontier), self._num_dimensions, 2)
+            lower = bounds[:, :, 0]
+            upper = bounds[:, :, 1]
+
+        while len(frontier) != 0:
+
+            if self._growth == 'lazy':
+                leaves = [self._leaf(leaf_id) for leaf_id in frontier.tolist()] \
+                    if self._engine == 'flat' else frontier
+                has_data = np.array([
+                    len(leaf.labelled_index) + len(leaf.unlabelled_index) != 0 for leaf in leaves],
+                    dtype=bool)
+                for leaf, start_time in zip(leaves, start_times.tolist()):
+                    if len(leaf.labelled_index) + len(leaf.unlabelled_index) == 0:
+                        self._pending_leaves[leaf.leaf_id] = start_time
+                frontier, lower, upper, start_times = self._filter_frontier(
+                    has_data, frontier, lower, upper, start_times)
+                if len(frontier) == 0:
+                    break
+
+            widths = upper - lower
+            rates = np.abs(widths).sum(axis=1)
+            with np.errstate(divide='ignore'):
+                split_times = start_times + rng.standard_exponential(len(frontier)) / rates
+
+            splits = split_times < self._life_time
+            num_split = int(splits.sum())
+            if num_split == 0:
+                break
+
+            frontier, lower, upper, widths, rates, split_times = self._filter_frontier(
+                splits, frontier, lower, upper, widths, rates, split_times)
+
+            cum_widths = np.abs(widths).cumsum(axis=1)
+            targets = rng.random(num_split) * rates
+            split_dims = np.minimum((cum_widths <= targets[:, None]).sum(axis=1), 
+                self._num_dimensions - 1)
+            rows = np.arange(num_split)
+            split_vals = lower[rows, split_dims] + rng.random(num_split) * widths[rows, split_dims]
+
+            self._num_leaves += num_split
+
+            if self._engine == 'flat':
+                left, right = self._split_flat_leaves(frontier, split_dims, split_vals, split_times)
+                frontier = np.concatenate([left, right])
+                lower = self._flat.lower[frontier]
+                upper = self._flat.upper[frontier]
+                start_times = np.concatenate([split_times, split_times])
+
+            else:
+                new_left_nodes = []
+                new_right_nodes = []
+                for i, leaf in enumerate(frontier):
+                    new_left_node, new_right_node = self._split_leaf(
+                        leaf, int(split_dims[i]), float(split_vals[i]), float(split_times[i]))
+                    new_left_nodes.append(new_left_node)
+                    new_right_nodes.append(new_right_node)
+
+                # Same frontier order as the flat engine: every left child, then every right
+
+                left_upper = upper.copy()
+                left_upper[rows, split_dims] = split_vals
+                right_lower = lower.copy()
+                right_lower[rows, split_dims] = split_vals
+                lower = np.concatenate([lower, right_lower])
+                upper = np.concatenate([left_upper, upper])
+                frontier = new_left_nodes + new_right_nodes
+                start_times = np.concatenate([split_times, split_times])
+
+    def _filter_frontier(self, keep, frontier, *arrays):
+        '''Keeps the entries of a growth frontier (an id array in the flat engine, a list of
+        leaves in the node engine) and of its aligned arrays where keep is True.
+        '''
+
+        if self._engine == 'flat':
+            frontier = frontier[keep]
+        else:
+            frontier = [leaf for leaf, kept in zip(frontier, keep) if kept]
+        return (frontier,) + tuple(arr[keep] for arr in arrays)
+
+    def _split_flat_leaves(self, frontier, split_dims, split_vals, split_times):
+        '''Splits a whole frontier of flat engine leaves at once, then moves their data down
+        one level with a single mask per index list. Returns the new left and right ids.
+        '''
+
+        moved = []
+        for list_name in ['labelled_index', 'unlabelled_index']:
+            leaf_lists = getattr(self._flat, list_name)
+            index_list = []
+            parent_list = []
+            for leaf_id in frontier.tolist():
+                index_list.extend(leaf_lists[leaf_id])
+                parent_list.extend([leaf_id] * len(leaf_lists[leaf_id]))
+                leaf_lists[leaf_id] = []
+            moved.append((leaf_lists, index_list, parent_list))
+
+        left, right = self._flat.split_leaves(frontier, split_dims, split_vals, split_times)
+        self._reserve_leaf_stats()
+
+        filled_leaf_ids = []
+        for leaf_lists, index_list, parent_list in moved:
+            if len(index_list) == 0:
+                continue
+            parents = np.array(parent_list, dtype=np.intp)
+            goes_left = (self._points_array[index_list, self._flat.split_dim[parents]] < 
+                self._flat.split_val[parents])
+            leaf_ids = np.where(goes_left, self._flat.left_child[parents], 
+                self._flat.right_child[parents])
+            self._point_leaf[index_list] = leaf_ids
+            for leaf_id, group in self._leaf_groups(index_list, leaf_ids):
+                leaf_lists[leaf_id].extend(group)
+                filled_leaf_ids.append(leaf_id)
+
+        if len(filled_leaf_ids) != 0:
+            self._compute_leaf_stats(list(dict.fromkeys(filled_leaf_ids)))
+
+        return left, right
+
+    def _grow_pending(self, leaf_ids):
+        '''With growth='lazy', grows any of the given leaves which were left pending because
+        they were empty, now that data has been put in them.
+        '''
+
+        leaf_ids = [leaf_id for leaf_id in leaf_ids if leaf_id in self._pending_leaves]
+        if len(leaf_ids) == 0:
+            return
+
+        self._own_structure()
+        old_num_leaves = self._num_leaves
+        start_times = [self._pending_leaves.pop(leaf_id) for leaf_id in leaf_ids]
+        self._grow_top_down(leaf_ids, start_times)
+
+        if self._num_leaves != old_num_leaves:
+            self._full_leaf_list = []
+            self._full_leaf_list_up_to_date = False
+            self._full_leaf_mean_list_up_to_date = False
+            self._full_leaf_var_list_up_to_date = False
+            self._full_leaf_marginal_list_up_to_date = False
+            self._leaf_layout_up_to_date = False
+            self._al_leaf_weights = None
+            self._al_proportions_up_to_date = False
+
+    def _prune(self, life_time):
+        '''Cuts the tree back to a smaller life time. Every node split at or after life_time
+        is taken out, and the highest such node on each path becomes a leaf holding all of
+        the data below it (with the id it had before it was split). A Mondrian tree stopped
+        at a smaller life time is a pruning of the same tree grown further, so this gives
+        the tree that would have been grown to life_time; with growth='walk' or 'fenwick'
+        and the same seed it is exactly that tree.
+        '''
+
+        # Find the highest nodes split at or after the life time, with their cells
+
+        collapse = []
+        if self._engine == 'flat':
+            flat = self._flat
+            stack = [0]
+            while stack:
+                node = stack.pop()
+                if flat.left_child[node] < 0:
+                    continue
+                if flat.split_time[node] >= life_time:
+                    collapse.append((node, None))
+                else:
+                    stack.extend([int(flat.right_child[node]), int(flat.left_child[node])])
+        else:
+            stack = [(self._root, self._linear_dims)]
+            while stack:
+                node, linear_dims = stack.pop()
+                if node.is_leaf():
+                    continue
+                if node.split_time >= life_time:
+                    collapse.append((node, linear_dims))
+                    continue
+                left_linear_dims = [list(pair) for pair in linear_dims]
+                left_linear_dims[node.split_dim][1] = node.split_val
+                right_linear_dims = [list(pair) for pair in linear_dims]
+                right_linear_dims[node.split_dim][0] = node.split_val
+                stack.extend([(node.right_child, right_linear_dims),
+                    (node.left_child, left_linear_dims)])
+
+        filled_leaf_ids = []
+        for node, linear_dims in collapse:
+            if self._engine == 'flat':
+                leaves = [flat.leaf(leaf_id) for leaf_id in flat.leaves(node)]
+            else:
+                leaves = self._subtree_leaves(node)
+
+            labelled_index = sorted(itertools.chain.from_iterable(
+                leaf.labelled_index for leaf in leaves))
+            unlabelled_index = sorted(itertools.chain.from_iterable(
+                leaf.unlabelled_index for leaf in leaves))
+            for leaf in leaves:
+                self._pending_leaves.pop(leaf.leaf_id, None)
+                leaf.labelled_index = []
+                leaf.unlabelled_index = []
+            self._num_leaves -= len(leaves) - 1
+
+            if self._engine == 'flat':
+                new_leaf = self._collapse_flat_node(node)
+            else:
+                new_leaf = self._collapse_split_node(node, linear_dims, leaves)
+            new_leaf.labelled_index = labelled_index
+            new_leaf.unlabelled_index = unlabelled_index
+
+            if len(labelled_index) + len(unlabelled_index) != 0:
+                self._point_leaf[labelled_index + unlabelled_index] = new_leaf.leaf_id
+                filled_leaf_ids.append(new_leaf.leaf_id)
+            elif self._growth == 'lazy':
+                self._pending_leaves[new_leaf.leaf_id] = life_time
+            self._compute_leaf_stats([new_leaf.leaf_id])
+
+        # Empty leaves left pending have not been grown past the new life time
+
+        for leaf_id, start_time in self._pending_leaves.items():
+            self._pending_leaves[leaf_id] = min(start_time, life_time)
+        self._leaf_sampler = None
+
+    def _collapse_flat_node(self, node):
+        '''Turns a split node of the flat engine back into a leaf. The nodes below it are
+        left in the arrays, but can no longer be reached.
+        '''
+
+        flat = self._flat
+        flat.left_child[node] = -1
+        flat.right_child[node] = -1
+        flat.split_dim[node] = -1
+        flat.split_val[node] = 0
+        flat.split_time[node] = np.inf
+        change = flat._cell_linear_dim(node) - flat.subtree_linear_dim[node]
+        flat.subtree_linear_dim[node] += change
+        if self._growth == 'walk':
+            curr_node = flat.parent_node[node]
+            while curr_node >= 0:
+                flat.subtree_linear_dim[curr_node] += change
+                curr_node = flat.parent_node[curr_node]
+        return flat.leaf(node)
+
+    def _collapse_split_node(self, split_node, linear_dims, leaves):
+        '''Replaces a split node of the node engine, whose cell is linear_dims and whose
+        leaves are given, with a single leaf. Returns the new leaf.
+        '''
+
+        new_leaf = LeafNode(linear_dims = linear_dims, parent_node = split_node.parent_node,
+            parent_branch = split_node.parent_branch)
+        new_leaf.leaf_id = split_node.node_id
+        for leaf in leaves:
+            del self._leaf_nodes[leaf.leaf_id]
+        self._leaf_nodes[new_leaf.leaf_id] = new_leaf
 
-            left_linear_dims = copy.deepcopy(curr_node.linear_dims)
-            left_linear_dims[split_dim] = [split_interval[0],split_val]
-            right_linear_dims = copy.deepcopy(curr_node.linear_dims)
-            right_linear_dims[split_dim] = [split_val,split_interval[1]]
+        if split_node.parent_node is None:
+            self._root = new_leaf
+        else:
+            _replace_child(split_node.parent_node, split_node, new_leaf)
+            if self._growth == 'walk':
+                split_node.parent_node.percolate_subtree_linear_dim_change(
+                    new_leaf.subtree_linear_dim - split_node.subtree_linear_dim)
+        return new_leaf
+
+    def _subtree_leaves(self, node):
+        '''Every leaf below a node of the node engine, left to right.'''
+
+        leaves = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.is_leaf():
+                leaves.append(node)
+            else:
+                stack.append(node.right_child)
+                stack.append(node.left_child)
+        return leaves
+
+    def _total_linear_dim(self):
+        if self._growth == 'fenwick':
+            if self._leaf_sampler is None:
+                self._make_leaf_sampler()
+            return self._leaf_sampler.total()
+        if self._engine == 'flat':
+            return float(self._flat.subtree_linear_dim[0])
+        return self._root.subtree_linear_dim
+
+    def _pick_leaf_to_split(self):
+        '''Picks which leaf to split. We move down the tree, moving left or right
+        proportional to the linear_dim of all leaves in that subtree which is the
+        subtree_linear_dim parameter of each node.
+
+        With growth='fenwick' the same distribution over leaves is sampled with a single
+        prefix sum search over the leaf linear dims.
+        '''
 
-            # Build the new split and leaf nodes
+        if self._growth == 'fenwick':
+            slot = self._leaf_sampler.sample(self._rng)
+            return self._leaf(self._leaf_sampler_ids[slot])
 
-            new_left_node = LeafNode(linear_dims = left_linear_dims, parent_branch = 0)
-            new_right_node = LeafNode(linear_dims = right_linear_dims, parent_branch = 1)
-            new_split_node = SplitNode(
-                split_dim = split_dim,
-                split_val = split_val,
-                left_child = new_left_node,
-                right_child = new_right_node,
-                parent_node = curr_node.parent_node,
-                parent_branch = curr_node.parent_branch,
-                subtree_linear_dim = curr_node.subtree_linear_dim) # We will update subtree_lin_dim with percolate
+        if self._engine == 'flat':
+            flat = self._flat
+            curr_node = 0
+            while flat.left_child[curr_node] >= 0:
 
-            new_split_node.left_child.parent_node = new_split_node
-            new_split_node.right_child.parent_node = new_split_node
+                left_prob = flat.subtree_linear_dim[flat.left_child[curr_node]]
+                right_prob = flat.subtree_linear_dim[flat.right_child[curr_node]]
 
-            # Putting the new nodes into the tree
+                left_prob = left_prob / (left_prob + right_prob)
 
-            if curr_node.parent_node is not None:
-                if curr_node.parent_branch == 0:
-                    curr_node.parent_node.left_child = new_split_node
+                if self._rng.random() < left_prob:
+                    curr_node = flat.left_child[curr_node]
                 else:
-                    curr_node.parent_node.right_child = new_split_node
+                    curr_node = flat.right_child[curr_node]
+
+            return flat.leaf(curr_node)
+
+        curr_node = self._root
+        while not curr_node.is_leaf():
+
+            left_prob = curr_node.left_child.subtree_linear_dim
+            right_prob = curr_node.right_child.subtree_linear_dim
+
+            left_prob = left_prob / (left_prob + right_prob)
+            right_prob = right_prob / (left_prob + right_prob)
+
+            rand_split_val = self._rng.random()
+
+            if self._verbose:
+                print(
+                    'Probability of going left is {}\n\
+                    Probability of going right is {}\n\
+                    Random value is {}').format(left_prob, right_prob, rand_split_val)
+
+            if rand_split_val < left_prob:
+                curr_node = curr_node.left_child
+                if self._verbose:
+                    print('Going left')
 
             else:
-                self._root = new_split_node
+                curr_node = curr_node.right_child
+                if self._verbose:
+                    print('Going right')
+
+        return curr_node
+
+    def _split_leaf(self, curr_node, split_dim, split_val, split_time):
+        '''Replaces the leaf curr_node with a split on split_dim at split_val and two new
+        leaves, moving any data in the leaf into the new leaves. Returns the new left and
+        right leaves.
+        '''
+
+        if self._engine == 'flat':
+            left, right = self._flat.split_leaf(curr_node.leaf_id, split_dim, split_val, split_time,
+                percolate = self._growth == 'walk')
+            new_left_node = self._flat.leaf(left)
+            new_right_node = self._flat.leaf(right)
+            self._move_leaf_data(curr_node, new_left_node, new_right_node, split_dim, split_val)
+            self._update_leaf_sampler(curr_node, new_left_node, new_right_node)
+            curr_node.labelled_index = []
+            curr_node.unlabelled_index = []
+            return new_left_node, new_right_node
+
+        split_interval = curr_node.linear_dims[split_dim]
+        left_linear_dims = copy.deepcopy(curr_node.linear_dims)
+        left_linear_dims[split_dim] = [split_interval[0],split_val]
+        right_linear_dims = copy.deepcopy(curr_node.linear_dims)
+        right_linear_dims[split_dim] = [split_val,split_interval[1]]
+
+        # Build the new split and leaf nodes
+
+        new_left_node = LeafNode(linear_dims = left_linear_dims, parent_branch = 0)
+        new_right_node = LeafNode(linear_dims = right_linear_dims, parent_branch = 1)
+        for new_node in [new_left_node, new_right_node]:
+            new_node.leaf_id = self._next_leaf_id
+            self._leaf_nodes[new_node.leaf_id] = new_node
+            self._next_leaf_id += 1
+        del self._leaf_nodes[curr_node.leaf_id]
+        new_split_node = SplitNode(
+            split_dim = split_dim,
+            split_val = split_val,
+            left_child = new_left_node,
+            right_child = new_right_node,
+            parent_node = curr_node.parent_node,
+            parent_branch = curr_node.parent_branch,
+            subtree_linear_dim = curr_node.subtree_linear_dim, # We will update subtree_lin_dim with percolate
+            split_time = split_time)
+        new_split_node.node_id = curr_node.leaf_id
+
+        new_split_node.left_child.parent_node = new_split_node
+        new_split_node.right_child.parent_node = new_split_node
+
+        # Putting the new nodes into the tree
+
+        if curr_node.parent_node is not None:
+            if curr_node.parent_branch == 0:
+                curr_node.parent_node.left_child = new_split_node
+            else:
+                curr_node.parent_node.right_child = new_split_node
+
+        else:
+            self._root = new_split_node
 
-            # Percolating up the change in subtree_lin_dim
+        # Percolating up the change in subtree_lin_dim
 
+        if self._growth == 'walk':
             subtree_lin_dim_change = (
                 new_left_node.subtree_linear_dim + 
                 new_right_node.subtree_linear_dim -
                 curr_node.subtree_linear_dim)
 
             new_split_node.percolate_subtree_linear_dim_change(subtree_lin_dim_change)
+        self._update_leaf_sampler(curr_node, new_left_node, new_right_node)
 
-            # moving data points into the new leaves
+        # moving data points into the new leaves
 
-            for ind in curr_node.labelled_index:
-                # print(curr_node.labelled_index)
-                new_split_node.leaf_for_point(self.points[ind]).extend_labelled_index([ind])
+        self._move_leaf_data(curr_node, new_left_node, new_right_node, split_dim, split_val)
 
-            for ind in curr_node.unlabelled_index:
-                new_split_node.leaf_for_point(self.points[ind]).extend_unlabelled_index([ind])
+        return new_left_node, new_right_node
 
-            next_split_time = next_split_time + random.expovariate(self._root.subtree_linear_dim)
+    def _make_leaf_sampler(self):
+        '''Builds the Fenwick tree over the linear dims of the current leaves.'''
 
-    def input_data(self, all_data, labelled_indices, labels, copy_data=True):
-        '''Puts in data for Mondrian Tree. 
-        all_data should be a list of lists (or numpy array, points by row) with all data points, 
-        labelled_indices should be a list of the indicies for data points which we have the
-        labels for, and labels should be an equal length list of those points labels.
+        leaves = self._leaves()
+        self._leaf_sampler_ids = [leaf.leaf_id for leaf in leaves]
+        self._leaf_sampler_slots = {leaf_id: i for i, leaf_id in enumerate(self._leaf_sampler_ids)}
+        self._leaf_sampler = FenwickTree([leaf.subtree_linear_dim for leaf in leaves])
 
-        Should work with inputting things as numpy arrays, but this is the only place you can 
-        safely use numpy arrays. 
+    def _update_leaf_sampler(self, curr_node, left_node, right_node):
+        '''After a split the left child takes over the slot of the old leaf and the right
+        child gets a new slot, so updating the sampler is two O(log L) writes.
         '''
 
-        if copy_data:
-            all_data = copy.deepcopy(all_data)
-            labelled_indices = copy.deepcopy(labelled_indices)
-            labels = copy.deepcopy(labels)
+        if self._leaf_sampler is None:
+            return
 
-        if len(all_data) < len(labelled_indices):
-            raise ValueError('Cannot have more labelled indicies than points')
+        slot = self._leaf_sampler_slots.pop(curr_node.leaf_id)
+        self._leaf_sampler.set(slot, left_node.subtree_linear_dim)
+        self._leaf_sampler_ids[slot] = left_node.leaf_id
+        self._leaf_sampler_slots[left_node.leaf_id] = slot
 
-        if len(labelled_indices) != len(labels):
-            raise ValueError('Labelled indicies list and labels list must be same length')
+        slot = self._leaf_sampler.append(right_node.subtree_linear_dim)
+        self._leaf_sampler_ids.append(right_node.leaf_id)
+        self._leaf_sampler_slots[right_node.leaf_id] = slot
 
-        for point in all_data:
-            if len(point) != self._num_dimensions:
-                raise ValueError('All data points must be of the dimension on which this \
-                    Mondrian Tree is built ({})'.format(self._num_dimensions))
+    def _move_leaf_data(self, curr_node, left_node, right_node, split_dim, split_val):
+        '''Moves the data of a leaf that has just been split into its two new leaves, with
+        one boolean mask over the leaf's points rather than routing them one by one.
+        '''
 
-        if str(type(all_data)) == "<class 'numpy.ndarray'>":
-            if self._verbose:
-                print('Converting all_data to list of lists internally')
-            all_data = all_data.tolist()
+        self._reserve_leaf_stats()
+        if len(curr_node.labelled_index) + len(curr_node.unlabelled_index) == 0:
+            return
+
+        for index_list, left_list, right_list in [
+            (curr_node.labelled_index, left_node.labelled_index, right_node.labelled_index),
+            (curr_node.unlabelled_index, left_node.unlabelled_index, right_node.unlabelled_index)]:
+            if len(index_list) == 0:
+                continue
+            index_array = np.array(index_list)
+            goes_left = self._points_array[index_array, split_dim] < split_val
+            left_list.extend(index_array[goes_left].tolist())
+            right_list.extend(index_array[~goes_left].tolist())
+            self._point_leaf[index_array[goes_left]] = left_node.leaf_id
+            self._point_leaf[index_array[~goes_left]] = right_node.leaf_id
+
+        self._compute_leaf_stats([left_node.leaf_id, right_node.leaf_id])
+
+    def _reserve_leaf_stats(self):
+        '''Makes sure the running leaf statistics have room for every leaf id, doubling the
+        arrays when they run out so growing the tree stays amortized O(1) per leaf.
+        '''
 
-        if str(type(labelled_indices)) == "<class 'numpy.ndarray'>":
-            if self._verbose:
-                print('Converting labelled_indices to list internally')
-            labelled_indices = labelled_indices.tolist()
+        num_ids = self._flat.num_nodes if self._engine == 'flat' else self._next_leaf_id
+        old_size = len(self._leaf_num_points)
+        if num_ids <= old_size:
+            return
+
+        new_size = max(num_ids, 2 * old_size)
+        for name in ['_leaf_num_points', '_leaf_num_labelled', '_leaf_label_mean', 
+            '_leaf_label_m2']:
+            arr = getattr(self, name)
+            new_arr = np.zeros(new_size, dtype=arr.dtype)
+            new_arr[:old_size] = arr
+            setattr(self, name, new_arr)
+
+    def _compute_leaf_stats(self, leaf_ids):
+        '''Recalculates the running statistics of the given leaves from the data in them,
+        with the same two pass mean and variance as utils.unbiased_var.
+        '''
 
-        if str(type(labels)) == "<class 'numpy.ndarray'>":
-            if self._verbose:
-                print('Converting labels to list internally')
-            labels = labels.tolist()
+        self._reserve_leaf_stats()
+        leaves = [self._leaf(leaf_id) for leaf_id in leaf_ids]
+        ids = np.array(leaf_ids, dtype=np.intp)
+        counts = np.array([len(leaf.labelled_index) for leaf in leaves], dtype=np.intp)
+        self._leaf_num_points[ids] = counts + np.array(
+            [len(leaf.unlabelled_index) for leaf in leaves], dtype=np.intp)
+
+        labels = self.labels[np.fromiter(itertools.chain.from_iterable(
+            leaf.labelled_index for leaf in leaves), dtype=np.intp, count=counts.sum())]
+        segments = np.repeat(np.arange(len(leaves)), counts)
+        sums = np.bincount(segments, weights=labels, minlength=len(leaves))
+        means = np.zeros(len(leaves))
+        np.divide(sums, counts, out=means, where=counts != 0)
+
+        self._leaf_num_labelled[ids] = counts
+        self._leaf_label_mean[ids] = means
+        self._leaf_label_m2[ids] = np.bincount(
+            segments, weights=(means[segments] - labels)**2, minlength=len(leaves))
+
+    def _add_leaf_label(self, leaf_id, value):
+        '''Welford update of the running statistics of a leaf for one new label.'''
+
+        num_labelled = self._leaf_num_labelled[leaf_id] + 1
+        delta = value - self._leaf_label_mean[leaf_id]
+        self._leaf_label_mean[leaf_id] += delta / num_labelled
+        self._leaf_label_m2[leaf_id] += delta * (value - self._leaf_label_mean[leaf_id])
+        self._leaf_num_labelled[leaf_id] = num_labelled
+
+    def _add_leaf_labels(self, leaf_ids, values):
+        '''Merges a batch of new labels into the running statistics of their leaves, using
+        the pairwise update of Chan et al. for the means and sums of squared deviations.
+        Returns the ids of the leaves that changed.
+        '''
+
+        unique_ids, segments = np.unique(leaf_ids, return_inverse=True)
+        counts = np.bincount(segments, minlength=len(unique_ids))
+        means = np.bincount(segments, weights=values, minlength=len(unique_ids)) / counts
+        m2 = np.bincount(segments, weights=(values - means[segments])**2, 
+            minlength=len(unique_ids))
+
+        old_counts = self._leaf_num_labelled[unique_ids]
+        new_counts = old_counts + counts
+        delta = means - self._leaf_label_mean[unique_ids]
+        self._leaf_label_mean[unique_ids] += delta * counts / new_counts
+        self._leaf_label_m2[unique_ids] += m2 + delta**2 * old_counts * counts / new_counts
+        self._leaf_num_labelled[unique_ids] = new_counts
+        return unique_ids
+
+    def _compute_global_label_stats(self):
+        '''Recalculates the running count, sum and sum of squared deviations of all the
+        labels. cumsum adds up in order, so these match the Python sums over the labels
+        (in index order) that set_default_pred_global_mean and utils.unbiased_var do.
+        '''
+
+        values = self.labels[self.labelled_mask]
+        self._num_labelled = len(values)
+        self._label_sum = 0.0
+        self._label_m2 = 0.0
+        if len(values) != 0:
+            self._label_sum = float(np.cumsum(values)[-1])
+            mean = self._label_sum / len(values)
+            self._label_m2 = float(np.cumsum((mean - values)**2)[-1])
+
+    def _add_global_label(self, value):
+        '''Welford update of the running count, sum and sum of squared deviations of all the
+        labels for one new label.
+        '''
+
+        old_mean = self._label_sum / self._num_labelled if self._num_labelled != 0 else 0.0
+        self._num_labelled += 1
+        self._label_sum += value
+        self._label_m2 += (value - old_mean) * (value - self._label_sum / self._num_labelled)
+
+    def _add_global_labels(self, values):
+        '''Pairwise update of the running count, sum and sum of squared deviations of all
+        the labels for a non empty batch of new labels.
+        '''
+
+        num_old = self._num_labelled
+        old_mean = self._label_sum / num_old if num_old != 0 else 0.0
+        batch_sum = float(values.sum())
+        batch_mean = batch_sum / len(values)
+        self._num_labelled = num_old + len(values)
+        self._label_sum += batch_sum
+        self._label_m2 += (float(((values - batch_mean)**2).sum()) + 
+            (batch_mean - old_mean)**2 * num_old * len(values) / self._num_labelled)
+
+    def _leaf(self, leaf_id):
+        '''Returns the leaf with the given id (a LeafNode, or a FlatLeaf view in the flat
+        engine).
+        '''
+
+        if self._engine == 'flat':
+            return self._flat.leaf(leaf_id)
+        return self._leaf_nodes[leaf_id]
+
+    def leaf_for_points(self, data_points):
+        '''Vectorized routing. Takes an (n, p) array (or list of lists) of points and returns
+        an integer numpy array with the id of the leaf each point falls into. Points are
+        moved down the tree a level at a time using boolean masks, so the cost is a few
+        numpy operations per node level instead of a Python traversal per point.
+        Use _leaf(leaf_id) to get the leaf itself.
+        '''
+
+        data_points = np.asarray(data_points, dtype=float)
+        if data_points.ndim != 2 or data_points.shape[1] != self._num_dimensions:
+            raise ValueError(
+                'Data points must be an (n, {}) array'.format(self._num_dimensions))
+
+        if self._engine == 'flat':
+            return self._flat.leaf_for_points(data_points)
+
+        leaf_ids = np.zeros(len(data_points), dtype=np.intp)
+        if len(data_points) != 0:
+            self._root.leaf_for_points(data_points, np.arange(len(data_points)), leaf_ids)
+        return leaf_ids
+
+    def _leaf_groups(self, indices, leaf_ids):
+        '''Groups indices by their leaf id, keeping the original order within each group.
+        Returns a list of (leaf_id, list of indices) pairs.
+        '''
 
-        self.points = all_data
-        self._num_points = len(self.points)
-        self._num_labelled = len(labels)
+        indices = np.asarray(indices)
+        order = np.argsort(leaf_ids, kind='stable')
+        sorted_ids = leaf_ids[order]
+        starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+        groups = np.split(indices[order], starts[1:])
+        return [(int(sorted_ids[start]), group.tolist()) for start, group in zip(starts, groups)]
 
-        # Making a label list, with None in places where we don't have the label
+    def _leaves(self):
+        '''Every leaf of the tree, ordered as a depth first search visiting left children
+        first, so both engines list the same tree in the same order.
+        '''
+
+        if self._engine == 'flat':
+            return [self._flat.leaf(node) for node in self._flat.leaves()]
+        return self._subtree_leaves(self._root)
+
+    def _leaf_for_point(self, data_point):
+        '''Returns the leaf (a LeafNode, or a FlatLeaf view in the flat engine) which
+        data_point falls into.
+        '''
+
+        if self._engine == 'flat':
+            return self._flat.leaf(self._flat.leaf_for_point(data_point))
+        return self._root.leaf_for_point(data_point)
 
-        temp = [None] * self._num_points
-        for i,ind in enumerate(labelled_indices):
-            temp[ind] = labels[i]
-        self.labels = temp
-        unlabelled_indices = [x for x in range(self._num_points) if x not in labelled_indices]
+    def input_data(self, all_data, labelled_indices, labels, copy_data=False):
+        '''Puts in data for Mondrian Tree. 
+        all_data should be a list of lists (or numpy array, points by row) with all data points, 
+        labelled_indices should be a list of the indicies for data points which we have the
+        labels for, and labels should be an equal length list of those points labels.
+
+        A float numpy array is used as it is: the tree keeps a read only view of it, so it
+        should not be changed afterwards unless copy_data is True, which makes the tree
+        take its own copy.
+        '''
+
+        points, labelled_array, labels = utils.prepare_data(
+            all_data, labelled_indices, labels, self._num_dimensions, copy_data)
+
+        self._own_structure()
+        self._points_array = points
+        self._points_list = None
+        self._num_points = len(points)
+
+        # Making the label array, with NaN in places where we don't have the label
+
+        self.labels = np.full(self._num_points, np.nan)
+        self.labels[labelled_array] = labels
+        self.labelled_mask = np.zeros(self._num_points, dtype=bool)
+        self.labelled_mask[labelled_array] = True
+        self._points_store = self._points_array
+        self._labels_store = self.labels
+        self._labelled_mask_store = self.labelled_mask
+        self._compute_global_label_stats()
+        labelled_indices = labelled_array.tolist()
+        unlabelled_indices = np.flatnonzero(~self.labelled_mask).tolist()
 
         # Placing each point into the correct leaf
 
-        if self._root.is_leaf():
-            self._root.labelled_index = list(labelled_indices)
-            self._root.unlabelled_index = unlabelled_indices
+        if self._num_leaves == 1:
+            root = self._root if self._engine == 'node' else self._flat.leaf(0)
+            root.labelled_index = list(labelled_indices)
+            root.unlabelled_index = unlabelled_indices
+            self._point_leaf = np.full(self._num_points, root.leaf_id, dtype=np.intp)
+            filled_leaf_ids = [root.leaf_id]
 
         else:
-            for i in labelled_indices:
-                curr_leaf = self._root.leaf_for_point(self.points[i])
-                curr_leaf.labelled_index.append(i)
-
-            for i in unlabelled_indices:
-                curr_leaf = self._root.leaf_for_point(self.points[i])
-                curr_leaf.unlabelled_index.append(i)
+            filled_leaf_ids = []
+            self._point_leaf = self.leaf_for_points(self._points_array)
+            for index_list, list_name in [
+                (labelled_indices, 'labelled_index'), (unlabelled_indices, 'unlabelled_index')]:
+                if len(index_list) == 0:
+                    continue
+                leaf_ids = self._point_leaf[index_list]
+                for leaf_id, group in self._leaf_groups(index_list, leaf_ids):
+                    getattr(self._leaf(leaf_id), list_name).extend(group)
+                    filled_leaf_ids.append(leaf_id)
+        self._point_leaf_store = self._point_leaf
+
+        self._leaf_layout_up_to_date = False
+        self._al_leaf_weights = None
+        self._reserve_leaf_stats()
+        for name in ['_leaf_num_points', '_leaf_num_labelled', '_leaf_label_mean', 
+            '_leaf_label_m2']:
+            getattr(self, name)[:] = 0
+        self._compute_leaf_stats(list(dict.fromkeys(filled_leaf_ids)))
+
+        if self._pending_leaves:
+            self._grow_pending(list(dict.fromkeys(filled_leaf_ids)))
 
     def label_point(self, index, value):
         '''Adds a label to a specific data point. Throws an error if that point
@@ -316,12 +1261,60 @@ class Mondrian_Tree:
         value = copy.copy(value)
         index = copy.copy(index)
 
+        self._own_labels()
+        self._own_leaves([int(self._point_leaf[index])])
         self.labels[index] = value
-        leaf = self._root.leaf_for_point(self.points[index])
+        self.labelled_mask[index] = True
+        leaf = self._leaf(int(self._point_leaf[index]))
         leaf.make_labelled(index)
-        self._num_labelled += 1
+        self._add_leaf_label(leaf.leaf_id, value)
+        self._add_global_label(value)
+        self._al_dirty_leaves.add(leaf.leaf_id)
+        self._full_leaf_mean_list_up_to_date = False
+        self._full_leaf_var_list_up_to_date = False
+        self._leaf_layout_up_to_date = False
+
+    def label_points(self, indices, values):
+        '''Labels a batch of points at once. indices and values are equal length arrays
+        (or lists) of pool indices and their labels. The points are moved to the labelled
+        index lists of their leaves one leaf at a time, and the leaf statistics and caches
+        are updated once for the whole batch. Throws an error if any point is already
+        labelled or appears twice.
+        '''
+
+        if self.labels is None:
+            raise RuntimeError('No data in the tree')
+
+        indices, values = utils.prepare_labels(indices, values, self.labelled_mask)
+        if len(indices) == 0:
+            return
+
+        self._own_labels()
+        self.labels[indices] = values
+        self.labelled_mask[indices] = True
+        self._label_leaf_points(indices, values)
+
+    def _label_leaf_points(self, indices, values):
+        '''Moves a checked batch of newly labelled points into the labelled index lists of
+        their leaves and updates the statistics. The label arrays are left alone, so a
+        forest can fill in its shared arrays once and call this on every tree.
+        '''
+
+        leaf_ids = self._point_leaf[indices]
+        groups = self._leaf_groups(indices, leaf_ids)
+        self._own_leaves([leaf_id for leaf_id, _ in groups])
+        for leaf_id, group in groups:
+            leaf = self._leaf(leaf_id)
+            moved = set(group)
+            leaf.unlabelled_index = [x for x in leaf.unlabelled_index if x not in moved]
+            leaf.extend_labelled_index(group)
+
+        changed_leaf_ids = self._add_leaf_labels(leaf_ids, values)
+        self._add_global_labels(values)
+        self._al_dirty_leaves.update(changed_leaf_ids.tolist())
         self._full_leaf_mean_list_up_to_date = False
         self._full_leaf_var_list_up_to_date = False
+        self._leaf_layout_up_to_date = False
 
     def add_data_point(self, new_point, label = None):
         '''Adds an additional data point to the tree, with the option of adding a label
@@ -330,33 +1323,83 @@ class Mondrian_Tree:
         Does NOT automatically grow the tree larger so you need to do that yourself.
         '''
 
-        new_point = copy.deepcopy(new_point)
-        label = copy.deepcopy(label)
         new_point = self._test_point(new_point)
+        self.add_data_points([new_point], None if label is None else [label])
 
-        if self.points is None:
-            point_index = 0
-            self.points = [new_point]
-            self.labels = [label]
-        else:
-            point_index = len(self.labels)
-            self.points.append(new_point)
-            self.labels.append(label)
-
-        leaf = self._root.leaf_for_point(new_point)
-        if label is None:
-            leaf.unlabelled_index.append(point_index)
-            self._num_points += 1
-        else:
-            leaf.labelled_index.append(point_index)
-            self._num_points += 1
-            self._num_labelled += 1
+    def add_data_points(self, new_points, labels = None):
+        '''Adds a chunk of points to the tree. new_points is a 2 dim array (or list of lists)
+        of points by row, and labels is None if none of them are labelled, or else an equal
+        length array or list of labels with None (or NaN) for the points without one. The
+        points become the next pool indices in order.
 
-        self._full_leaf_marginal_list_up_to_date = False
-        if label is not None:
+        The points are written into growable storage and routed through the tree all at
+        once, and the leaf counts and statistics are updated for the whole chunk.
+
+        Does NOT automatically grow the tree larger so you need to do that yourself.
+        '''
+
+        new_points, labels = utils.prepare_new_points(new_points, labels, self._num_dimensions)
+        if len(new_points) == 0:
+            return
+
+        first_index = self._num_points
+        if self.labels is None:
+            self._labels_store = np.zeros(0)
+            self._labelled_mask_store = np.zeros(0, dtype=bool)
+        self._points_store = utils.append_rows(self._points_store, first_index, new_points)
+        self._labels_store = utils.append_rows(self._labels_store, first_index, labels)
+        self._labelled_mask_store = utils.append_rows(
+            self._labelled_mask_store, first_index, ~np.isnan(labels))
+        num_points = first_index + len(new_points)
+        self._points_array = self._points_store[:num_points]
+        self.labels = self._labels_store[:num_points]
+        self.labelled_mask = self._labelled_mask_store[:num_points]
+        if self._points_list is not None:
+            self._points_list.extend(new_points.tolist())
+
+        # The points array is the tree's own now, even if the old one was shared
+        self._shared_points = None
+
+        self._place_new_points(first_index, new_points, labels)
+
+    def _place_new_points(self, first_index, new_points, labels):
+        '''Routes a chunk of new points, already written to the point and label arrays from
+        first_index on, into their leaves and updates the leaf and label statistics. The point
+        and label arrays are left alone, so a forest can fill in its shared arrays once and
+        call this on every tree.
+        '''
+
+        leaf_ids = self.leaf_for_points(new_points)
+        self._point_leaf_store = utils.append_rows(self._point_leaf_store, first_index, leaf_ids)
+        self._num_points = first_index + len(new_points)
+        self._point_leaf = self._point_leaf_store[:self._num_points]
+
+        indices = np.arange(first_index, self._num_points)
+        self._own_leaves(np.unique(leaf_ids).tolist())
+        has_label = ~np.isnan(labels)
+        for mask, list_name in [(has_label, 'labelled_index'), (~has_label, 'unlabelled_index')]:
+            if not mask.any():
+                continue
+            for leaf_id, group in self._leaf_groups(indices[mask], leaf_ids[mask]):
+                getattr(self._leaf(leaf_id), list_name).extend(group)
+
+        self._reserve_leaf_stats()
+        np.add.at(self._leaf_num_points, leaf_ids, 1)
+        if has_label.any():
+            self._add_leaf_labels(leaf_ids[has_label], labels[has_label])
+            self._add_global_labels(labels[has_label])
             self._full_leaf_mean_list_up_to_date = False
             self._full_leaf_var_list_up_to_date = False
 
+        changed_leaf_ids = np.unique(leaf_ids).tolist()
+        self._al_dirty_leaves.update(changed_leaf_ids)
+        self._full_leaf_marginal_list_up_to_date = False
+        self._leaf_layout_up_to_date = False
+
+        pending = [leaf_id for leaf_id in changed_leaf_ids if leaf_id in self._pending_leaves]
+        if pending:
+            self._grow_pending(pending)
+
     ###########################################
 
     # Leaf list building methods: We want the tree to have a list of nodes as well as
@@ -378,30 +1421,71 @@ class Mondrian_Tree:
                 internal_dfs(node.left_child)
                 internal_dfs(node.right_child)
 
-        internal_dfs(self._root)
+        if self._engine == 'flat':
+            full_leaf_list = [self._flat.leaf(node) for node in self._flat.leaves()]
+        else:
+            internal_dfs(self._root)
         self._full_leaf_list = full_leaf_list
 
         # Ensure each leaf knows where it is in the list
 
         for i, node in enumerate(self._full_leaf_list):
             node.full_leaf_list_pos = i
+        self._full_leaf_ids = np.array(
+            [node.leaf_id for node in self._full_leaf_list], dtype=np.intp)
+        num_ids = self._flat.num_nodes if self._engine == 'flat' else self._next_leaf_id
+        self._full_leaf_pos = np.full(num_ids, -1, dtype=np.intp)
+        self._full_leaf_pos[self._full_leaf_ids] = np.arange(len(self._full_leaf_ids))
         self._full_leaf_list_up_to_date = True
 
+    def make_leaf_layout(self):
+        '''Lays out the labelled and unlabelled pool indices leaf by leaf, in the order of
+        _full_leaf_list, with offset and count arrays marking where each leaf's points are.
+        With this layout the leaf statistics are single numpy passes over the whole tree.
+        '''
+
+        if not self._full_leaf_list_up_to_date:
+            self.make_full_leaf_list()
+
+        for list_name in ['labelled', 'unlabelled']:
+            index_lists = [getattr(node, list_name + '_index') for node in self._full_leaf_list]
+            counts = np.fromiter(map(len, index_lists), dtype=np.intp, count=len(index_lists))
+            layout = np.fromiter(itertools.chain.from_iterable(index_lists), dtype=np.intp,
+                count=int(counts.sum()))
+            offsets = np.zeros(len(counts), dtype=np.intp)
+            np.cumsum(counts[:-1], out=offsets[1:])
+            setattr(self, '_' + list_name + '_layout', layout)
+            setattr(self, '_' + list_name + '_offsets', offsets)
+            setattr(self, '_' + list_name + '_counts', counts)
+        self._leaf_layout_up_to_date = True
+
+    def _leaf_label_segments(self):
+        '''Returns the labels in the labelled layout and the position in _full_leaf_list of
+        the leaf each one belongs to.
+        '''
+
+        if not self._leaf_layout_up_to_date:
+            self.make_leaf_layout()
+
+        labels = np.zeros(0) if self.labels is None else self.labels[self._labelled_layout]
+        segments = np.repeat(np.arange(len(self._labelled_counts)), self._labelled_counts)
+        return labels, segments
+
     def make_full_leaf_mean_list(self):
         if not self._full_leaf_list_up_to_date:
             print('Making full leaf list. Please wait')
             self.make_full_leaf_list()
             print('Done!')
 
-        mean_list = []
-        for i, node in enumerate(self._full_leaf_list):
-            label_list = [self.labels[x] for x in node.labelled_index]
-            if len(label_list) != 0:
-                mean_list.append(sum(label_list)/len(label_list))
-            else:
-                mean_list.append(0)
+        # bincount adds the weights in order, giving the same sums as a Python loop
 
-        self._full_leaf_mean_list = mean_list
+        labels, segments = self._leaf_label_segments()
+        counts = self._labelled_counts
+        sums = np.bincount(segments, weights=labels, minlength=len(counts))
+        mean_list = np.zeros(len(counts))
+        np.divide(sums, counts, out=mean_list, where=counts != 0)
+
+        self._full_leaf_mean_list = mean_list.tolist()
         self._full_leaf_mean_list_up_to_date = True
 
     def make_full_leaf_var_list(self):
@@ -410,12 +1494,18 @@ class Mondrian_Tree:
             self.make_full_leaf_list()
             print('Done!')
 
-        var_list = []
-        for i, node in enumerate(self._full_leaf_list):
-            label_list = [self.labels[x] for x in node.labelled_index]
-            var_list.append(utils.unbiased_var(label_list))
+        # Same two pass calculation as utils.unbiased_var, for every leaf at once
 
-        self._full_leaf_var_list = var_list
+        labels, segments = self._leaf_label_segments()
+        counts = self._labelled_counts
+        sums = np.bincount(segments, weights=labels, minlength=len(counts))
+        means = np.zeros(len(counts))
+        np.divide(sums, counts, out=means, where=counts != 0)
+        tots = np.bincount(segments, weights=(means[segments] - labels)**2, minlength=len(counts))
+        var_list = np.zeros(len(counts))
+        np.divide(tots, counts - 1, out=var_list, where=counts > 1)
+
+        self._full_leaf_var_list = var_list.tolist()
         self._full_leaf_var_list_up_to_date = True
 
     def make_full_leaf_marginal_list(self):
@@ -429,14 +1519,11 @@ class Mondrian_Tree:
 
         else:
 
-            marginal_list = []
-            for i, node in enumerate(self._full_leaf_list):
-                points_list = (
-                    [self.points[x] for x in node.unlabelled_index]+
-                    [self.points[x] for x in node.labelled_index])
-                marginal_list.append(len(points_list)/self._num_points)
+            if not self._leaf_layout_up_to_date:
+                self.make_leaf_layout()
 
-            self._full_leaf_marginal_list = marginal_list
+            marginal_list = (self._labelled_counts + self._unlabelled_counts) / self._num_points
+            self._full_leaf_marginal_list = marginal_list.tolist()
             self._full_leaf_marginal_list_up_to_date = True
 
     def update_leaf_lists(self):
@@ -470,34 +1557,282 @@ class Mondrian_Tree:
 
         if new_point_depth == 2 or (str(type(new_point)) == "<class 'numpy.ndarray'>" and 
             len(new_point.shape) == 2):
-            preds = []
-            for i in range(len(new_point)):
-                # print(len(new_point[i]))
-                # print(new_point[i])
-                preds.append(self.predict(new_point[i]))
-            return preds
 
+            # Route every point at once, then look up one prediction per distinct leaf
+
+            preds, empty = self._leaf_means_for_points(new_point)
+            if empty.any():
+                self._warn_empty_leaf()
+                preds[empty] = self.prediction_default_value
+            return preds.tolist()
 
         new_point = copy.deepcopy(new_point)
         new_point = self._test_point(new_point)
 
-        correct_leaf = self._root.leaf_for_point(new_point)
-        if len(correct_leaf.labelled_index) == 0:
-            warnings.warn(
-                'WARNING: No labelled data in this leaf. The value of {} is returned by default but '
-                'really should not be considered an actual prediction unless you set it with data using. '
-                'the .prediction_default_value instance variable.'
-                'Possible solutions to this are to sample data within that leaf, build smaller trees, '
-                'or use the global data average as your prediction. But whatever solution you use dependent '
-                'on what you are doing. You should be able to catch this warning and handle it automatically '
-                'using the warning module with a try/except statement.'.format(self.prediction_default_value))
+        correct_leaf = self._leaf_for_point(new_point)
+        pred = self._leaf_prediction(correct_leaf)
+        if pred is None:
+            self._warn_empty_leaf()
             return self.prediction_default_value 
-        elif self._full_leaf_mean_list_up_to_date:
-            return self._full_leaf_mean_list[correct_leaf.full_leaf_list_pos]
+        return pred
+
+    def _leaf_prediction(self, leaf):
+        '''The mean label of a leaf, or None if the leaf has no labelled data.'''
+
+        if self._leaf_num_labelled[leaf.leaf_id] == 0:
+            return None
+        return float(self._leaf_label_mean[leaf.leaf_id])
+
+    def _leaf_means_for_points(self, data_points):
+        '''Routes a list or 2 dim array of points and gathers the mean label of each point's
+        leaf from the running leaf statistics. Returns the float64 array of means together
+        with a boolean array marking the points whose leaf has no labelled data (their
+        entry is 0 and needs filling in by the caller).
+        '''
+
+        self._reserve_leaf_stats()
+        leaf_ids = self.leaf_for_points(data_points)
+        empty = self._leaf_num_labelled[leaf_ids] == 0
+        return self._leaf_label_mean[leaf_ids], empty
+
+    def predict_pool(self, indices):
+        '''Make predictions for points already in the tree, given by their indices. Each
+        point's leaf is read off the stored point to leaf map instead of routing the point
+        from the root, so this gives the same as predict on the points themselves for the
+        cost of a gather. Returns a list of predictions.
+        '''
+
+        preds, empty = self._pool_means(indices)
+        if empty.any():
+            self._warn_empty_leaf()
+            preds[empty] = self.prediction_default_value
+        return preds.tolist()
+
+    def _pool_means(self, indices):
+        '''The mean label of the leaf of each of the points with the given indices, with a
+        boolean array marking the points whose leaf has no labelled data, as in
+        _leaf_means_for_points.
+        '''
+
+        if self.labels is None:
+            raise RuntimeError('No data in the tree')
+
+        indices = np.asarray(indices, dtype=np.intp).reshape(-1)
+        outside = (indices < 0) | (indices >= self._num_points)
+        if outside.any():
+            raise ValueError('Index {} outside the data in the tree'.format(indices[outside][0]))
+
+        self._reserve_leaf_stats()
+        leaf_ids = self._point_leaf[indices]
+        empty = self._leaf_num_labelled[leaf_ids] == 0
+        return self._leaf_label_mean[leaf_ids], empty
+
+    def predict_points(self, new_points, fallback='global_mean'):
+        '''Vectorized predictions for a list (or 2 dim array) of points which never warns.
+        Points whose leaf has no labelled data are predicted by fallback instead:
+        'global_mean' (the mean of all the labels), 'parent_mean' (the mean label of the
+        nearest node above the leaf with labelled data) or 'default'
+        (prediction_default_value). Without any labels every point gets
+        prediction_default_value. Returns the predictions and a boolean array marking the
+        points that fell back, as numpy arrays.
+        '''
+
+        if fallback not in ['global_mean', 'parent_mean', 'default']:
+            raise ValueError('Invalid fallback {}, must be \'global_mean\', \'parent_mean\' '
+                'or \'default\''.format(fallback))
+
+        self._reserve_leaf_stats()
+        leaf_ids = self.leaf_for_points(new_points)
+        empty = self._leaf_num_labelled[leaf_ids] == 0
+        preds = self._leaf_label_mean[leaf_ids]
+        if empty.any():
+            preds[empty] = self._fallback_means(leaf_ids[empty], fallback)
+        return preds, empty
+
+    def _fallback_means(self, leaf_ids, fallback):
+        '''The fallback prediction (see predict_points) for each of the given leaves, which
+        have no labelled data.
+        '''
+
+        if fallback == 'default' or self._num_labelled == 0:
+            return self.prediction_default_value
+        if fallback == 'global_mean':
+            return self._label_sum / self._num_labelled
+
+        # The root holds every label, so each leaf has a labelled node above it
+
+        parent, _ = self._node_arrays()
+        counts, sums = self._node_label_sums(parent)
+        leaf_ids, inverse = np.unique(leaf_ids, return_inverse=True)
+        ancestors = _ancestors(leaf_ids, parent)
+        has_labels = (ancestors >= 0) & (counts[np.maximum(ancestors, 0)] != 0)
+        nodes = ancestors[np.argmax(has_labels, axis=0), np.arange(len(leaf_ids))]
+        return (sums[nodes] / counts[nodes])[inverse]
+
+    def predict_life_times(self, new_points, life_times):
+        '''Predictions for a list (or 2 dim array) of points at each of several life times no
+        larger than the tree's, all from the tree as it is. At life time t every point is
+        predicted by the mean label of the highest node on its path split at or after t,
+        which is its leaf in the tree pruned to t. Returns a (len(life_times), num_points)
+        numpy array.
+        '''
+
+        preds, empty = self._life_time_means(new_points, life_times)
+        if empty.any():
+            self._warn_empty_leaf()
+            preds[empty] = self.prediction_default_value
+        return preds
+
+    def _life_time_means(self, new_points, life_times):
+        '''Works out predict_life_times, returning the means together with a boolean array
+        marking the entries whose node has no labelled data (their entry is 0 and needs
+        filling in by the caller).
+        '''
+
+        life_times = np.asarray(life_times, dtype=float)
+        if (life_times > self._life_time).any():
+            raise ValueError('Life times must be no larger than the life time of the tree {}'.format(
+                self._life_time))
+
+        parent, split_time = self._node_arrays()
+        leaf_ids, inverse = np.unique(self.leaf_for_points(new_points), return_inverse=True)
+        nodes = self._life_time_nodes(leaf_ids, life_times, parent, split_time)[:, inverse]
+        counts, sums = self._node_label_sums(parent)
+        means = np.zeros(len(parent))
+        np.divide(sums, counts, out=means, where=counts != 0)
+        return means[nodes], counts[nodes] == 0
+
+    def _life_time_nodes(self, leaf_ids, life_times, parent, split_time):
+        '''The node each leaf is cut back to at each life time, as a (len(life_times),
+        len(leaf_ids)) array. The split times on a leaf's path go up from the root, so the
+        node at life time t is the one as many steps down the path as there are splits on it
+        before t. Those counts are added up for every life time at once from where each split
+        time falls among the sorted life times.
+        '''
+
+        ancestors = _ancestors(leaf_ids, parent)
+        depths = (ancestors >= 0).sum(axis=0) - 1
+        order = np.argsort(life_times, kind='stable')
+
+        rows, cols = np.nonzero(ancestors[1:] >= 0)
+        starts = np.searchsorted(life_times[order], split_time[ancestors[1:][rows, cols]], 
+            side='right')
+        num_splits = np.zeros([len(life_times) + 1, len(leaf_ids)], dtype=np.intp)
+        np.add.at(num_splits, (starts, cols), 1)
+        num_splits = np.cumsum(num_splits[:-1], axis=0)
+
+        nodes = np.empty([len(life_times), len(leaf_ids)], dtype=np.intp)
+        nodes[order] = ancestors[depths - num_splits, np.arange(len(leaf_ids))]
+        return nodes
+
+    def _node_label_sums(self, parent):
+        '''The number and sum of the labels below every node, indexed by node id. Each
+        node's labels are added up in index order, as the leaf statistics are.
+        '''
+
+        if self.labels is None:
+            return np.zeros(len(parent), dtype=np.intp), np.zeros(len(parent))
+
+        labelled = np.flatnonzero(self.labelled_mask)
+        ancestors = _ancestors(self._point_leaf[labelled], parent).T
+        on_path = ancestors >= 0
+        values = np.broadcast_to(self.labels[labelled][:, None], ancestors.shape)
+        counts = np.bincount(ancestors[on_path], minlength=len(parent))
+        sums = np.bincount(ancestors[on_path], weights=values[on_path], minlength=len(parent))
+        return counts, sums
+
+    def life_time_error_curve(self, new_points, new_labels, life_times=None, num_life_times=100):
+        '''Held out mean squared error of the tree's predictions (see predict_life_times) for
+        the labelled points new_points at each of a grid of life times no larger than the
+        tree's. The points are routed once and the whole curve comes from the split times on
+        their paths, so it costs about as much as one prediction. Without life_times,
+        num_life_times evenly spaced life times up to the tree's are used. Points whose node
+        has no labels are predicted by prediction_default_value, without warning. Returns the
+        life times and the errors as numpy arrays.
+        '''
+
+        if life_times is None:
+            life_times = np.linspace(0, self._life_time, num_life_times + 1)[1:]
+        life_times = np.asarray(life_times, dtype=float)
+        new_labels = np.asarray(new_labels, dtype=float)
+        if len(new_labels) != len(new_points):
+            raise ValueError('Need a label for every point')
+
+        preds, empty = self._life_time_means(new_points, life_times)
+        preds[empty] = self.prediction_default_value
+        return life_times, ((preds - new_labels)**2).mean(axis=1)
+
+    def loo_residuals(self):
+        '''Leave one out residuals of the labelled points, in index order, worked out exactly
+        from the leaf statistics without refitting: leaving a point out of a leaf with n
+        labels and mean m predicts it with (n*m - y)/(n - 1). A point that is the only label
+        in its leaf is predicted by the mean of all the other labels instead, as the empty
+        leaf would be.
+        '''
+
+        values = self.labels[self.labelled_mask] if self.labels is not None else np.zeros(0)
+        return values - self._loo_preds()
 
+    def loo_error(self):
+        '''Mean squared leave one out error of the labelled points (PRESS over the number of
+        labels), see loo_residuals.
+        '''
+
+        if self._num_labelled == 0:
+            raise RuntimeError('No labelled data in the tree')
+        return float((self.loo_residuals()**2).mean())
+
+    def _loo_preds(self):
+        '''The leave one out prediction of every labelled point, in index order.'''
+
+        if self.labels is None:
+            return np.zeros(0)
+
+        labelled = np.flatnonzero(self.labelled_mask)
+        values = self.labels[labelled]
+        leaf_ids = self._point_leaf[labelled]
+        counts = self._leaf_num_labelled[leaf_ids]
+        alone = counts == 1
+
+        preds = np.empty(len(labelled))
+        preds[~alone] = ((counts[~alone] * self._leaf_label_mean[leaf_ids[~alone]] - 
+            values[~alone]) / (counts[~alone] - 1))
+        if self._num_labelled > 1:
+            preds[alone] = (self._label_sum - values[alone]) / (self._num_labelled - 1)
         else:
-            temp_lis = [self.labels[x] for x in correct_leaf.labelled_index]
-            return sum(temp_lis)/len(temp_lis)
+            preds[alone] = self.prediction_default_value
+        return preds
+
+    def _node_arrays(self):
+        '''The parent and split time of every node, in arrays indexed by node id. Leaves
+        have a split time of inf and the root a parent of -1.
+        '''
+
+        if self._engine == 'flat':
+            num_nodes = self._flat.num_nodes
+            return self._flat.parent_node[:num_nodes], self._flat.split_time[:num_nodes]
+
+        parent = np.full(self._next_leaf_id, -1, dtype=np.intp)
+        split_time = np.full(self._next_leaf_id, np.inf)
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if not node.is_leaf():
+                split_time[node.node_id] = node.split_time
+                for child in [node.left_child, node.right_child]:
+                    parent[child.leaf_id if child.is_leaf() else child.node_id] = node.node_id
+                    stack.append(child)
+        return parent, split_time
+
+    def _warn_empty_leaf(self):
+        warnings.warn(
+            'WARNING: No labelled data in this leaf. The value of {} is returned by default but '
+            'really should not be considered an actual prediction unless you set it with data using. '
+            'the .prediction_default_value instance variable.'
+            'Possible solutions to this are to sample data within that leaf, build smaller trees, '
+            'or use the global data average as your prediction. But whatever solution you use dependent '
+            'on what you are doing. You should be able to catch this warning and handle it automatically '
+            'using the warning module with a try/except statement.'.format(self.prediction_default_value))
 
     def get_points_in_same_leaf(self, new_point, which_index_list = 'labelled'):
         '''Gets the labelled and unlabelled point index lists for a given data point. If you want
@@ -506,12 +1841,20 @@ class Mondrian_Tree:
 
         Returns the labelled or unlabelled index lists. Labelled is the default. Pick using 
         'labelled' or 'unlabelled'
+
+        new_point can also be the index of a point already in the tree, in which case its
+        leaf is looked up directly instead of routing the point down the tree.
         '''
 
-        new_point = copy.deepcopy(new_point)
-        new_point = self._test_point(new_point)
+        if isinstance(new_point, (int, np.integer)):
+            if not 0 <= new_point < self._num_points:
+                raise ValueError('Index {} larger than size of data in tree'.format(new_point))
+            correct_leaf = self._leaf(int(self._point_leaf[new_point]))
+        else:
+            new_point = copy.deepcopy(new_point)
+            new_point = self._test_point(new_point)
+            correct_leaf = self._leaf_for_point(new_point)
 
-        correct_leaf = self._root.leaf_for_point(new_point)
         if which_index_list == 'labelled':
             return correct_leaf.labelled_index
         elif which_index_list == 'unlabelled':
@@ -527,14 +1870,10 @@ class Mondrian_Tree:
         to that.
         '''
 
-        if self.labels is None:
-            self.prediction_default_value = 0
+        if self._num_labelled != 0:
+            self.prediction_default_value = self._label_sum / self._num_labelled
         else:
-            have_labels = [x for x in self.labels if x is not None]
-            if len(have_labels) != 0:
-                self.prediction_default_value = sum(have_labels) / len(have_labels)
-            else:
-                self.prediction_default_value = 0
+            self.prediction_default_value = 0
 
     ###########################################
 
@@ -545,55 +1884,87 @@ class Mondrian_Tree:
         '''Calculates the global variance for all labelled points and sets the default variance
         to that.
         '''
-        if self.labels is None:
-            self.al_default_var = 0
+        if self._num_labelled >= 2:
+            self.al_default_var = self._label_m2 / (self._num_labelled - 1)
         else:
-            have_labels = [x for x in self.labels if x is not None]
-            if len(have_labels) != 0:
-                self.al_default_var = utils.unbiased_var(have_labels)
-            else:
-                self.al_default_var = 0
+            self.al_default_var = 0
 
     def al_calculate_leaf_proportions(self):
         '''Calculates estimates of the leaf proportions, using estimates for leaf variances and
         marginal probabilities, as described in <paper>
+
+        Only the leaves that have been labelled or given new points since the last call are
+        recalculated, and the normalizer is updated by the change in their weight. Everything
+        is recalculated after the tree grows, new data is input or al_default_var changes.
         '''
 
-        # Ensure all the lists we need are built
+        # The variances and marginals are read straight from the running leaf statistics
 
         if not self._full_leaf_list_up_to_date:
             self.make_full_leaf_list()
-        if not self._full_leaf_var_list_up_to_date:
-            self.make_full_leaf_var_list()
-        if not self._full_leaf_marginal_list_up_to_date:
-            self.make_full_leaf_marginal_list()
-
-        al_var_list = copy.copy(self._full_leaf_var_list)
-        for i, val in enumerate(al_var_list):
-            if val == 0:
-                al_var_list[i] = self.al_default_var
-
-        al_proportions = []
+            self._al_leaf_weights = None
 
         if self._num_points == 0:
             warnings.warn('WARNING: No data points in tree. Returning uniform over all leaves')
             self._al_proportions = [1/self._num_leaves]*self._num_leaves
             self._al_proportions_up_to_date = True
+            return
+
+        recalculate_all = (self._al_leaf_weights is None or 
+            self._al_default_var_used != self.al_default_var)
+        if recalculate_all:
+            positions = np.arange(len(self._full_leaf_ids))
+        else:
+            positions = self._full_leaf_pos[list(self._al_dirty_leaves)]
+        self._al_dirty_leaves = set()
+
+        leaf_ids = self._full_leaf_ids[positions]
+        counts = self._leaf_num_labelled[leaf_ids]
+        var = np.zeros(len(leaf_ids))
+        np.divide(self._leaf_label_m2[leaf_ids], counts - 1, out=var, where=counts > 1)
+        al_var = np.where(var == 0, self.al_default_var, var)
+
+        # The marginal of a leaf is its number of points over _num_points, which is the same
+        # for every leaf and so cancels out in the normalization
+
+        weights = np.sqrt(self._leaf_num_points[leaf_ids] * al_var)
+
+        if recalculate_all:
+            self._al_leaf_vars = al_var
+            self._al_leaf_weights = weights
+            self._al_normalizer = weights.sum()
+            self._al_num_nonzero_var = int(np.count_nonzero(al_var))
+            self._full_leaf_var_list = var.tolist()
+            self._full_leaf_marginal_list = (
+                self._leaf_num_points[leaf_ids] / self._num_points).tolist()
+            self._full_leaf_marginal_list_up_to_date = True
+
+        else:
+            self._al_normalizer += weights.sum() - self._al_leaf_weights[positions].sum()
+            self._al_num_nonzero_var += int(
+                np.count_nonzero(al_var) - np.count_nonzero(self._al_leaf_vars[positions]))
+            self._al_leaf_vars[positions] = al_var
+            self._al_leaf_weights[positions] = weights
+            for i, pos in enumerate(positions.tolist()):
+                self._full_leaf_var_list[pos] = float(var[i])
+
+            # Only labels have changed if _num_points is the same, so the marginals still hold
 
-        elif sum(al_var_list) == 0:
+            if self._num_points != self._al_num_points_used:
+                self._full_leaf_marginal_list_up_to_date = False
+
+        self._full_leaf_var_list_up_to_date = True
+        self._al_default_var_used = self.al_default_var
+        self._al_num_points_used = self._num_points
+
+        if self._al_num_nonzero_var == 0:
             warnings.warn('WARNING: No non-zero variance. Returning uniform over all leaves')
-            self._al_proportions = [1/self._num_leaves]*self._num_leaves
-            self._al_proportions_up_to_date = True
+            self._al_proportions_list = [1/self._num_leaves]*self._num_leaves
 
         else:
-            for i, node in enumerate(self._full_leaf_list):
-                al_proportions.append(math.sqrt(
-                    self._full_leaf_marginal_list[i] * al_var_list[i]))
+            self._al_proportions_list = None
 
-            normalizer = sum(al_proportions)
-            al_proportions = [x/normalizer for x in al_proportions]
-            self._al_proportions = al_proportions
-            self._al_proportions_up_to_date = True
+        self._al_proportions_up_to_date = True
 
     def al_calculate_leaf_number_new_labels(self, num_samples_total, round_by = 'smallest'):
         '''Calculate how many new labelled points each leaf should get to get as close as 
@@ -629,105 +2000,99 @@ class Mondrian_Tree:
 
         # Calculate the optimal (fractional) number of points per leaf
 
-        num_per_leaf_fractions = [x*num_samples_total for x in self._al_proportions]
+        num_per_leaf_fractions = np.array(self._al_proportions, dtype=float) * num_samples_total
+        total_num_per_leaf = np.floor(num_per_leaf_fractions)
 
         # Calculate the number of labelled points that should be added to approach that optimal
 
-        current_num_per_leaf = []
-        unlabelled_num_per_leaf = []
-        for i, node in enumerate(self._full_leaf_list):
-            current_num_per_leaf.append(len(node.labelled_index))
-            unlabelled_num_per_leaf.append(len(node.unlabelled_index))
+        current_num_per_leaf = self._leaf_num_labelled[self._full_leaf_ids]
+        unlabelled_num_per_leaf = self._leaf_num_points[self._full_leaf_ids] - current_num_per_leaf
 
-        num_per_leaf = [max(0,math.floor(x) - current_num_per_leaf[i]) for i, x in enumerate(
-            num_per_leaf_fractions)]
+        num_per_leaf = np.maximum(0, total_num_per_leaf.astype(np.int64) - current_num_per_leaf)
 
         # Correct for if leaves have too few unlabelled points to get to the optimal number
 
-        full_leaves = []
+        full_leaves = num_per_leaf >= unlabelled_num_per_leaf
+        num_per_leaf[full_leaves] = unlabelled_num_per_leaf[full_leaves]
 
-        for i, num in enumerate(num_per_leaf):
-            if num >= unlabelled_num_per_leaf[i]:
-                num_per_leaf[i] = unlabelled_num_per_leaf[i]
-                full_leaves.append(i)
-                # print(i, num)
-        # print(full_leaves)
-
-        remaining_budget = num_samples_left - sum(num_per_leaf)
+        remaining_budget = num_samples_left - int(num_per_leaf.sum())
         if abs(remaining_budget/num_samples_left) > 0.2:
             warnings.warn('remaining_budget is = {} fraction of number of new samples. '
             'It may not be possible to get close to the optimal solution given the current locations '
             'of labelled data.'.format(round(abs(remaining_budget/num_samples_left),3))
             )
 
-        # print(remaining_budget)
-
-        # If we too few points we use one of two heuristics
+        # If we too few points we use one of two heuristics. Both give each leaf at most one
+        # extra point per pass, in a fixed order (ties going to the first leaf), so rather
+        # than adding points one by one we sort the leaves once and add whole passes at once.
 
         if round_by == 'highest':
-            num_per_leaf_fractions = [x - math.floor(x) for x in num_per_leaf_fractions]
-            for ind in full_leaves:
-                num_per_leaf_fractions[ind] = 0
-            while remaining_budget > 0:
-                num_per_leaf[num_per_leaf_fractions.index(max(num_per_leaf_fractions))] += 1
-                num_per_leaf_fractions[num_per_leaf_fractions.index(max(num_per_leaf_fractions))] = 0
-                remaining_budget -= 1
-
-                # If we've added one to every leaf, start adding again to highest fraction leaves.
 
-                if all([x==0 for x in num_per_leaf_fractions]):
-                    num_per_leaf_fractions = [x - math.floor(x) for x in num_per_leaf_fractions]
-                    for i, num in enumerate(num_per_leaf):
-                        if num >= unlabelled_num_per_leaf[i]:
-                            num_per_leaf[i] = unlabelled_num_per_leaf[i]
-                            full_leaves.append(i)
-                    for ind in full_leaves:
-                        num_per_leaf_fractions[ind] = 0
+            # One pass over the leaves with a fractional part, highest first. Once those are
+            # used up every further point goes to the first leaf, up to its number of
+            # unlabelled points.
+
+            fractions = num_per_leaf_fractions - total_num_per_leaf
+            fractions[full_leaves] = 0
+            if remaining_budget > 0:
+                order = np.argsort(-fractions, kind='stable')
+                num_with_fraction = int(np.count_nonzero(fractions))
+                num_per_leaf[order[:min(remaining_budget, num_with_fraction)]] += 1
+                if remaining_budget >= num_with_fraction:
+                    np.minimum(num_per_leaf, unlabelled_num_per_leaf, out=num_per_leaf)
+                    num_per_leaf[0] = min(num_per_leaf[0] + remaining_budget - num_with_fraction,
+                        unlabelled_num_per_leaf[0])
+                remaining_budget = 0
 
         elif round_by == 'smallest':
-            total_num_per_leaf = [math.floor(x*num_samples_total) for x in self._al_proportions]
-            for ind in full_leaves:
-                total_num_per_leaf[ind] = float('inf')
-            while remaining_budget > 0:
-                num_per_leaf[total_num_per_leaf.index(min(total_num_per_leaf))] += 1
-                total_num_per_leaf[total_num_per_leaf.index(min(total_num_per_leaf))] = float('inf')
-                remaining_budget -= 1
 
-                # If we've added one to every leaf, start adding again to smallest leaves.
+            # Repeated passes over the leaves that are not full, smallest first. Whole passes
+            # are added together until the next leaf fills up or the budget runs out.
 
-                if all([math.isinf(x) for x in total_num_per_leaf]):
-                    total_num_per_leaf = [math.floor(x*num_samples_total) for x in self._al_proportions]
-                    for i, num in enumerate(num_per_leaf):
-                        if num >= unlabelled_num_per_leaf[i]:
-                            num_per_leaf[i] = unlabelled_num_per_leaf[i]
-                            full_leaves.append(i)
-                    for ind in full_leaves:
-                        total_num_per_leaf[ind] = float('inf')
+            order = np.argsort(total_num_per_leaf, kind='stable')
+            open_leaves = ~full_leaves
+            while remaining_budget > 0:
+                pass_order = order[open_leaves[order]]
+                if len(pass_order) == 0:
+                    remaining_budget = 0
+                elif remaining_budget < len(pass_order):
+                    num_per_leaf[pass_order[:remaining_budget]] += 1
+                    remaining_budget = 0
+                else:
+                    room = unlabelled_num_per_leaf[pass_order] - num_per_leaf[pass_order]
+                    num_passes = min(remaining_budget // len(pass_order), int(room.min()))
+                    num_per_leaf[pass_order] += num_passes
+                    remaining_budget -= num_passes * len(pass_order)
+                    open_leaves &= num_per_leaf < unlabelled_num_per_leaf
 
         else:
             raise ValueError('Invalid round_by')
 
         # If we have too many points, we subtract from the leaves with the most total points
         # under the optimal solution. This occurs when leaves have already exceeded their
-        # optimal sampling number during the random sampling phase.
-
-        total_num_per_leaf = [math.floor(x*num_samples_total) for x in self._al_proportions]
-        while remaining_budget < 0:
-
-            for i, val in enumerate(num_per_leaf):
-                if val == 0:
-                    total_num_per_leaf[i] = float('-inf')
-
-            num_per_leaf[total_num_per_leaf.index(max(total_num_per_leaf))] -= 1
-            total_num_per_leaf[total_num_per_leaf.index(max(total_num_per_leaf))] -=1
-            remaining_budget += 1
-
-        self._al_leaf_number_new_labels = num_per_leaf
-
-    def al_calculate_point_probabilities_proportions(self):
+        # optimal sampling number during the random sampling phase. A heap keyed on the total
+        # (ties going to the first leaf) finds that leaf each time.
+
+        if remaining_budget < 0:
+            heap = [(-total_num_per_leaf[i], i) for i in np.flatnonzero(num_per_leaf > 0).tolist()]
+            heapq.heapify(heap)
+            while remaining_budget < 0:
+                neg_total, i = heapq.heappop(heap)
+                num_per_leaf[i] -= 1
+                remaining_budget += 1
+                if num_per_leaf[i] > 0:
+                    heapq.heappush(heap, (neg_total + 1, i))
+
+        self._al_leaf_number_new_labels = num_per_leaf.tolist()
+
+    def al_calculate_point_probabilities_proportions(self, out=None):
         '''Calculate the corresponding probabilities given to each point in order to achieve
         the correct leaf proportions. Each point is given weight of the leaf divided by the
         number of unlabelled points in the leaf.
+
+        Returns a float64 array with an entry for every point (0 for labelled points), which
+        is also kept in _al_point_weights_proportional. If out (a float64 array of length
+        _num_points) is given the probabilities are written into it instead of a new array.
         '''
 
         if not self._al_proportions_up_to_date:
@@ -735,14 +2100,11 @@ class Mondrian_Tree:
             self.al_calculate_leaf_proportions()
             print('Done!')
 
-        point_prob_list = [None] * self._num_points
-        for i, node in enumerate(self._full_leaf_list):
-            for ind in node.unlabelled_index:
-                point_prob_list[ind] = self._al_proportions[i] / len(node.unlabelled_index)
-
+        point_prob_list = self._leaf_weights_to_points(np.array(self._al_proportions), out)
         self._al_point_weights_proportional = point_prob_list
+        return point_prob_list
 
-    def al_calculate_point_probabilities_adjustment(self, num_samples_total):
+    def al_calculate_point_probabilities_adjustment(self, num_samples_total, out=None):
         '''Calculate the corresponding probabilities given to each point such that in expectation
         the number of points sampled from each leaf will be the leaf proportion times the 
         num_samples_total.
@@ -750,6 +2112,9 @@ class Mondrian_Tree:
         If the leaf has already had more samples than expected, gives probability 0. All 
         probabilities are normalized to account for rounding issues and passive oversampling of
         leaves (NOTE: THIS ROUNDING IS AD HOC SOLUTION TO PROBLEM)
+
+        Returns a float64 array like al_calculate_point_probabilities_proportions, which is
+        also kept in _al_point_weights_adjustment, and takes the same out argument.
         '''
 
         num_samples_total = copy.copy(num_samples_total)
@@ -764,19 +2129,60 @@ class Mondrian_Tree:
             self.al_calculate_leaf_number_new_labels(num_samples_total)
         num_samples_left = num_samples_total - self._num_labelled
 
-        point_prob_list = [None] * self._num_points
-        for i, node in enumerate(self._full_leaf_list):
-            num_needed = self._al_leaf_number_new_labels[i]
-            for ind in node.unlabelled_index:
-                point_prob_list[ind] = max(0,
-                    (num_needed)/(num_samples_left*len(node.unlabelled_index)))
+        leaf_weights = np.maximum(0, np.array(self._al_leaf_number_new_labels) / num_samples_left)
+        point_prob_list = self._leaf_weights_to_points(leaf_weights, out)
 
-        # print(point_prob_list)
-        tot = sum([x for x in point_prob_list if x is not None])
+        tot = point_prob_list.sum()
         if tot != 0:
-            for i, val in enumerate(point_prob_list):
-                if val is not None:
-                    point_prob_list[i] = point_prob_list[i]/tot
+            point_prob_list /= tot
 
         self._al_point_weights_adjustment = point_prob_list
+        return point_prob_list
+
+    def _leaf_weights_to_points(self, leaf_weights, out=None):
+        '''Spreads a weight for every leaf in _full_leaf_list evenly over the unlabelled
+        points in that leaf, through the point to leaf map. Labelled points get 0.
+        '''
+
+        if out is None:
+            out = np.empty(self._num_points)
+        elif (not isinstance(out, np.ndarray) or out.dtype != np.float64 or 
+            out.shape != (self._num_points,)):
+            raise ValueError('out must be a float64 array of shape ({},)'.format(self._num_points))
+
+        leaf_ids = self._full_leaf_ids
+        num_unlabelled = self._leaf_num_points[leaf_ids] - self._leaf_num_labelled[leaf_ids]
+        per_point = np.zeros(len(leaf_ids))
+        np.divide(leaf_weights, num_unlabelled, out=per_point, where=num_unlabelled != 0)
+
+        weight_of_leaf_id = np.zeros(len(self._leaf_num_points))
+        weight_of_leaf_id[leaf_ids] = per_point
+        np.take(weight_of_leaf_id, self._point_leaf[:self._num_points], out=out)
+        out[self.labelled_mask] = 0
+        return out
+
+def _copy_node(node):
+    '''Shallow copy of a LeafNode or SplitNode, without the overhead of copy.copy.'''
+
+    new_node = object.__new__(type(node))
+    new_node.__dict__.update(node.__dict__)
+    return new_node
+
+def _replace_child(split_node, old_child, new_child):
+    if split_node.left_child is old_child:
+        split_node.left_child = new_child
+    else:
+        split_node.right_child = new_child
+
+def _ancestors(node_ids, parent):
+    '''Row j of the returned array holds the node j steps above each of the given nodes,
+    or -1 once past the root. Row 0 is the nodes themselves.
+    '''
 
+    ancestors = [np.asarray(node_ids, dtype=np.intp)]
+    while True:
+        above = np.where(ancestors[-1] >= 0, parent[np.maximum(ancestors[-1], 0)], -1)
+        if (above < 0).all():
+            break
+        ancestors.append(above)
+    return np.array(ancestors).reshape(len(ancestors), len(ancestors[0]))
@@ -0,0 +1,80 @@
+import random
+
+class FenwickTree:
+
+    '''Fenwick (binary indexed) tree over a growable list of non-negative weights. Supports
+    changing a weight, appending a weight, the total weight, and finding the slot a point
+    in [0, total) falls into, all in O(log n). Used to pick which leaf to split with
+    probability proportional to its linear dimension without walking the tree.
+
+    Args:
+        weights (list): Initial weights, one per slot.
+    '''
+
+    def __init__(self, weights=None):
+        self._weights = []
+        self._tree = [0]
+        for weight in (weights if weights is not None else []):
+            self.append(weight)
+
+    def __len__(self):
+        return len(self._weights)
+
+    def _prefix_sum(self, num_slots):
+        '''Sum of the weights of the first num_slots slots.'''
+
+        tot = 0
+        i = num_slots
+        while i > 0:
+            tot += self._tree[i]
+            i -= i & -i
+        return tot
+
+    def total(self):
+        return self._prefix_sum(len(self._weights))
+
+    def weight(self, slot):
+        return self._weights[slot]
+
+    def append(self, weight):
+        '''Adds a new slot at the end with the given weight. Returns the new slot.'''
+
+        self._weights.append(weight)
+        i = len(self._weights)
+        lowbit = i & -i
+        self._tree.append(weight + self._prefix_sum(i - 1) - self._prefix_sum(i - lowbit))
+        return i - 1
+
+    def set(self, slot, weight):
+        change = weight - self._weights[slot]
+        self._weights[slot] = weight
+        i = slot + 1
+        while i <= len(self._weights):
+            self._tree[i] += change
+            i += i & -i
+
+    def find(self, value):
+        '''Returns the slot whose cumulative weight range contains value, i.e. the first
+        slot where the running total of weights exceeds value. Slots with no weight are
+        never returned unless every slot is empty.
+        '''
+
+        slot = 0
+        step = 1
+        while step * 2 <= len(self._weights):
+            step *= 2
+        while step > 0:
+            if slot + step <= len(self._weights) and self._tree[slot + step] <= value:
+                slot += step
+                value -= self._tree[slot]
+            step //= 2
+
+        # value can only reach the end through rounding error in the running sums
+
+        while slot >= len(self._weights) or (self._weights[slot] == 0 and slot > 0):
+            slot -= 1
+        return slot
+
+    def sample(self, rng=random):
+        '''Picks a slot with probability proportional to its weight.'''
+        return self.find(rng.random() * self.total())
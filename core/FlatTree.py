@@ -0,0 +1,367 @@
+import math
+import random
+import copy
+
+import numpy as np
+
+class FlatTree:
+
+    '''Array backed (struct of arrays) storage for the structure of a Mondrian tree.
+    Every node is an integer id into a set of aligned numpy arrays, so no node objects,
+    parent pointers or copied linear_dims lists are allocated when the tree grows.
+    Node 0 is always the root. Leaves are the nodes with left_child == -1.
+
+    Args:
+        linear_dims (list): A p dim list of 2 dim lists indicating the upper and
+        lower bounds of the entire space.
+        capacity (int): Number of nodes to allocate room for initially. The arrays
+        double in size whenever they run out of room.
+    '''
+
+    def __init__(self, linear_dims, capacity=16):
+        self.num_dimensions = len(linear_dims)
+        self.num_nodes = 1
+        self._capacity = 0
+
+        self.split_dim = np.zeros(0, dtype=np.intp)
+        self.split_val = np.zeros(0)
+        self.split_time = np.zeros(0)
+        self.left_child = np.zeros(0, dtype=np.intp)
+        self.right_child = np.zeros(0, dtype=np.intp)
+        self.parent_node = np.zeros(0, dtype=np.intp)
+        self.lower = np.zeros([0, self.num_dimensions])
+        self.upper = np.zeros([0, self.num_dimensions])
+        self.subtree_linear_dim = np.zeros(0)
+        self.full_leaf_list_pos = np.zeros(0, dtype=np.intp)
+        self._grow(max(capacity, 1))
+
+        # Data held in each leaf. Entries for split nodes are emptied when they split.
+
+        self.labelled_index = [[]]
+        self.unlabelled_index = [[]]
+
+        for dim, pair in enumerate(linear_dims):
+            self.lower[0, dim] = pair[0]
+            self.upper[0, dim] = pair[1]
+        self.subtree_linear_dim[0] = self._cell_linear_dim(0)
+
+    def __str__(self):
+        return 'Flat tree with {} nodes in {} dimensions'.format(
+            self.num_nodes, self.num_dimensions)
+
+    def _grow(self, min_capacity):
+        '''Reallocates every node array so it can hold at least min_capacity nodes,
+        doubling the current capacity so growing the tree is amortized O(1) per node.
+        '''
+
+        new_capacity = max(min_capacity, 2 * self._capacity)
+        if new_capacity <= self._capacity:
+            return
+
+        def resized(arr, fill):
+            new_arr = np.full((new_capacity,) + arr.shape[1:], fill, dtype=arr.dtype)
+            new_arr[:self._capacity] = arr[:self._capacity]
+            return new_arr
+
+        self.split_dim = resized(self.split_dim, -1)
+        self.split_val = resized(self.split_val, 0)
+        self.split_time = resized(self.split_time, np.inf)
+        self.left_child = resized(self.left_child, -1)
+        self.right_child = resized(self.right_child, -1)
+        self.parent_node = resized(self.parent_node, -1)
+        self.lower = resized(self.lower, 0)
+        self.upper = resized(self.upper, 0)
+        self.subtree_linear_dim = resized(self.subtree_linear_dim, 0)
+        self.full_leaf_list_pos = resized(self.full_leaf_list_pos, -1)
+        self._capacity = new_capacity
+
+    ###########################################
+
+    # Basic methods
+
+    def is_leaf(self, node):
+        return self.left_child[node] < 0
+
+    def linear_dims(self, node):
+        return [[lo, hi] for lo, hi in zip(self.lower[node].tolist(), self.upper[node].tolist())]
+
+    def _cell_linear_dim(self, node):
+        '''Sum of the side lengths of a node's cell, added up in the same order as
+        LeafNode.calculate_subtree_linear_dim so both engines agree to the last bit.
+        '''
+
+        tot = 0
+        for lo, hi in zip(self.lower[node].tolist(), self.upper[node].tolist()):
+            tot += abs(hi - lo)
+        return tot
+
+    def leaf(self, node):
+        '''Returns a FlatLeaf view of a leaf, which behaves like a LeafNode.'''
+        return FlatLeaf(self, node)
+
+    def leaf_for_point(self, data_point):
+        node = 0
+        while self.left_child[node] >= 0:
+            if data_point[self.split_dim[node]] < self.split_val[node]:
+                node = self.left_child[node]
+            else:
+                node = self.right_child[node]
+        return int(node)
+
+    def leaf_for_points(self, data_points):
+        '''Vectorized leaf_for_point for a 2 dim numpy array of points. All points move
+        down one level of the tree at a time, so the work is a handful of numpy operations
+        per level rather than a Python traversal per point. Returns the leaf id of every row.
+        '''
+
+        node = np.zeros(len(data_points), dtype=np.intp)
+        active = np.arange(len(data_points))
+        while len(active) != 0:
+            curr = node[active]
+            internal = self.left_child[curr] >= 0
+            active = active[internal]
+            curr = curr[internal]
+            goes_left = data_points[active, self.split_dim[curr]] < self.split_val[curr]
+            node[active] = np.where(goes_left, self.left_child[curr], self.right_child[curr])
+        return node
+
+    def leaves(self, node=0):
+        '''Returns the ids of every leaf below node (the whole tree by default), ordered as
+        a depth first search visiting left children first (the same order
+        Mondrian_Tree.make_full_leaf_list uses).
+        '''
+
+        leaf_ids = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if self.left_child[node] < 0:
+                leaf_ids.append(node)
+            else:
+                stack.append(int(self.right_child[node]))
+                stack.append(int(self.left_child[node]))
+        return leaf_ids
+
+    def copy(self):
+        '''Returns a copy of the tree with its own node arrays and index lists.'''
+
+        new_tree = copy.copy(self)
+        for name in ['split_dim', 'split_val', 'split_time', 'left_child', 'right_child',
+            'parent_node', 'lower', 'upper', 'subtree_linear_dim', 'full_leaf_list_pos']:
+            setattr(new_tree, name, getattr(self, name).copy())
+        new_tree.labelled_index = [list(index_list) for index_list in self.labelled_index]
+        new_tree.unlabelled_index = [list(index_list) for index_list in self.unlabelled_index]
+        return new_tree
+
+    ###########################################
+
+    # Growing the tree
+
+    def split_leaf(self, node, split_dim, split_val, split_time=np.inf, percolate=True):
+        '''Splits a leaf into two new leaves along split_dim at split_val, percolating the
+        change in subtree_linear_dim up to the root (unless percolate is False, for callers
+        that keep track of leaf weights some other way). Returns the ids of the new left and
+        right leaves. Data in the leaf is NOT moved into the children.
+        '''
+
+        if not self.is_leaf(node):
+            raise ValueError('Node {} is not a leaf so it cannot be split'.format(node))
+
+        if self.num_nodes + 2 > self._capacity:
+            self._grow(self.num_nodes + 2)
+
+        left = self.num_nodes
+        right = self.num_nodes + 1
+        self.num_nodes += 2
+
+        self.split_dim[node] = split_dim
+        self.split_val[node] = split_val
+        self.split_time[node] = split_time
+        self.left_child[node] = left
+        self.right_child[node] = right
+
+        for child in (left, right):
+            self.parent_node[child] = node
+            self.lower[child] = self.lower[node]
+            self.upper[child] = self.upper[node]
+        self.upper[left, split_dim] = split_val
+        self.lower[right, split_dim] = split_val
+
+        for child in (left, right):
+            self.subtree_linear_dim[child] = self._cell_linear_dim(child)
+        self.labelled_index.extend([[], []])
+        self.unlabelled_index.extend([[], []])
+
+        if not percolate:
+            return left, right
+
+        change = (self.subtree_linear_dim[left] + self.subtree_linear_dim[right] -
+            self.subtree_linear_dim[node])
+        curr_node = node
+        while curr_node >= 0:
+            self.subtree_linear_dim[curr_node] += change
+            curr_node = self.parent_node[curr_node]
+
+        return left, right
+
+    def split_leaves(self, nodes, split_dims, split_vals, split_times):
+        '''Vectorized split_leaf: splits every leaf in nodes at once, with numpy fancy
+        indexing instead of a Python loop. Leaf i of nodes gets children left[i], right[i]
+        which are returned. subtree_linear_dim is set on the new leaves but not percolated
+        up the tree. Data in the leaves is NOT moved into the children.
+        '''
+
+        nodes = np.asarray(nodes, dtype=np.intp)
+        num_split = len(nodes)
+        if num_split == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+
+        if (self.left_child[nodes] >= 0).any():
+            raise ValueError('Only leaves can be split')
+
+        if self.num_nodes + 2 * num_split > self._capacity:
+            self._grow(self.num_nodes + 2 * num_split)
+
+        left = self.num_nodes + 2 * np.arange(num_split)
+        right = left + 1
+        self.num_nodes += 2 * num_split
+
+        self.split_dim[nodes] = split_dims
+        self.split_val[nodes] = split_vals
+        self.split_time[nodes] = split_times
+        self.left_child[nodes] = left
+        self.right_child[nodes] = right
+
+        for children in (left, right):
+            self.parent_node[children] = nodes
+            self.lower[children] = self.lower[nodes]
+            self.upper[children] = self.upper[nodes]
+        self.upper[left, split_dims] = split_vals
+        self.lower[right, split_dims] = split_vals
+
+        children = np.concatenate([left, right])
+        self.subtree_linear_dim[children] = np.abs(
+            self.upper[children] - self.lower[children]).sum(axis=1)
+        self.labelled_index.extend([] for _ in range(2 * num_split))
+        self.unlabelled_index.extend([] for _ in range(2 * num_split))
+
+        return left, right
+
+class FlatLeaf:
+
+    '''A light weight view of one leaf in a FlatTree. It offers the same interface as
+    LeafNode, reading and writing straight through to the arrays of the FlatTree, so
+    code written against LeafNode (e.g. walking _full_leaf_list) keeps working.
+
+    Args:
+        tree (FlatTree): The tree the leaf belongs to
+        node (int): The id of the leaf in the tree
+    '''
+
+    def __init__(self, tree, node):
+        self.tree = tree
+        self.leaf_id = int(node)
+
+    def __str__(self):
+        print_str = (
+        'n_labelled = {}\n'
+        'n_unlabelled = {}\n'
+        'leaf_id = {}'.format(
+            len(self.labelled_index),
+            len(self.unlabelled_index),
+            self.leaf_id))
+        return(print_str)
+
+    @property
+    def labelled_index(self):
+        return self.tree.labelled_index[self.leaf_id]
+
+    @labelled_index.setter
+    def labelled_index(self, value):
+        self.tree.labelled_index[self.leaf_id] = value
+
+    @property
+    def unlabelled_index(self):
+        return self.tree.unlabelled_index[self.leaf_id]
+
+    @unlabelled_index.setter
+    def unlabelled_index(self, value):
+        self.tree.unlabelled_index[self.leaf_id] = value
+
+    @property
+    def linear_dims(self):
+        return self.tree.linear_dims(self.leaf_id)
+
+    @property
+    def subtree_linear_dim(self):
+        return float(self.tree.subtree_linear_dim[self.leaf_id])
+
+    @property
+    def full_leaf_list_pos(self):
+        pos = self.tree.full_leaf_list_pos[self.leaf_id]
+        if pos < 0:
+            return None
+        return int(pos)
+
+    @full_leaf_list_pos.setter
+    def full_leaf_list_pos(self, value):
+        self.tree.full_leaf_list_pos[self.leaf_id] = -1 if value is None else value
+
+    def rounded_linear_dims(self, sig_fig = 2):
+        print_list = [[round(x[0],sig_fig), round(x[1], sig_fig)] for x in self.linear_dims]
+        return print_list
+
+    def pick_new_points(self, num_samples, self_update = False, set_seed = None):
+        '''Returns the index of points to get labels for, and automatically adds
+        them the leafs labelled points by default
+        '''
+
+        num_samples = copy.copy(num_samples)
+
+        if num_samples > len(self.unlabelled_index):
+            raise ValueError('This leaf only has {} < {} unlabelled points'.format(
+                len(self.unlabelled_index), num_samples))
+
+        if set_seed is not None:
+            random.seed(set_seed)
+
+        new_points = random.sample(self.unlabelled_index, num_samples)
+        if self_update:
+            self.extend_labelled_index(new_points)
+            self.unlabelled_index = [x for x in self.unlabelled_index if x not in new_points]
+
+        return new_points
+
+    def calculate_subtree_linear_dim(self):
+        return self.subtree_linear_dim
+
+    def make_labelled(self, index):
+        '''Takes a point in the unlablled_index list and moves it to the labelled one.
+        If the point is not in the unlabelled_index list it returns an error.
+        '''
+
+        try:
+            self.unlabelled_index.remove(index)
+        except ValueError:
+            raise ValueError('Point {} is not in this leaf'.format(index))
+        self.labelled_index.append(index)
+
+    ###########################################
+
+    # Basic methods
+
+    def is_leaf(self):
+        return True
+
+    def leaf_for_point(self, data_point):
+        return self
+
+    def extend_labelled_index(self, new_labelled_list):
+        self.labelled_index.extend(new_labelled_list)
+
+    def extend_unlabelled_index(self, new_unlabelled_list):
+        self.unlabelled_index.extend(new_unlabelled_list)
+
+    def calculate_cell_l2_diameter(self):
+        widths = self.tree.upper[self.leaf_id] - self.tree.lower[self.leaf_id]
+        return math.sqrt(float((widths**2).sum()))
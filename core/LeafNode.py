@@ -91,11 +91,11 @@ class LeafNode:
 
         index = copy.copy(index)
 
-        if index not in self.unlabelled_index:
+        try:
+            self.unlabelled_index.remove(index)
+        except ValueError:
             raise ValueError('Point {} is not in this leaf'.format(index))
-
         self.labelled_index.append(index)
-        self.unlabelled_index.remove(index)
 
     ###########################################
 
@@ -107,6 +107,9 @@ class LeafNode:
     def leaf_for_point(self, data_point):
         return self
 
+    def leaf_for_points(self, data_points, indices, leaf_ids):
+        leaf_ids[indices] = self.leaf_id
+
     def extend_labelled_index(self, new_labelled_list):
         new_labelled_list = copy.deepcopy(new_labelled_list)
         self.labelled_index.extend(new_labelled_list)
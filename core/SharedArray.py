@@ -0,0 +1,78 @@
+import os
+import tempfile
+
+import numpy as np
+
+class SharedArray:
+
+    '''A read only numpy array kept in a memory mapped file, so every tree and every process
+    using it maps the same pages instead of holding its own copy. Pickling a SharedArray
+    (e.g. to send a forest to a worker process) only sends a handle, the file name, shape
+    and dtype, and the array is mapped again on the other side. The process that made the
+    array owns the file and removes it when the array is closed or garbage collected.
+
+    Args:
+        array (array like): Data to put into the shared array.
+        dir (str): Directory for the backing file. Defaults to /dev/shm where it exists, so
+        the data stays in memory, and the system temp directory otherwise.
+    '''
+
+    def __init__(self, array, dir=None):
+        array = np.ascontiguousarray(array)
+        if dir is None and os.path.isdir('/dev/shm'):
+            dir = '/dev/shm'
+
+        fd, self.filename = tempfile.mkstemp(prefix='mondrian_', suffix='.dat', dir=dir)
+        os.close(fd)
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self._owner_pid = os.getpid()
+
+        if array.size != 0:
+            mapped = np.memmap(self.filename, dtype=self.dtype, mode='w+', shape=self.shape)
+            mapped[...] = array
+            mapped.flush()
+            del mapped
+        self._map()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __reduce__(self):
+        return (_attach, (self.filename, self.shape, self.dtype.str))
+
+    def __del__(self):
+        self.close()
+
+    def _map(self):
+        if np.prod(self.shape) == 0:
+            self.array = np.zeros(self.shape, dtype=self.dtype)
+            self.array.flags.writeable = False
+        else:
+            # A plain ndarray view of the map, so slices are not memmap objects
+            self.array = np.asarray(
+                np.memmap(self.filename, dtype=self.dtype, mode='r', shape=self.shape))
+
+    def close(self):
+        '''Drops this process's mapping, and removes the backing file if this process made
+        it. Arrays already handed out keep the pages alive until they are released.
+        '''
+
+        self.array = None
+        if getattr(self, '_owner_pid', None) == os.getpid():
+            self._owner_pid = None
+            try:
+                os.remove(self.filename)
+            except OSError:
+                pass
+
+def _attach(filename, shape, dtype):
+    '''Maps an existing SharedArray file without taking ownership of it.'''
+
+    shared = SharedArray.__new__(SharedArray)
+    shared.filename = filename
+    shared.shape = tuple(shape)
+    shared.dtype = np.dtype(dtype)
+    shared._owner_pid = None
+    shared._map()
+    return shared
@@ -9,10 +9,11 @@ class SplitNode:
         split_val (float): The value of the split point
         parent_node (SplitNode): This node's parent node
         parent_branch (int): This node's branch (0 for left, 1 for right)
+        split_time (float): The time the split was made at while growing the tree
     '''
 
     def __init__(self, split_dim, split_val,left_child, right_child, 
-        parent_node=None, parent_branch=None, subtree_linear_dim=None):
+        parent_node=None, parent_branch=None, subtree_linear_dim=None, split_time=None):
         self.split_dim = copy.copy(split_dim)
         self.split_val = copy.copy(split_val)
         self.parent_node = parent_node
@@ -20,6 +21,12 @@ class SplitNode:
         self.left_child = left_child
         self.right_child = right_child
         self.subtree_linear_dim = subtree_linear_dim
+        self.split_time = split_time
+
+        # The id of the leaf this node replaced, so every node in a tree has an id as in the
+        # flat engine
+
+        self.node_id = None
 
     def __str__(self):
         return 'Splits on dimension {} and value {}'.format(self.split_dim, self.split_val)
@@ -56,6 +63,29 @@ class SplitNode:
             else:
                 return self.right_child.leaf_for_point(data_point)
 
+    def leaf_for_points(self, data_points, indices, leaf_ids):
+        '''Vectorized leaf_for_point. Routes the rows data_points[indices] (data_points is
+        a 2 dim numpy array, indices an integer numpy array) down the subtree one level at
+        a time, splitting each node's index set with a boolean mask, and writes the
+        leaf_id of the leaf each row ends up in into leaf_ids.
+        '''
+
+        frontier = [(self, indices)]
+        while frontier:
+            next_frontier = []
+            for node, node_indices in frontier:
+                if node.is_leaf():
+                    node.leaf_for_points(data_points, node_indices, leaf_ids)
+                    continue
+                goes_left = data_points[node_indices, node.split_dim] < node.split_val
+                left_indices = node_indices[goes_left]
+                right_indices = node_indices[~goes_left]
+                if len(left_indices) != 0:
+                    next_frontier.append((node.left_child, left_indices))
+                if len(right_indices) != 0:
+                    next_frontier.append((node.right_child, right_indices))
+            frontier = next_frontier
+
     ###########################################
 
     # Basic methods
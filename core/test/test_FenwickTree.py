@@ -0,0 +1,57 @@
+import unittest
+import random
+from FenwickTree import FenwickTree
+
+class test_FenwickTree(unittest.TestCase):
+
+    '''Unit testing for FenwickTree'''
+
+    def setUp(self):
+        self.weights = [0.5, 0, 2, 1, 0.25, 3, 0]
+        self.fenwick = FenwickTree(self.weights)
+
+    def test_total(self):
+        self.assertEqual(self.fenwick.total(), sum(self.weights))
+
+    def test_empty(self):
+        self.assertEqual(FenwickTree().total(), 0)
+        self.assertEqual(len(FenwickTree()), 0)
+
+    def test_prefix_sums(self):
+        for i in range(len(self.weights) + 1):
+            self.assertEqual(self.fenwick._prefix_sum(i), sum(self.weights[:i]))
+
+    def test_find(self):
+        self.assertEqual(self.fenwick.find(0), 0)
+        self.assertEqual(self.fenwick.find(0.49), 0)
+        self.assertEqual(self.fenwick.find(0.5), 2)
+        self.assertEqual(self.fenwick.find(2.6), 3)
+        self.assertEqual(self.fenwick.find(6.7), 5)
+
+    def test_find_past_total(self):
+        self.assertEqual(self.fenwick.find(100), 5)
+
+    def test_set(self):
+        self.fenwick.set(1, 4)
+        self.assertEqual(self.fenwick.total(), sum(self.weights) + 4)
+        self.assertEqual(self.fenwick.find(0.5), 1)
+        self.assertEqual(self.fenwick.weight(1), 4)
+
+    def test_append(self):
+        for i in range(20):
+            self.assertEqual(self.fenwick.append(i), len(self.weights) + i)
+        weights = self.weights + list(range(20))
+        for i in range(len(weights) + 1):
+            self.assertEqual(self.fenwick._prefix_sum(i), sum(weights[:i]))
+
+    def test_sample_proportional(self):
+        rng = random.Random(1)
+        nreps = 10000
+        counts = [0] * len(self.weights)
+        for _ in range(nreps):
+            counts[self.fenwick.sample(rng)] += 1
+        for i, weight in enumerate(self.weights):
+            self.assertTrue(abs(counts[i]/nreps - weight/sum(self.weights)) < 0.02)
+
+if __name__ == '__main__':
+    unittest.main()
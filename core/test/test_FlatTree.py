@@ -0,0 +1,115 @@
+import unittest
+import numpy as np
+from FlatTree import FlatTree, FlatLeaf
+
+class test_FlatTree(unittest.TestCase):
+
+    '''Unit testing for FlatTree.
+
+    Builds the same tree as test_SplitNode, but with arrays:
+
+             0
+            / \\
+           1   2
+              / \\
+             3   4
+            / \\
+           5   6
+    '''
+
+    def setUp(self):
+        self.tree = FlatTree([[0,1],[0,1]], capacity=1)
+        self.tree.split_leaf(0, 0, 0.2, 0.1)
+        self.tree.split_leaf(2, 1, 0.5, 0.3)
+        self.tree.split_leaf(3, 0, 0.7, 0.4)
+
+    def test_root_linear_dim(self):
+        self.assertEqual(FlatTree([[0,1],[-1,1]]).subtree_linear_dim[0], 3)
+
+    def test_grow_capacity(self):
+        self.assertEqual(self.tree.num_nodes, 7)
+        self.assertTrue(len(self.tree.left_child) >= 7)
+
+    def test_entire_tree_linear_dim(self):
+        self.assertAlmostEqual(self.tree.subtree_linear_dim[0], 4.3)
+        self.assertAlmostEqual(self.tree.subtree_linear_dim[2], 3.1)
+
+    def test_child_bounds(self):
+        self.assertEqual(self.tree.linear_dims(6), [[0.7,1],[0,0.5]])
+        self.assertEqual(self.tree.linear_dims(1), [[0,0.2],[0,1]])
+
+    def test_split_times(self):
+        self.assertEqual(self.tree.split_time[2], 0.3)
+        self.assertEqual(self.tree.split_time[6], float('inf'))
+
+    def test_split_non_leaf(self):
+        with self.assertRaises(ValueError):
+            self.tree.split_leaf(0, 1, 0.5)
+
+    def test_leaf_for_point_in_domain(self):
+        self.assertEqual(self.tree.leaf_for_point([0,1]), 1)
+        self.assertEqual(self.tree.leaf_for_point([0.8,0.1]), 6)
+
+    def test_leaf_for_point_outof_domain(self):
+        self.assertEqual(self.tree.leaf_for_point([-1,2]), 1)
+
+    def test_leaf_for_points(self):
+        points = np.array([[0,1], [-1,2], [0.8,0.1], [0.3,0.2], [0.5,0.9]])
+        self.assertEqual(self.tree.leaf_for_points(points).tolist(),
+            [self.tree.leaf_for_point(point) for point in points])
+
+    def test_leaf_for_points_empty(self):
+        self.assertEqual(len(self.tree.leaf_for_points(np.zeros([0,2]))), 0)
+
+    def test_split_leaves(self):
+        left, right = self.tree.split_leaves([1, 6], [1, 0], [0.25, 0.9], [0.5, 0.6])
+        self.assertEqual(self.tree.num_nodes, 11)
+        self.assertEqual(self.tree.linear_dims(left[0]), [[0,0.2],[0,0.25]])
+        self.assertEqual(self.tree.linear_dims(right[1]), [[0.9,1],[0,0.5]])
+        self.assertEqual(self.tree.split_time[6], 0.6)
+        self.assertEqual(self.tree.parent_node[right[0]], 1)
+        self.assertAlmostEqual(self.tree.subtree_linear_dim[left[1]], 0.7)
+        self.assertEqual(self.tree.leaves(), [left[0],right[0],5,left[1],right[1],4])
+
+    def test_split_leaves_non_leaf(self):
+        with self.assertRaises(ValueError):
+            self.tree.split_leaves([0], [0], [0.5], [1])
+
+    def test_leaves_dfs_order(self):
+        self.assertEqual(self.tree.leaves(), [1,5,6,4])
+
+    # Testing the FlatLeaf view
+
+    def test_leaf_view_writes_through(self):
+        leaf = self.tree.leaf(6)
+        leaf.extend_unlabelled_index([1,2])
+        leaf.make_labelled(2)
+        self.assertEqual(self.tree.labelled_index[6], [2])
+        self.assertEqual(self.tree.leaf(6).unlabelled_index, [1])
+
+    def test_leaf_view_make_labelled_not_in_unlabelled(self):
+        with self.assertRaises(ValueError):
+            self.tree.leaf(6).make_labelled(1)
+
+    def test_leaf_view_diameter(self):
+        self.assertAlmostEqual(self.tree.leaf(1).calculate_cell_l2_diameter(), (0.04 + 1)**0.5)
+
+    def test_leaf_view_full_leaf_list_pos(self):
+        leaf = self.tree.leaf(4)
+        self.assertEqual(leaf.full_leaf_list_pos, None)
+        leaf.full_leaf_list_pos = 3
+        self.assertEqual(self.tree.leaf(4).full_leaf_list_pos, 3)
+
+    def test_copy(self):
+        self.tree.labelled_index[6].append(3)
+        new_tree = self.tree.copy()
+        new_tree.split_leaf(6, 1, 0.25)
+        new_tree.labelled_index[4].append(1)
+        self.assertEqual(self.tree.num_nodes, 7)
+        self.assertTrue(self.tree.is_leaf(6))
+        self.assertEqual(self.tree.labelled_index[4], [])
+        self.assertEqual(new_tree.labelled_index[6], [3])
+        self.assertEqual(new_tree.leaves(), [1,5,7,8,4])
+
+if __name__ == '__main__':
+    unittest.main()
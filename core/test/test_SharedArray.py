@@ -0,0 +1,44 @@
+import unittest
+import os
+import pickle
+import numpy as np
+from SharedArray import SharedArray
+
+class test_SharedArray(unittest.TestCase):
+
+    '''Unit testing for SharedArray.'''
+
+    def setUp(self):
+        self.data = np.arange(12, dtype=float).reshape(4, 3)
+        self.shared = SharedArray(self.data)
+
+    def tearDown(self):
+        self.shared.close()
+
+    def test_same_values(self):
+        self.assertEqual(self.shared.array.tolist(), self.data.tolist())
+        self.assertEqual(len(self.shared), 4)
+        self.assertEqual(type(self.shared.array), np.ndarray)
+
+    def test_read_only(self):
+        with self.assertRaises(ValueError):
+            self.shared.array[0, 0] = 1
+
+    def test_pickle_sends_handle(self):
+        self.assertTrue(len(pickle.dumps(self.shared)) < self.data.nbytes)
+        attached = pickle.loads(pickle.dumps(self.shared))
+        self.assertEqual(attached.array.tolist(), self.data.tolist())
+        attached.close()
+        self.assertTrue(os.path.exists(self.shared.filename))
+
+    def test_owner_removes_file(self):
+        self.shared.close()
+        self.assertFalse(os.path.exists(self.shared.filename))
+
+    def test_empty(self):
+        shared = SharedArray(np.zeros([0, 3]))
+        self.assertEqual(shared.array.shape, (0, 3))
+        shared.close()
+
+if __name__ == '__main__':
+    unittest.main()
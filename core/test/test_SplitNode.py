@@ -1,5 +1,6 @@
 import unittest
 import copy
+import numpy as np
 from LeafNode import LeafNode
 from SplitNode import SplitNode
 
@@ -71,6 +72,15 @@ class test_SplitNode(unittest.TestCase):
     def test_leaf_for_point_outof_domain(self):
         self.assertEqual(self.A.leaf_for_point([-1,2]), self.B)
 
+    def test_leaf_for_points(self):
+        for leaf_id, leaf in enumerate([self.B, self.E, self.F, self.G]):
+            leaf.leaf_id = leaf_id
+        points = np.array([[0,1], [-1,2], [0.8,0.1], [0.3,0.2], [0.5,0.9]])
+        leaf_ids = np.zeros(len(points), dtype=int)
+        self.A.leaf_for_points(points, np.arange(len(points)), leaf_ids)
+        for point, leaf_id in zip(points, leaf_ids):
+            self.assertEqual(self.A.leaf_for_point(point).leaf_id, leaf_id)
+
     def test_percolate_subtree_linear_dim(self):
         self.A.calculate_subtree_linear_dim()
         self.D.percolate_subtree_linear_dim_change(0.5)
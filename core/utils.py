@@ -1,14 +1,19 @@
 import random
 import itertools
+import gc
+import contextlib
 from bisect import bisect
 
-def choices(population, weights=None, *, cum_weights=None, k=1):
+import numpy as np
+
+def choices(population, weights=None, *, cum_weights=None, k=1, rng=random):
     """Copy of source code for random.choices added to random module in 3.6
 
     Return a k sized list of population elements chosen with replacement.
 
     If the relative weights or cumulative weights are not specified,
-    the selections are made with equal probability.
+    the selections are made with equal probability. Random numbers are drawn
+    from rng, which defaults to the global random module.
 
     """
     if len(population) == 0:
@@ -16,14 +21,14 @@ def choices(population, weights=None, *, cum_weights=None, k=1):
     if cum_weights is None:
         if weights is None:
             total = len(population)
-            return [population[int(random.random() * total)] for i in range(k)]
+            return [population[int(rng.random() * total)] for i in range(k)]
         cum_weights = list(itertools.accumulate(weights))
     elif weights is not None:
         raise TypeError('Cannot specify both weights and cumulative weights')
     if len(cum_weights) != len(population):
         raise ValueError('The number of weights does not match the population')
     total = cum_weights[-1]
-    return [population[bisect(cum_weights, random.random() * total)] for i in range(k)]
+    return [population[bisect(cum_weights, rng.random() * total)] for i in range(k)]
 
 def unbiased_var(label_list):
     n = len(label_list)
@@ -35,4 +40,124 @@ def unbiased_var(label_list):
     for val in label_list:
         tot += (mean - val)**2
 
-    return tot/(n-1)
\ No newline at end of file
+    return tot/(n-1)
+
+def prepare_data(all_data, labelled_indices, labels, num_dimensions, copy_data=False):
+    """Checks the data given to input_data and puts it in the form the trees use. Returns
+    a read only (num_points, num_dimensions) float array of the points, an integer array
+    of the labelled indices and a float array of the labels.
+
+    The shape of all_data is checked once rather than row by row, and if all_data is
+    already a float array the points array is a view of it, so nothing is copied unless
+    copy_data is True.
+    """
+
+    if len(all_data) < len(labelled_indices):
+        raise ValueError('Cannot have more labelled indices than points')
+
+    if len(labelled_indices) != len(labels):
+        raise ValueError('Labelled indices list and labels list must be same length')
+
+    dim_error = ValueError('All data points must be of the dimension on which this '
+        'Mondrian Tree is built ({})'.format(num_dimensions))
+    try:
+        if copy_data:
+            points = np.array(all_data, dtype=float)
+        else:
+            points = np.asarray(all_data, dtype=float)
+    except ValueError:
+        raise dim_error
+    if len(points) == 0:
+        points = points.reshape(0, num_dimensions)
+    if points.ndim != 2 or points.shape[1] != num_dimensions:
+        raise dim_error
+
+    points = points.view()
+    points.flags.writeable = False
+
+    labelled_indices = np.asarray(labelled_indices, dtype=np.intp).reshape(-1)
+    labels = np.asarray(labels, dtype=float).reshape(-1)
+
+    return points, labelled_indices, labels
+
+def prepare_labels(indices, values, labelled_mask):
+    """Checks a batch of new labels for label_points against the mask of points which are
+    already labelled. Returns the indices as an integer array and the values as a float
+    array.
+    """
+
+    indices = np.asarray(indices, dtype=np.intp).reshape(-1)
+    values = np.asarray(values, dtype=float).reshape(-1)
+
+    if len(indices) != len(values):
+        raise ValueError('Indices and values must be the same length')
+
+    if len(indices) == 0:
+        return indices, values
+
+    if indices.min() < 0 or indices.max() >= len(labelled_mask):
+        raise ValueError('Index {} outside the data in the tree'.format(
+            indices[(indices < 0) | (indices >= len(labelled_mask))][0]))
+
+    if labelled_mask[indices].any():
+        raise ValueError('Point {} is already labelled'.format(
+            indices[labelled_mask[indices]][0]))
+
+    if len(np.unique(indices)) != len(indices):
+        raise ValueError('Each point can only be labelled once')
+
+    return indices, values
+
+def append_rows(store, num_rows, new_rows):
+    """Writes new_rows after the first num_rows rows of store, which is used as growable
+    storage. When store is full (or read only, e.g. a view of the caller's data) the rows
+    are moved to a new array of at least twice the size, so appending is amortized O(1)
+    per row. Returns the store, which may be a new array.
+    """
+
+    needed = num_rows + len(new_rows)
+    if needed > len(store) or not store.flags.writeable:
+        new_store = np.empty((max(needed, 2 * len(store)),) + store.shape[1:], dtype=store.dtype)
+        new_store[:num_rows] = store[:num_rows]
+        store = new_store
+    store[num_rows:needed] = new_rows
+    return store
+
+@contextlib.contextmanager
+def paused_gc():
+    """Turns the garbage collector off for the duration of a with block. Making a large
+    number of objects at once (e.g. copying every node of a tree) otherwise sets off many
+    collections, each of which goes over the whole heap.
+    """
+
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+def prepare_new_points(new_points, labels, num_dimensions):
+    """Checks a chunk of points for add_data_points. Returns the points as a 2 dim float
+    array and the labels as a float array, with NaN for the points without a label.
+    """
+
+    try:
+        new_points = np.asarray(new_points, dtype=float)
+    except (TypeError, ValueError):
+        raise ValueError('New points must be a 2 dim array of points')
+    if new_points.ndim != 2 or new_points.shape[1] != num_dimensions:
+        raise ValueError('New points must be a 2 dim array of points with {} columns'.format(
+            num_dimensions))
+
+    if labels is None:
+        labels = np.full(len(new_points), np.nan)
+    else:
+        if not isinstance(labels, np.ndarray):
+            labels = [np.nan if x is None else x for x in labels]
+        labels = np.asarray(labels, dtype=float)
+        if labels.shape != (len(new_points),):
+            raise ValueError('There must be one label (or None) for every new point')
+
+    return new_points, labels
@@ -78,23 +78,22 @@ def example_air_mf():
                 MT_al = Mondrian_Forest([[0,1]]*p, n_tree)
                 MT_al.update_life_time(n_final**(1/(2+p))-1, 
                     set_seeds=[n_tree*tree_seed + x for x in range(n_tree)])
-                MT_rn = copy.deepcopy(MT_al)
+                MT_rn = MT_al.fork()
 
                 # print(MT_al._num_leaves)
                 MT_al.input_data(X, range(n_start), y[:n_start])
 
                 MT_al.al_average_point_probabilities_adjustment(n_final)
 
-                MT_uc = copy.deepcopy(MT_al)
+                MT_uc = MT_al.fork()
 
                 new_labelled_points = list(np.random.choice(list(range(n)), 
                     p = MT_al._al_avg_weights_adjustment, size=n_final - n_start, replace = False))
-                for ind in new_labelled_points:
-                    MT_al.label_point(ind, y[ind])
+                MT_al.label_points(new_labelled_points, y[new_labelled_points])
 
                 with warnings.catch_warnings():
                     warnings.simplefilter("ignore")
-                    MT_al_preds = MT_al.predict(X_test)
+                    MT_al_preds = MT_al.predict_pool(cv_ind[n_start:])
                 MT_al_preds = np.array(MT_al_preds)
                 MT_al_MSE[n_final_ind] += sum(1/X_test.shape[0]*(y_test - MT_al_preds)**2)
 
@@ -106,7 +105,7 @@ def example_air_mf():
 
                 with warnings.catch_warnings():
                     warnings.simplefilter("ignore")
-                    MT_rn_preds = MT_rn.predict(X_test)
+                    MT_rn_preds = MT_rn.predict_pool(cv_ind[n_start:])
                 MT_rn_preds = np.array(MT_rn_preds)
                 MT_rn_MSE[n_final_ind] += sum(1/X_test.shape[0]*(y_test - MT_rn_preds)**2)
 
@@ -128,22 +127,18 @@ def example_air_mf():
                         tree.al_calculate_leaf_number_new_labels(n_final)
                         tree._al_proportions = [x / sum(tree._al_leaf_number_new_labels) for x in tree._al_leaf_number_new_labels]
                         tree.al_calculate_point_probabilities_adjustment(n_final)
-                        for ind, val in enumerate(tree._al_point_weights_adjustment):
-                            if val is None:
-                                tree._al_point_weights_adjustment[ind] = 0
 
-                    probs = probs + np.array(tree._al_point_weights_adjustment)
+                    probs = probs + tree._al_point_weights_adjustment
 
                 probs = probs / sum(probs)
 
                 new_labelled_points_uc = list(np.random.choice(list(range(n)), 
                     p = probs, size=n_final - n_start, replace = False))
-                for ind in new_labelled_points_uc:
-                    MT_uc.label_point(ind, y[ind])
+                MT_uc.label_points(new_labelled_points_uc, y[new_labelled_points_uc])
 
                 with warnings.catch_warnings():
                     warnings.simplefilter("ignore")
-                    MT_uc_preds = MT_uc.predict(X_test)
+                    MT_uc_preds = MT_uc.predict_pool(cv_ind[n_start:])
                 MT_uc_preds = np.array(MT_uc_preds)
                 MT_uc_MSE[n_final_ind] += sum(1/X_test.shape[0]*(y_test - MT_uc_preds)**2)
 
@@ -79,7 +79,7 @@ def example_het_mt():
 
                 MT_al = Mondrian_Tree([[0,1]]*p)
                 MT_al.update_life_time(n_final**(1/(2+p))-1, set_seed=tree_seed)
-                MT_rn = copy.deepcopy(MT_al)
+                MT_rn = MT_al.fork()
 
                 MT_al.input_data(X, range(n_start), y[:n_start])
                 MT_al.make_full_leaf_list()
@@ -90,7 +90,7 @@ def example_het_mt():
                 MT_al.al_calculate_leaf_proportions()
                 MT_al.al_calculate_leaf_number_new_labels(n_final)
 
-                MT_uc = copy.deepcopy(MT_al)
+                MT_uc = MT_al.fork()
 
                 new_labelled_points = []
                 for i, node in enumerate(MT_al._full_leaf_list):
@@ -102,15 +102,11 @@ def example_het_mt():
                     labels_to_add = node.pick_new_points(num_new_points,self_update = False, set_seed = tree_seed*i)
                     # print(labels_to_add)
                     new_labelled_points.extend(labels_to_add)
-                    for ind in labels_to_add:
-                        MT_al.label_point(ind, y[ind])
+                    MT_al.label_points(labels_to_add, y[labels_to_add])
 
                 MT_al.set_default_pred_global_mean()
 
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    MT_al_preds = MT_al.predict(X_test)
-                MT_al_preds = np.array(MT_al_preds)
+                MT_al_preds, _ = MT_al.predict_points(X_test)
                 MT_al_MSE[n_final_ind] += sum(1/X_test.shape[0]*(y_test - MT_al_preds)**2)
 
                 # print('Done MT_al')
@@ -119,10 +115,7 @@ def example_het_mt():
 
                 MT_rn.input_data(X, range(n_final), y[:n_final])
                 MT_rn.set_default_pred_global_mean()
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    MT_rn_preds = MT_rn.predict(X_test)
-                MT_rn_preds = np.array(MT_rn_preds)
+                MT_rn_preds, _ = MT_rn.predict_points(X_test)
                 MT_rn_MSE[n_final_ind] += sum(1/X_test.shape[0]*(y_test - MT_rn_preds)**2)
 
                 # print('Done MT_rn')
@@ -147,15 +140,11 @@ def example_het_mt():
                     labels_to_add = node.pick_new_points(num_new_points,self_update = False, set_seed = tree_seed*i)
                     
                     new_labelled_points_uc.extend(labels_to_add)
-                    for ind in labels_to_add:
-                        MT_uc.label_point(ind, y[ind])
+                    MT_uc.label_points(labels_to_add, y[labels_to_add])
 
                 MT_uc.set_default_pred_global_mean()
 
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    MT_uc_preds = MT_uc.predict(X_test)
-                MT_uc_preds = np.array(MT_uc_preds)
+                MT_uc_preds, _ = MT_uc.predict_points(X_test)
                 MT_uc_MSE[n_final_ind] += sum(1/X_test.shape[0]*(y_test - MT_uc_preds)**2)
 
                 # BT_al
@@ -2,6 +2,8 @@ import unittest
 import math
 import random
 import warnings
+import copy
+import pickle
 
 import numpy as np
 
@@ -89,6 +91,25 @@ class test_Mondrian_Forest(unittest.TestCase):
             leaf = tree._root.leaf_for_point(self.data[self.n_labelled])
             self.assertTrue(self.n_labelled in leaf.labelled_index)
 
+    def test_label_points(self):
+        mf2 = Mondrian_Forest(self.linear_dims, self.n_tree)
+        for forest in [self.mf, mf2]:
+            forest.update_life_time(0.5, set_seeds=list(range(self.n_tree)))
+            forest.input_data(self.data, self.labelled_indices, self.labels)
+        indices = list(range(self.n_labelled, self.n_points, 7))
+        values = [i / self.n_points for i in indices]
+        self.mf.label_points(indices, values)
+        for ind, val in zip(indices, values):
+            mf2.label_point(ind, val)
+        self.assertEqual(self.mf._num_labelled, mf2._num_labelled)
+        self.assertEqual(self.mf.labelled_mask.tolist(), mf2.labelled_mask.tolist())
+        for tree, tree2 in zip(self.mf.tree_list, mf2.tree_list):
+            self.assertTrue(tree.labels is self.mf.labels)
+            self.assertEqual(tree._num_labelled, tree2._num_labelled)
+            for leaf, leaf2 in zip(tree._leaves(), tree2._leaves()):
+                self.assertEqual(leaf.labelled_index, leaf2.labelled_index)
+        np.testing.assert_allclose(self.mf.predict(self.data), mf2.predict(self.data), atol=1e-12)
+
     def test_add_data_point(self):
         lbda = 1
         self.mf.input_data(self.data, self.labelled_indices, self.labels)
@@ -97,7 +118,7 @@ class test_Mondrian_Forest(unittest.TestCase):
         self.assertEqual(self.mf._num_points, self.n_points + 1)
         self.assertEqual(self.data + [[1]*self.d], self.mf.points)
         self.assertEqual(self.labels + [None] * (self.n_points - self.n_labelled) + 
-            [None], self.mf.labels)
+            [None], np.where(self.mf.labelled_mask, self.mf.labels, None).tolist())
         for tree in self.mf.tree_list:
             leaf = tree._root.leaf_for_point([1]*self.d)
             self.assertEqual(leaf.unlabelled_index[-1],self.n_points)
@@ -113,12 +134,32 @@ class test_Mondrian_Forest(unittest.TestCase):
         self.assertEqual(self.mf._num_labelled, self.n_labelled + 1)
         self.assertEqual(self.data + [[1]*self.d], self.mf.points)
         self.assertEqual(self.labels + [None] * (self.n_points - self.n_labelled) + 
-            [val], self.mf.labels)
+            [val], np.where(self.mf.labelled_mask, self.mf.labels, None).tolist())
         for tree in self.mf.tree_list:
             leaf = tree._root.leaf_for_point([1]*self.d)
             self.assertEqual(leaf.labelled_index[-1],self.n_points)
             self.assertEqual(len(tree.points), tree._num_points)
 
+    def test_add_data_points(self):
+        mf2 = Mondrian_Forest(self.linear_dims, self.n_tree)
+        for forest in [self.mf, mf2]:
+            forest.update_life_time(0.5, set_seeds=list(range(self.n_tree)))
+            forest.input_data(self.data, self.labelled_indices, self.labels)
+        new_points = np.random.RandomState(1).rand(20, self.d)
+        new_labels = [None if i % 2 else i / 20 for i in range(20)]
+        self.mf.add_data_points(new_points, new_labels)
+        for point, label in zip(new_points.tolist(), new_labels):
+            mf2.add_data_point(point, label)
+        self.assertEqual(self.mf._num_points, self.n_points + 20)
+        self.assertEqual(self.mf._num_labelled, mf2._num_labelled)
+        self.assertEqual(self.mf.points, mf2.points)
+        for tree, tree2 in zip(self.mf.tree_list, mf2.tree_list):
+            self.assertTrue(tree.labels is self.mf.labels)
+            self.assertEqual(tree._num_points, self.mf._num_points)
+            self.assertEqual(tree._point_leaf.tolist(), tree2._point_leaf.tolist())
+            self.assertEqual(tree._leaf_num_points.tolist(), tree2._leaf_num_points.tolist())
+        np.testing.assert_allclose(self.mf.predict(self.data), mf2.predict(self.data), atol=1e-12)
+
     ###########################################
 
     # testing using the tree
@@ -182,7 +223,202 @@ class test_Mondrian_Forest(unittest.TestCase):
         self.mf.al_average_point_probabilities_adjustment(21)
         self.assertAlmostEqual(sum(self.mf._al_avg_weights_adjustment),1)
 
+    ###########################################
+
+    # Flat engine
+
+    def test_flat_engine_forest(self):
+        lbda = 0.5
+        mf_flat = Mondrian_Forest(self.linear_dims, self.n_tree, engine='flat')
+        for forest in [self.mf, mf_flat]:
+            forest.update_life_time(lbda, set_seeds=list(range(self.n_tree)))
+            forest.input_data(self.data, self.labelled_indices, self.labels)
+            forest.add_data_point([1]*self.d, 1)
+        for tree in mf_flat.tree_list:
+            self.assertEqual(tree._engine, 'flat')
+        self.assertEqual(mf_flat.predict(self.data), self.mf.predict(self.data))
+
+    def test_lazy_forest(self):
+        mf = Mondrian_Forest(self.linear_dims, self.n_tree, growth='lazy')
+        mf.update_life_time(2, set_seeds=list(range(self.n_tree)))
+        mf.input_data(self.data, self.labelled_indices, self.labels)
+        mf.add_data_point([1]*self.d, 1)
+        for tree in mf.tree_list:
+            leaf = tree._leaf_for_point([1]*self.d)
+            self.assertEqual(leaf.labelled_index[-1], self.n_points)
+            self.assertTrue(leaf.leaf_id not in tree._pending_leaves)
+            self.assertEqual(tree._point_leaf.tolist(), tree.leaf_for_points(mf.points).tolist())
+
+    def test_al_average_point_probabilities_adjustment_array(self):
+        self.mf.update_life_time(0.5, set_seeds=list(range(self.n_tree)))
+        self.mf.input_data(self.data, self.labelled_indices, self.labels)
+        avg_weights = self.mf.al_average_point_probabilities_adjustment(30)
+        self.assertTrue(avg_weights is self.mf._al_avg_weights_adjustment)
+        self.assertEqual(avg_weights.shape, (self.n_points,))
+        check = [0]*self.n_points
+        for tree in self.mf.tree_list:
+            for i, val in enumerate(tree._al_point_weights_adjustment):
+                check[i] += val
+        self.assertEqual(avg_weights.tolist(), [x/self.n_tree for x in check])
+
+    def test_predict_batched_matches_trees(self):
+        self.mf.update_life_time(0.5, set_seeds=list(range(self.n_tree)))
+        self.mf.input_data(self.data, self.labelled_indices, self.labels)
+        new_points = np.random.RandomState(0).rand(50, self.d)
+        preds = self.mf.predict(new_points)
+        check = np.zeros(50)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            for tree in self.mf.tree_list:
+                check += np.array([tree.predict(point.tolist()) for point in new_points])
+        self.assertEqual(preds, (check / self.n_tree).tolist())
+        self.assertEqual(self.mf.predict(new_points, n_threads=3), preds)
+        self.assertEqual(self.mf.predict(new_points.tolist()), preds)
 
+    def test_predict_batched_empty_leaf_default(self):
+        self.mf.update_life_time(3, set_seeds=list(range(self.n_tree)))
+        self.mf.input_data(self.data, [0], self.labels[:1])
+        with self.assertWarns(UserWarning):
+            preds = self.mf.predict(self.data)
+        self.assertEqual(preds, [self.labels[0]]*self.n_points)
+
+    def test_predict_pool(self):
+        self.mf.update_life_time(2, set_seeds=list(range(self.n_tree)))
+        self.mf.input_data(self.data, self.labelled_indices, self.labels)
+        indices = list(range(self.n_points - 1, -1, -2))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            preds = self.mf.predict_pool(indices)
+            self.assertEqual(preds, self.mf.predict(np.array(self.data)[indices]))
+            self.assertEqual(self.mf.predict_pool(indices, n_threads=3), preds)
+
+    def test_predict_points(self):
+        self.mf.update_life_time(3, set_seeds=list(range(self.n_tree)))
+        self.mf.input_data(self.data, self.labelled_indices, self.labels)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            preds, fallback = self.mf.predict_points(self.data)
+            self.assertEqual(caught, [])
+            self.assertEqual(preds.tolist(), self.mf.predict(self.data))
+        empties = [tree.predict_points(self.data)[1] for tree in self.mf.tree_list]
+        self.assertEqual(fallback.tolist(), np.any(empties, axis=0).tolist())
+
+        preds, fallback = self.mf.predict_points(self.data, fallback='parent_mean', n_threads=2)
+        check = sum(tree.predict_points(self.data, fallback='parent_mean')[0] 
+            for tree in self.mf.tree_list)
+        self.assertTrue(np.allclose(preds, check / self.n_tree))
+
+    def test_update_life_time_n_jobs(self):
+        forests = []
+        for n_jobs in [1, 3]:
+            for growth in ['walk', 'top_down']:
+                mf = Mondrian_Forest(self.linear_dims, self.n_tree, growth=growth, n_jobs=n_jobs)
+                mf.update_life_time(0.5, set_seeds=list(range(self.n_tree)))
+                mf.input_data(self.data, self.labelled_indices, self.labels)
+                random.seed(1)
+                mf.update_life_time(1)
+                forests.append(mf)
+        for mf_serial, mf_parallel in zip(forests[:2], forests[2:]):
+            self.assertEqual(mf_serial.predict(self.data), mf_parallel.predict(self.data))
+            for tree_serial, tree_parallel in zip(mf_serial.tree_list, mf_parallel.tree_list):
+                self.assertEqual(tree_serial._num_leaves, tree_parallel._num_leaves)
+                self.assertEqual(tree_serial._point_leaf.tolist(), tree_parallel._point_leaf.tolist())
+                self.assertTrue(tree_parallel.labels is mf_parallel.labels)
+
+    def test_update_life_time_independent_trees(self):
+        mf = Mondrian_Forest(self.linear_dims, self.n_tree)
+        mf.update_life_time(1, set_seeds=[5]*self.n_tree)
+        for tree in mf.tree_list:
+            self.assertEqual(tree._num_leaves, mf.tree_list[0]._num_leaves)
+            self.assertEqual(tree.leaf_for_points(self.data).tolist(), 
+                mf.tree_list[0].leaf_for_points(self.data).tolist())
+
+    def test_input_data_shared(self):
+        self.mf.update_life_time(0.5, set_seeds=list(range(self.n_tree)))
+        preds = copy.deepcopy(self.mf)
+        preds.input_data(self.data, self.labelled_indices, self.labels)
+        self.mf.input_data(self.data, self.labelled_indices, self.labels, shared=True)
+        self.assertEqual(self.mf.predict(self.data), preds.predict(self.data))
+        for tree in self.mf.tree_list:
+            self.assertTrue(tree._points_array is self.mf._points_array)
+
+        # Pickling sends a handle to the points, not the points themselves
+        pickled = pickle.dumps(self.mf)
+        unpickled = pickle.loads(pickled)
+        self.assertTrue(len(pickled) < len(pickle.dumps(preds)))
+        self.assertEqual(unpickled.predict(self.data), preds.predict(self.data))
+        for tree in unpickled.tree_list:
+            self.assertTrue(tree._points_array is unpickled._points_array)
+
+        # Growing in a process pool and adding points still work
+        self.mf._n_jobs = 2
+        self.mf.update_life_time(1, set_seeds=list(range(self.n_tree)))
+        preds.update_life_time(1, set_seeds=list(range(self.n_tree)))
+        self.mf.add_data_point([1]*self.d, 1)
+        preds.add_data_point([1]*self.d, 1)
+        self.assertEqual(self.mf.predict(self.data), preds.predict(self.data))
+        self.assertEqual(self.mf.points[-1], [1]*self.d)
+
+    def test_fork(self):
+        self.mf.update_life_time(self.n_tree, set_seeds=list(range(self.n_tree)))
+        self.mf.input_data(self.data, self.labelled_indices, self.labels)
+        preds = self.mf.predict(self.data)
+        ref = copy.deepcopy(self.mf)
+
+        fork = self.mf.fork()
+        fork.label_points([20, 30], [0.1, 0.2])
+        fork.label_point(40, 0.3)
+        fork.add_data_point([0.5]*self.d, 1)
+        ref.label_points([20, 30], [0.1, 0.2])
+        ref.label_point(40, 0.3)
+        ref.add_data_point([0.5]*self.d, 1)
+
+        self.assertEqual(self.mf.predict(self.data), preds)
+        self.assertEqual(self.mf._num_points, self.n_points)
+        self.assertEqual(fork.predict(self.data), ref.predict(self.data))
+        for forest in [self.mf, fork]:
+            for tree in forest.tree_list:
+                self.assertTrue(tree.labels is forest.labels)
+                self.assertTrue(tree._points_array is forest._points_array)
+
+    def test_predict_life_times(self):
+        self.mf.update_life_time(4, set_seeds=list(range(self.n_tree)))
+        self.mf.input_data(self.data, self.labelled_indices, self.labels)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            preds = self.mf.predict_life_times(self.data, [1, 4])
+            for i, life_time in enumerate([1, 4]):
+                mf = Mondrian_Forest(self.linear_dims, self.n_tree)
+                mf.update_life_time(life_time, set_seeds=list(range(self.n_tree)))
+                mf.input_data(self.data, self.labelled_indices, self.labels)
+                self.assertEqual(preds[i].tolist(), mf.predict(self.data))
+                self.assertEqual(self.mf.truncate(life_time).predict(self.data), mf.predict(self.data))
+        self.assertEqual(self.mf._life_time, 4)
+
+    def test_life_time_error_curve(self):
+        self.mf.update_life_time(4, set_seeds=list(range(self.n_tree)))
+        self.mf.input_data(self.data[:80], range(80), [x[0] + x[1] for x in self.data[:80]])
+        val_points = self.data[80:]
+        val_labels = np.array([x[0] + x[1] for x in val_points])
+        life_times, errors = self.mf.life_time_error_curve(val_points, val_labels, 
+            num_life_times=10)
+        self.assertEqual(len(errors), 10)
+        preds = np.array(self.mf.predict(val_points))
+        self.assertAlmostEqual(errors[-1], ((preds - val_labels)**2).mean())
+        preds = np.array(self.mf.truncate(life_times[2]).predict(val_points))
+        self.assertAlmostEqual(errors[2], ((preds - val_labels)**2).mean())
+
+    def test_loo_residuals(self):
+        self.mf.update_life_time(1, set_seeds=list(range(self.n_tree)))
+        self.mf.input_data(self.data, self.labelled_indices, self.labels)
+        self.mf.label_points([30, 40], [0.2, 0.3])
+        preds = np.zeros(self.n_labelled + 2)
+        for tree in self.mf.tree_list:
+            preds += self.mf.labels[self.mf.labelled_mask] - tree.loo_residuals()
+        residuals = self.mf.loo_residuals()
+        self.assertTrue(np.allclose(residuals, 
+            self.mf.labels[self.mf.labelled_mask] - preds / self.n_tree))
+        self.assertAlmostEqual(self.mf.loo_error(), (residuals**2).mean())
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
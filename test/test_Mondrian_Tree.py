@@ -1,7 +1,9 @@
 import unittest
 import math
+import copy
 import random
 import warnings
+import itertools
 import numpy as np
 
 import core.utils as utils
@@ -87,14 +89,14 @@ class test_Mondrian_Tree(unittest.TestCase):
     def test_input_data_root_no_labels(self):
         self.mt1.input_data([[0]*self.d],[],[])
         self.assertEqual(self.mt1._num_points,1)
-        self.assertEqual(self.mt1.labels,[None])
+        self.assertEqual(np.where(self.mt1.labelled_mask, self.mt1.labels, None).tolist(),[None])
         self.assertEqual(self.mt1._root.unlabelled_index,[0])
         self.assertEqual(self.mt1._root.labelled_index,[])
 
     def test_input_data_root_labels(self):
         self.mt1.input_data([[0]*self.d],[0],[3.141])
         self.assertEqual(self.mt1._num_points,1)
-        self.assertEqual(self.mt1.labels,[3.141])
+        self.assertEqual(np.where(self.mt1.labelled_mask, self.mt1.labels, None).tolist(),[3.141])
         self.assertEqual(self.mt1._root.unlabelled_index,[])
         self.assertEqual(self.mt1._root.labelled_index,[0])
 
@@ -184,6 +186,27 @@ class test_Mondrian_Tree(unittest.TestCase):
                     self.assertTrue(point[dim] >= linear_dims[dim][0])
                     self.assertTrue(point[dim] <= linear_dims[dim][1])
 
+    def test_input_data_array_no_copy(self):
+        data = np.array(self.data)
+        self.mt1.update_life_time(0.5, set_seed=1)
+        self.mt1.input_data(data, np.arange(self.n_labelled), np.array(self.labels))
+        self.assertTrue(np.shares_memory(self.mt1._points_array, data))
+        self.assertFalse(self.mt1._points_array.flags.writeable)
+        self.assertTrue(data.flags.writeable)
+        self.assertEqual(self.mt1.points, self.data)
+        self.assertEqual(np.where(self.mt1.labelled_mask, self.mt1.labels, None).tolist(), 
+            self.labels + [None]*(self.n_points - self.n_labelled))
+        self.assertEqual(self.mt1._point_leaf.tolist(), self.mt1.leaf_for_points(data).tolist())
+
+        self.mt1.input_data(data, [], [], copy_data=True)
+        self.assertFalse(np.shares_memory(self.mt1._points_array, data))
+
+    def test_input_data_bad_shape(self):
+        with self.assertRaises(ValueError):
+            self.mt1.input_data(np.zeros([10, self.d + 1]), [], [])
+        with self.assertRaises(ValueError):
+            self.mt1.input_data([[0]*self.d, [0]*(self.d + 1)], [], [])
+
 
     def test_label_point_root(self):
         val = 1
@@ -216,6 +239,86 @@ class test_Mondrian_Tree(unittest.TestCase):
         # print(leaf.labelled_index)
         self.assertTrue(self.n_labelled in leaf.labelled_index)
 
+    def test_label_points(self):
+        self.mt1.update_life_time(1, set_seed=1)
+        self.mt1.input_data(self.data, self.labelled_indices, self.labels)
+        mt2 = Mondrian_Tree(self.linear_dims)
+        mt2.update_life_time(1, set_seed=1)
+        mt2.input_data(self.data, self.labelled_indices, self.labels)
+
+        indices = [50, 21, 99, 35, 60]
+        values = [0.1, 0.7, 0.3, 0.9, 0.5]
+        self.mt1.label_points(np.array(indices), np.array(values))
+        for ind, val in zip(indices, values):
+            mt2.label_point(ind, val)
+
+        self.assertEqual(self.mt1.labels[self.mt1.labelled_mask].tolist(), 
+            mt2.labels[mt2.labelled_mask].tolist())
+        self.assertEqual(self.mt1._num_labelled, self.n_labelled + len(indices))
+        for leaf, leaf2 in zip(self.mt1._leaves(), mt2._leaves()):
+            self.assertEqual(leaf.labelled_index, leaf2.labelled_index)
+            self.assertEqual(leaf.unlabelled_index, leaf2.unlabelled_index)
+        for name in ['_leaf_num_labelled', '_leaf_label_mean', '_leaf_label_m2']:
+            np.testing.assert_allclose(getattr(self.mt1, name), getattr(mt2, name), atol=1e-12)
+        for tree in [self.mt1, mt2]:
+            tree.al_set_default_var_global_var()
+            tree.make_full_leaf_list()
+            tree.make_full_leaf_var_list()
+        self.assertAlmostEqual(self.mt1.al_default_var, mt2.al_default_var)
+        np.testing.assert_allclose(self.mt1._full_leaf_var_list, mt2._full_leaf_var_list, atol=1e-12)
+
+    def test_label_points_bad(self):
+        with self.assertRaises(RuntimeError):
+            self.mt1.label_points([0], [1])
+        self.mt1.input_data(self.data, self.labelled_indices, self.labels)
+        for indices, values in [([0], [1]), ([30, 30], [1, 2]), ([self.n_points], [1]), 
+            ([30, 31], [1])]:
+            with self.assertRaises(ValueError):
+                self.mt1.label_points(indices, values)
+        self.assertEqual(self.mt1._num_labelled, self.n_labelled)
+        self.mt1.label_points([], [])
+        self.assertEqual(self.mt1._num_labelled, self.n_labelled)
+
+    def test_add_data_points(self):
+        data = np.array(self.data)
+        self.mt1.update_life_time(1, set_seed=1)
+        self.mt1.input_data(data, self.labelled_indices, self.labels)
+        mt2 = Mondrian_Tree(self.linear_dims)
+        mt2.update_life_time(1, set_seed=1)
+        mt2.input_data(self.data, self.labelled_indices, self.labels)
+
+        new_points = np.random.RandomState(1).rand(30, self.d)
+        new_labels = [None if i % 3 else i / 30 for i in range(30)]
+        self.mt1.add_data_points(new_points[:10], new_labels[:10])
+        self.mt1.add_data_points(new_points[10:])
+        for point, label in zip(new_points.tolist(), new_labels[:10] + [None]*20):
+            mt2.add_data_point(point, label)
+
+        self.assertEqual(self.mt1._num_points, self.n_points + 30)
+        self.assertEqual(self.mt1._num_labelled, mt2._num_labelled)
+        self.assertEqual(self.mt1._points_array.tolist(), mt2._points_array.tolist())
+        self.assertEqual(self.mt1.labelled_mask.tolist(), mt2.labelled_mask.tolist())
+        self.assertEqual(self.mt1._point_leaf.tolist(), 
+            self.mt1.leaf_for_points(self.mt1._points_array).tolist())
+        self.assertEqual(self.mt1._point_leaf.tolist(), mt2._point_leaf.tolist())
+        for leaf, leaf2 in zip(self.mt1._leaves(), mt2._leaves()):
+            self.assertEqual(leaf.labelled_index, leaf2.labelled_index)
+            self.assertEqual(leaf.unlabelled_index, leaf2.unlabelled_index)
+        self.assertEqual(self.mt1._leaf_num_points.tolist(), mt2._leaf_num_points.tolist())
+        np.testing.assert_allclose(self.mt1._leaf_label_mean, mt2._leaf_label_mean, atol=1e-12)
+
+        # The caller's array is left alone and the storage grows by doubling
+        self.assertEqual(data.tolist(), self.data)
+        self.assertTrue(len(self.mt1._points_store) >= 2 * self.n_points)
+
+    def test_add_data_points_bad(self):
+        with self.assertRaises(ValueError):
+            self.mt1.add_data_points(np.zeros([3, self.d + 1]))
+        with self.assertRaises(ValueError):
+            self.mt1.add_data_points(np.zeros([3, self.d]), [1, 2])
+        self.mt1.add_data_points(np.zeros([0, self.d]))
+        self.assertEqual(self.mt1._num_points, 0)
+
     def test_add_data_point_bad(self):
         with self.assertRaises(TypeError):
             self.mt1.add_data_point(1)
@@ -223,14 +326,14 @@ class test_Mondrian_Tree(unittest.TestCase):
     def test_add_data_point_empty(self):
         self.mt1.add_data_point([1]*self.d)
         self.assertEqual([[1]*self.d], self.mt1.points)
-        self.assertEqual([None], self.mt1.labels)
+        self.assertEqual([None], np.where(self.mt1.labelled_mask, self.mt1.labels, None).tolist())
         self.assertEqual(self.mt1._root.unlabelled_index,[0])
         self.assertEqual(self.mt1._root.labelled_index,[])
 
     def test_add_data_point_empty_2(self):
         self.mt1.add_data_point([1]*self.d,2)
         self.assertEqual([[1]*self.d], self.mt1.points)
-        self.assertEqual([2], self.mt1.labels)
+        self.assertEqual([2], np.where(self.mt1.labelled_mask, self.mt1.labels, None).tolist())
         self.assertEqual(self.mt1._root.unlabelled_index,[])
         self.assertEqual(self.mt1._root.labelled_index,[0])
 
@@ -243,7 +346,7 @@ class test_Mondrian_Tree(unittest.TestCase):
         self.mt1.add_data_point([1]*self.d)
         self.assertEqual(self.data + [[1]*self.d], self.mt1.points)
         self.assertEqual(self.labels + [None] * (self.n_points - self.n_labelled) + 
-            [None], self.mt1.labels)
+            [None], np.where(self.mt1.labelled_mask, self.mt1.labels, None).tolist())
         leaf = self.mt1._root.leaf_for_point([1]*self.d)
         self.assertEqual(leaf.unlabelled_index[-1],self.n_points)
         self.assertEqual(len(self.mt1.points), self.mt1._num_points)
@@ -257,7 +360,7 @@ class test_Mondrian_Tree(unittest.TestCase):
         self.mt1.add_data_point([1]*self.d,1)
         self.assertEqual(self.data + [[1]*self.d], self.mt1.points)
         self.assertEqual(self.labels + [None] * (self.n_points - self.n_labelled) + 
-            [1], self.mt1.labels)
+            [1], np.where(self.mt1.labelled_mask, self.mt1.labels, None).tolist())
         leaf = self.mt1._root.leaf_for_point([1]*self.d)
         self.assertEqual(leaf.labelled_index[-1],self.n_points)
         self.assertEqual(len(self.mt1.points), self.mt1._num_points)
@@ -629,6 +732,23 @@ class test_Mondrian_Tree(unittest.TestCase):
         self.mt1.al_set_default_var_global_var()
         self.assertEqual(self.mt1.al_default_var, utils.unbiased_var(self.labels))
 
+    def test_global_label_stats_running(self):
+        self.mt1.update_life_time(0.5, set_seed=1)
+        self.mt1.input_data(np.array(self.data), self.labelled_indices, np.array(self.labels))
+        all_labels = list(self.labels)
+        for i in range(self.n_labelled, self.n_labelled + 10):
+            self.mt1.label_point(i, i / self.n_points)
+            all_labels.append(i / self.n_points)
+        self.mt1.add_data_point([0.5]*self.d, 2)
+        all_labels.append(2)
+        self.assertEqual(self.mt1._num_labelled, len(all_labels))
+        self.assertEqual(self.mt1.labelled_mask.sum(), len(all_labels))
+        self.assertEqual(self.mt1.labels[self.mt1.labelled_mask].tolist(), all_labels)
+        self.mt1.set_default_pred_global_mean()
+        self.mt1.al_set_default_var_global_var()
+        self.assertAlmostEqual(self.mt1.prediction_default_value, sum(all_labels)/len(all_labels))
+        self.assertAlmostEqual(self.mt1.al_default_var, utils.unbiased_var(all_labels))
+
     ###########################################
 
     # Testing active learning parts
@@ -744,14 +864,14 @@ class test_Mondrian_Tree(unittest.TestCase):
         with self.assertWarns(UserWarning):
             self.mt1.al_calculate_leaf_proportions()
             self.mt1.al_calculate_point_probabilities_proportions()
-        self.assertEqual(self.mt1._al_point_weights_proportional,[])
+        self.assertEqual(self.mt1._al_point_weights_proportional.tolist(),[])
 
     def test_al_calculate_point_probabilities_proportions_root(self):
         self.mt1.input_data(self.data, self.labelled_indices, self.labels)
         self.mt1.al_calculate_leaf_proportions()
         self.mt1.al_calculate_point_probabilities_proportions()
-        self.assertEqual(self.mt1._al_point_weights_proportional,
-            [None] * 20 + [1/(self.n_points - self.n_labelled)] * 
+        self.assertEqual(self.mt1._al_point_weights_proportional.tolist(),
+            [0] * 20 + [1/(self.n_points - self.n_labelled)] * 
             (self.n_points - self.n_labelled))
 
     def test_al_calculate_point_probabilities_proportions(self):
@@ -779,9 +899,8 @@ class test_Mondrian_Tree(unittest.TestCase):
         self.mt1.input_data(self.data, self.labelled_indices, self.labels)
         self.mt1.al_calculate_leaf_proportions()
         self.mt1.al_calculate_point_probabilities_adjustment(21)
-        for val in self.mt1._al_point_weights_adjustment:
-            if val is not None:  
-                self.assertAlmostEqual(val,1/(self.n_points - self.n_labelled))
+        for val in self.mt1._al_point_weights_adjustment[self.n_labelled:]:
+            self.assertAlmostEqual(val,1/(self.n_points - self.n_labelled))
 
     def test_al_calculate_point_probabilities_adjustment(self):
 
@@ -864,5 +983,700 @@ class test_Mondrian_Tree(unittest.TestCase):
         # print(SST, SSE)
         self.assertTrue(SST > SSE)
 
+    ###########################################
+
+    # Testing the flat (array backed) engine
+
+    def test_flat_engine_bad_engine(self):
+        with self.assertRaises(ValueError):
+            Mondrian_Tree(self.linear_dims, engine='bad')
+
+    def test_flat_engine_same_tree_as_node_engine(self):
+        mt_flat = Mondrian_Tree(self.linear_dims, engine='flat')
+        for tree in [self.mt1, mt_flat]:
+            tree.input_data(self.data, self.labelled_indices, self.labels)
+            tree.update_life_time(1, set_seed=1)
+            tree.make_full_leaf_list()
+        self.assertEqual(mt_flat._num_leaves, self.mt1._num_leaves)
+        self.assertIsNone(mt_flat._root)
+        for node, flat_leaf in zip(self.mt1._full_leaf_list, mt_flat._full_leaf_list):
+            self.assertEqual(node.linear_dims, flat_leaf.linear_dims)
+            self.assertEqual(node.labelled_index, flat_leaf.labelled_index)
+            self.assertEqual(node.unlabelled_index, flat_leaf.unlabelled_index)
+
+    def test_flat_engine_label_and_predict(self):
+        mt_flat = Mondrian_Tree(self.linear_dims, engine='flat')
+        for tree in [self.mt1, mt_flat]:
+            tree.update_life_time(0.5, set_seed=100)
+            tree.input_data(self.data, self.labelled_indices, self.labels)
+            tree.label_point(self.n_labelled, 2)
+            tree.add_data_point([0.5]*self.d, 1)
+        self.assertEqual(mt_flat.predict(self.data), self.mt1.predict(self.data))
+        self.assertEqual(
+            mt_flat.get_points_in_same_leaf(self.data[self.n_labelled]),
+            self.mt1.get_points_in_same_leaf(self.data[self.n_labelled]))
+
+    def test_flat_engine_al(self):
+        mt_flat = Mondrian_Tree(self.linear_dims, engine='flat')
+        for tree in [self.mt1, mt_flat]:
+            tree.update_life_time(0.5, set_seed=1)
+            tree.input_data(self.data, self.labelled_indices, self.labels)
+            tree.al_calculate_leaf_proportions()
+            tree.al_calculate_point_probabilities_adjustment(40)
+        self.assertEqual(mt_flat._al_proportions, self.mt1._al_proportions)
+        self.assertEqual(mt_flat._al_leaf_number_new_labels, self.mt1._al_leaf_number_new_labels)
+        self.assertEqual(mt_flat._al_point_weights_adjustment.tolist(),
+            self.mt1._al_point_weights_adjustment.tolist())
+
+    ###########################################
+
+    # Testing vectorized routing
+
+    def test_leaf_for_points(self):
+        mt_flat = Mondrian_Tree(self.linear_dims, engine='flat')
+        for tree in [self.mt1, mt_flat]:
+            tree.update_life_time(1, set_seed=1)
+            leaf_ids = tree.leaf_for_points(np.array(self.data))
+            for point, leaf_id in zip(self.data, leaf_ids):
+                self.assertEqual(tree._leaf_for_point(point).leaf_id, leaf_id)
+        self.assertEqual(mt_flat.leaf_for_points(self.data).tolist(), 
+            self.mt1.leaf_for_points(self.data).tolist())
+
+    def test_leaf_for_points_bad_shape(self):
+        with self.assertRaises(ValueError):
+            self.mt1.leaf_for_points([[0.5]*(self.d + 1)])
+
+    def test_predict_numpy_matrix(self):
+        self.mt1.update_life_time(0.5, set_seed=100)
+        self.mt1.input_data(np.array(self.data), self.labelled_indices, self.labels)
+        preds = self.mt1.predict(np.array(self.data))
+        self.assertEqual(preds, [self.mt1.predict(point) for point in self.data])
+
+    def test_predict_multi_values_empty_leaf(self):
+        self.mt1.update_life_time(2, set_seed=1)
+        self.mt1.input_data(self.data, self.labelled_indices, self.labels)
+        self.mt1.prediction_default_value = -1
+        with self.assertWarns(UserWarning):
+            preds = self.mt1.predict(self.data)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            self.assertEqual(preds, [self.mt1.predict(point) for point in self.data])
+        self.assertTrue(-1 in preds)
+
+    def test_predict_pool(self):
+        for engine in ['node', 'flat']:
+            mt = Mondrian_Tree(self.linear_dims, engine=engine)
+            mt.update_life_time(1, set_seed=1)
+            mt.input_data(self.data, self.labelled_indices, self.labels)
+            mt.update_life_time(2, set_seed=2)
+            mt.add_data_points([[0.5]*self.d, [0.1]*self.d], [0.7, None])
+            indices = [3, self.n_points + 1, 50, 3, 0]
+            points = [mt.points[i] for i in indices]
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                self.assertEqual(mt.predict_pool(indices), mt.predict(points))
+            self.assertEqual(mt.predict_pool([]), [])
+            with self.assertRaises(ValueError):
+                mt.predict_pool([self.n_points + 2])
+            with self.assertRaises(ValueError):
+                mt.predict_pool([-1])
+        with self.assertRaises(RuntimeError):
+            self.mt1.predict_pool([0])
+
+    def test_predict_points(self):
+        trees = {}
+        for engine in ['node', 'flat']:
+            mt = Mondrian_Tree(self.linear_dims, engine=engine)
+            mt.update_life_time(3, set_seed=1)
+            mt.input_data(self.data, self.labelled_indices, self.labels)
+            mt.prediction_default_value = -1
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                preds = {fallback: mt.predict_points(self.data, fallback=fallback) 
+                    for fallback in ['global_mean', 'parent_mean', 'default']}
+                self.assertEqual(caught, [])
+                check = mt.predict(self.data)
+
+            empty = preds['default'][1]
+            self.assertTrue(empty.any() and not empty.all())
+            self.assertEqual(preds['default'][0].tolist(), check)
+            self.assertEqual(empty.tolist(), [pred == -1 for pred in check])
+            global_preds = preds['global_mean'][0]
+            self.assertEqual(global_preds[~empty].tolist(), preds['default'][0][~empty].tolist())
+            self.assertTrue(np.allclose(global_preds[empty], np.mean(self.labels)))
+            trees[engine] = (mt, preds['parent_mean'][0])
+        with self.assertRaises(ValueError):
+            self.mt1.predict_points(self.data, fallback='bad')
+
+        mt, parent_preds = trees['node']
+        self.assertEqual(parent_preds.tolist(), trees['flat'][1].tolist())
+        for i, leaf_id in enumerate(mt.leaf_for_points(self.data)):
+            node = mt._leaf_nodes[leaf_id]
+            labelled = node.labelled_index
+            while len(labelled) == 0:
+                node = node.parent_node
+                labelled = [j for leaf in mt._subtree_leaves(node) for j in leaf.labelled_index]
+            self.assertAlmostEqual(parent_preds[i], np.mean(mt.labels[labelled]))
+
+    ###########################################
+
+    # Testing growth with the Fenwick tree leaf sampler
+
+    def test_fenwick_bad_growth(self):
+        with self.assertRaises(ValueError):
+            Mondrian_Tree(self.linear_dims, growth='bad')
+
+    def test_fenwick_leaf_weights(self):
+        for engine in ['node', 'flat']:
+            temp = Mondrian_Tree(self.linear_dims, engine=engine, growth='fenwick')
+            temp.update_life_time(1, set_seed=1)
+            temp.update_life_time(2, set_seed=2)
+            temp.make_full_leaf_list()
+            self.assertEqual(len(temp._leaf_sampler), temp._num_leaves)
+            tot = 0
+            for node in temp._full_leaf_list:
+                slot = temp._leaf_sampler_slots[node.leaf_id]
+                self.assertAlmostEqual(temp._leaf_sampler.weight(slot), node.subtree_linear_dim)
+                tot += node.subtree_linear_dim
+            self.assertAlmostEqual(temp._leaf_sampler.total(), tot)
+
+    def test_fenwick_same_tree_both_engines(self):
+        trees = [Mondrian_Tree(self.linear_dims, engine=engine, growth='fenwick') 
+            for engine in ['node', 'flat']]
+        for tree in trees:
+            tree.input_data(self.data, self.labelled_indices, self.labels)
+            tree.update_life_time(1, set_seed=1)
+        self.assertEqual(trees[0]._num_leaves, trees[1]._num_leaves)
+        self.assertEqual(trees[0].predict(self.data), trees[1].predict(self.data))
+
+    def test_fenwick_expected_split_bound(self):
+        reps = 100
+        tot = 0
+        lbda = 5
+        d = 3
+        for i in range(reps):
+            temp = Mondrian_Tree([[0,1]]*d, growth='fenwick')
+            temp.update_life_time(lbda,set_seed=i)
+            tot += temp._num_leaves - 1
+        self.assertTrue(tot/reps< ((1+lbda)*math.exp(1))**d)
+
+    ###########################################
+
+    # Testing top down growth
+
+    def test_top_down_reproducible(self):
+        for engine in ['node', 'flat']:
+            trees = [Mondrian_Tree(self.linear_dims, engine=engine, growth='top_down') 
+                for _ in range(2)]
+            for tree in trees:
+                tree.update_life_time(2, set_seed=1)
+            self.assertEqual(trees[0]._num_leaves, trees[1]._num_leaves)
+            self.assertTrue(trees[0]._num_leaves > 1)
+
+    def test_top_down_same_tree_both_engines(self):
+        trees = [Mondrian_Tree(self.linear_dims, engine=engine, growth='top_down') 
+            for engine in ['node', 'flat']]
+        for tree in trees:
+            tree.update_life_time(1, set_seed=3)
+            tree.update_life_time(2, set_seed=4)
+            tree.make_full_leaf_list()
+        self.assertEqual(trees[0]._num_leaves, trees[1]._num_leaves)
+        self.assertEqual(
+            sorted(leaf.linear_dims for leaf in trees[0]._full_leaf_list),
+            sorted(leaf.linear_dims for leaf in trees[1]._full_leaf_list))
+
+    def test_top_down_with_data(self):
+        for engine in ['node', 'flat']:
+            temp = Mondrian_Tree(self.linear_dims, engine=engine, growth='top_down')
+            temp.input_data(self.data, self.labelled_indices, self.labels)
+            temp.update_life_time(1, set_seed=1)
+            temp.update_life_time(2, set_seed=2)
+            temp.make_full_leaf_list()
+            self.assertEqual(len(temp._full_leaf_list), temp._num_leaves)
+            num_labelled = 0
+            num_unlabelled = 0
+            for node in temp._full_leaf_list:
+                num_labelled += len(node.labelled_index)
+                num_unlabelled += len(node.unlabelled_index)
+                for ind in node.labelled_index + node.unlabelled_index:
+                    self.assertEqual(temp._leaf_for_point(self.data[ind]).leaf_id, node.leaf_id)
+            self.assertEqual(num_labelled, self.n_labelled)
+            self.assertEqual(num_unlabelled, self.n_points - self.n_labelled)
+
+    def test_top_down_expected_split_bound(self):
+        reps = 100
+        tot = 0
+        lbda = 5
+        d = 3
+        for i in range(reps):
+            temp = Mondrian_Tree([[0,1]]*d, engine='flat', growth='top_down')
+            temp.update_life_time(lbda,set_seed=i)
+            tot += temp._num_leaves - 1
+        self.assertTrue(tot/reps< ((1+lbda)*math.exp(1))**d)
+
+    ###########################################
+
+    # Testing lazy growth
+
+    def test_lazy_no_data_no_growth(self):
+        temp = Mondrian_Tree(self.linear_dims, growth='lazy')
+        temp.update_life_time(5, set_seed=1)
+        self.assertEqual(temp._num_leaves, 1)
+        self.assertEqual(temp._pending_leaves, {0: 0})
+
+    def test_lazy_only_empty_leaves_pending(self):
+        for engine in ['node', 'flat']:
+            temp = Mondrian_Tree(self.linear_dims, engine=engine, growth='lazy')
+            temp.update_life_time(1, set_seed=1)
+            temp.input_data(self.data[:10], range(5), self.labels[:5])
+            temp.update_life_time(3, set_seed=2)
+            temp.make_full_leaf_list()
+            self.assertEqual(len(temp._full_leaf_list), temp._num_leaves)
+            for node in temp._full_leaf_list:
+                has_data = len(node.labelled_index) + len(node.unlabelled_index) != 0
+                self.assertEqual(has_data, node.leaf_id not in temp._pending_leaves)
+                for ind in node.labelled_index + node.unlabelled_index:
+                    self.assertEqual(temp._leaf_for_point(self.data[ind]).leaf_id, node.leaf_id)
+
+    def test_lazy_same_tree_both_engines(self):
+        trees = [Mondrian_Tree(self.linear_dims, engine=engine, growth='lazy') 
+            for engine in ['node', 'flat']]
+        for tree in trees:
+            tree.update_life_time(2, set_seed=1)
+            tree.input_data(self.data, self.labelled_indices, self.labels)
+            tree.make_full_leaf_list()
+        self.assertEqual(trees[0]._num_leaves, trees[1]._num_leaves)
+        self.assertEqual(
+            sorted(leaf.linear_dims for leaf in trees[0]._full_leaf_list),
+            sorted(leaf.linear_dims for leaf in trees[1]._full_leaf_list))
+        self.assertEqual(trees[0].predict(self.data), trees[1].predict(self.data))
+
+    def test_lazy_add_data_point_grows_pending_leaf(self):
+        temp = Mondrian_Tree([[0,1]]*5, growth='lazy')
+        temp.update_life_time(3, set_seed=1)
+        temp.add_data_point([0.1]*5, 1)
+        self.assertEqual(temp._pending_leaves.get(temp._leaf_for_point([0.1]*5).leaf_id), None)
+        self.assertTrue(temp._num_leaves > 1)
+        self.assertEqual(temp.predict([0.1]*5), 1)
+
+    def test_lazy_smaller_than_top_down(self):
+        data = [[x/10 for x in point] for point in self.data]
+        leaves = []
+        for growth in ['top_down', 'lazy']:
+            temp = Mondrian_Tree(self.linear_dims, engine='flat', growth=growth)
+            temp.update_life_time(5, set_seed=1)
+            temp.input_data(data, self.labelled_indices, self.labels)
+            leaves.append(temp._num_leaves)
+        self.assertTrue(leaves[1] < leaves[0])
+
+    ###########################################
+
+    # Testing the point to leaf map
+
+    def test_point_leaf_map_through_growth(self):
+        for engine in ['node', 'flat']:
+            for growth in ['walk', 'fenwick', 'top_down', 'lazy']:
+                temp = Mondrian_Tree(self.linear_dims, engine=engine, growth=growth)
+                temp.update_life_time(1, set_seed=1)
+                temp.input_data(self.data, self.labelled_indices, self.labels)
+                temp.update_life_time(3, set_seed=2)
+                temp.add_data_point([0.5]*self.d)
+                temp.label_point(self.n_points, 1)
+                self.assertEqual(len(temp._point_leaf), self.n_points + 1)
+                self.assertEqual(temp._point_leaf.tolist(), temp.leaf_for_points(temp.points).tolist())
+
+    def test_point_leaf_map_label_point(self):
+        self.mt1.update_life_time(2, set_seed=1)
+        self.mt1.input_data(self.data, self.labelled_indices, self.labels)
+        leaf = self.mt1._leaf(int(self.mt1._point_leaf[self.n_labelled]))
+        self.mt1.label_point(self.n_labelled, 1)
+        self.assertTrue(self.n_labelled in leaf.labelled_index)
+        with self.assertRaises(ValueError):
+            self.mt1.label_point(self.n_labelled, 1)
+
+    def test_get_points_in_same_leaf_by_index(self):
+        self.mt1.update_life_time(2, set_seed=1)
+        self.mt1.input_data(self.data, self.labelled_indices, self.labels)
+        for ind in [0, self.n_labelled, self.n_points - 1]:
+            self.assertEqual(
+                self.mt1.get_points_in_same_leaf(ind, 'unlabelled'),
+                self.mt1.get_points_in_same_leaf(self.data[ind], 'unlabelled'))
+        with self.assertRaises(ValueError):
+            self.mt1.get_points_in_same_leaf(self.n_points)
+
+    ###########################################
+
+    # Testing the leaf sorted layout
+
+    def test_leaf_layout_matches_leaves(self):
+        for engine in ['node', 'flat']:
+            temp = Mondrian_Tree(self.linear_dims, engine=engine)
+            temp.update_life_time(2, set_seed=1)
+            temp.input_data(self.data, self.labelled_indices, self.labels)
+            temp.label_point(self.n_points - 1, 0.5)
+            temp.make_leaf_layout()
+            for i, node in enumerate(temp._full_leaf_list):
+                for list_name in ['labelled', 'unlabelled']:
+                    start = getattr(temp, '_' + list_name + '_offsets')[i]
+                    count = getattr(temp, '_' + list_name + '_counts')[i]
+                    layout = getattr(temp, '_' + list_name + '_layout')
+                    self.assertEqual(layout[start:start + count].tolist(), 
+                        getattr(node, list_name + '_index'))
+
+    def test_leaf_layout_out_of_date(self):
+        self.mt1.update_life_time(2, set_seed=1)
+        self.mt1.input_data(self.data, self.labelled_indices, self.labels)
+        self.mt1.make_leaf_layout()
+        self.assertTrue(self.mt1._leaf_layout_up_to_date)
+        self.mt1.label_point(self.n_points - 1, 0.5)
+        self.assertFalse(self.mt1._leaf_layout_up_to_date)
+        self.mt1.make_full_leaf_mean_list()
+        self.assertEqual(len(self.mt1._labelled_layout), self.n_labelled + 1)
+
+    ###########################################
+
+    # Testing the running leaf statistics
+
+    def test_running_leaf_stats(self):
+        for engine in ['node', 'flat']:
+            for growth in ['walk', 'top_down', 'lazy']:
+                temp = Mondrian_Tree(self.linear_dims, engine=engine, growth=growth)
+                temp.update_life_time(1, set_seed=1)
+                temp.input_data(self.data, self.labelled_indices, self.labels)
+                for ind in range(self.n_labelled, self.n_labelled + 10):
+                    temp.label_point(ind, ind / 10)
+                temp.add_data_point([0.5]*self.d, 2)
+                temp.add_data_point([0.2]*self.d)
+                temp.update_life_time(2, set_seed=2)
+                temp.label_point(self.n_points - 1, 3)
+                temp.make_full_leaf_list()
+                for node in temp._full_leaf_list:
+                    labels = [temp.labels[x] for x in node.labelled_index]
+                    self.assertEqual(temp._leaf_num_labelled[node.leaf_id], len(labels))
+                    self.assertEqual(temp._leaf_num_points[node.leaf_id], 
+                        len(labels) + len(node.unlabelled_index))
+                    if len(labels) != 0:
+                        self.assertAlmostEqual(temp._leaf_label_mean[node.leaf_id], 
+                            sum(labels)/len(labels))
+                    if len(labels) > 1:
+                        self.assertAlmostEqual(temp._leaf_label_m2[node.leaf_id] / (len(labels) - 1),
+                            utils.unbiased_var(labels))
+
+    def test_al_calculate_leaf_proportions_after_labelling(self):
+        self.mt1.update_life_time(0.5, set_seed=1)
+        self.mt1.input_data(self.data, self.labelled_indices, self.labels)
+        self.mt1.al_calculate_leaf_proportions()
+        for ind in range(self.n_labelled, self.n_points, 7):
+            self.mt1.label_point(ind, ind / 10)
+        self.mt1.al_calculate_leaf_proportions()
+        running_var_list = self.mt1._full_leaf_var_list
+        self.mt1.make_full_leaf_var_list()
+        for running_var, var in zip(running_var_list, self.mt1._full_leaf_var_list):
+            self.assertAlmostEqual(running_var, var)
+
+    ###########################################
+
+    # Testing dirty leaf tracking for the leaf proportions
+
+    def test_al_dirty_leaves_match_full_calculation(self):
+        for engine in ['node', 'flat']:
+            temp = Mondrian_Tree(self.linear_dims, engine=engine)
+            temp.update_life_time(1, set_seed=1)
+            temp.input_data(self.data, self.labelled_indices, self.labels)
+            temp.al_set_default_var_global_var()
+            temp.al_calculate_leaf_proportions()
+            for ind in range(self.n_labelled, self.n_points, 3):
+                temp.label_point(ind, (ind % 7) / 7)
+                temp.add_data_point([ind / self.n_points]*self.d)
+                temp.al_calculate_leaf_proportions()
+                self.assertTrue(len(temp._al_dirty_leaves) == 0)
+            proportions = temp._al_proportions
+            temp._al_leaf_weights = None
+            temp.al_calculate_leaf_proportions()
+            for val, full_val in zip(proportions, temp._al_proportions):
+                self.assertAlmostEqual(val, full_val)
+            self.assertAlmostEqual(sum(proportions), 1)
+
+    def test_al_dirty_leaves_only_touched(self):
+        self.mt1.update_life_time(1, set_seed=1)
+        self.mt1.input_data(self.data, self.labelled_indices, self.labels)
+        self.mt1.al_calculate_leaf_proportions()
+        weights = self.mt1._al_leaf_weights.copy()
+        self.mt1.label_point(self.n_points - 1, 10)
+        self.assertEqual(self.mt1._al_dirty_leaves, {int(self.mt1._point_leaf[self.n_points - 1])})
+        self.mt1.al_calculate_leaf_proportions()
+        changed = np.flatnonzero(weights != self.mt1._al_leaf_weights)
+        self.assertTrue(len(changed) <= 1)
+
+    def test_al_proportions_set_directly(self):
+        self.mt1.update_life_time(1, set_seed=1)
+        self.mt1.input_data(self.data, self.labelled_indices, self.labels)
+        self.mt1.al_calculate_leaf_proportions()
+        self.mt1._al_proportions = [1/self.mt1._num_leaves]*self.mt1._num_leaves
+        self.assertEqual(self.mt1._al_proportions, [1/self.mt1._num_leaves]*self.mt1._num_leaves)
+        self.assertEqual(self.mt1._al_leaf_weights, None)
+
+    ###########################################
+
+    # Testing the pass based rounding of the number of new labels
+
+    def test_al_calculate_leaf_number_new_labels_rounding_by_hand(self):
+        self.mt1.update_life_time(1, set_seed=1)
+        self.mt1.input_data(self.data, self.labelled_indices, self.labels)
+        self.mt1.make_full_leaf_list()
+        num_leaves = self.mt1._num_leaves
+        self.mt1._al_proportions = [1/num_leaves]*num_leaves
+        self.mt1._al_proportions_up_to_date = True
+        for round_by in ['highest', 'smallest']:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                self.mt1.al_calculate_leaf_number_new_labels(self.n_points, round_by=round_by)
+            num_per_leaf = self.mt1._al_leaf_number_new_labels
+            self.assertEqual(len(num_per_leaf), num_leaves)
+            self.assertTrue(sum(num_per_leaf) <= self.n_points - self.n_labelled)
+            for i, node in enumerate(self.mt1._full_leaf_list):
+                self.assertTrue(0 <= num_per_leaf[i] <= len(node.unlabelled_index))
+
+    def test_al_calculate_leaf_number_new_labels_smallest_passes(self):
+        self.mt1.input_data(self.data, self.labelled_indices, self.labels)
+        self.mt1.update_life_time(0.5, set_seed=1)
+        self.mt1.make_full_leaf_list()
+        num_leaves = self.mt1._num_leaves
+        self.mt1._al_proportions = [0]*(num_leaves - 1) + [1]
+        self.mt1._al_proportions_up_to_date = True
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            self.mt1.al_calculate_leaf_number_new_labels(self.n_points)
+
+        # The last leaf is full after its own share, the rest is handed out one point at
+        # a time to the open leaves until each of them fills up
+
+        for i, node in enumerate(self.mt1._full_leaf_list):
+            self.assertEqual(self.mt1._al_leaf_number_new_labels[i], len(node.unlabelled_index))
+
+    ###########################################
+
+    # Testing the point probability arrays
+
+    def test_al_point_probabilities_arrays(self):
+        self.mt1.update_life_time(0.5, set_seed=1)
+        self.mt1.input_data(self.data, self.labelled_indices, self.labels)
+        self.mt1.al_calculate_leaf_proportions()
+        probs = self.mt1.al_calculate_point_probabilities_proportions()
+        self.assertEqual(probs.dtype, np.float64)
+        self.assertEqual(probs.shape, (self.n_points,))
+        self.assertEqual(probs[:self.n_labelled].tolist(), [0]*self.n_labelled)
+        for i, node in enumerate(self.mt1._full_leaf_list):
+            for ind in node.unlabelled_index:
+                self.assertEqual(probs[ind], self.mt1._al_proportions[i] / len(node.unlabelled_index))
+
+    def test_al_point_probabilities_out_buffer(self):
+        self.mt1.update_life_time(0.5, set_seed=1)
+        self.mt1.input_data(self.data, self.labelled_indices, self.labels)
+        self.mt1.al_calculate_leaf_proportions()
+        buffer = np.full(self.n_points, -1.0)
+        probs = self.mt1.al_calculate_point_probabilities_adjustment(30, out=buffer)
+        self.assertTrue(probs is buffer)
+        self.assertAlmostEqual(buffer.sum(), 1)
+        self.assertEqual(buffer[:self.n_labelled].tolist(), [0]*self.n_labelled)
+        with self.assertRaises(ValueError):
+            self.mt1.al_calculate_point_probabilities_proportions(out=np.zeros(self.n_points - 1))
+        with self.assertRaises(ValueError):
+            self.mt1.al_calculate_point_probabilities_proportions(out=[0]*self.n_points)
+
+    def test_fork_shares_until_labelled(self):
+        for engine in ['node', 'flat']:
+            mt = Mondrian_Tree(self.linear_dims, engine=engine)
+            mt.update_life_time(self.a, set_seed=1)
+            mt.input_data(self.data, self.labelled_indices, self.labels)
+            mt.make_full_leaf_list()
+            preds = mt.predict(self.data)
+            ref = copy.deepcopy(mt)
+
+            fork = mt.fork()
+            self.assertTrue(fork._root is mt._root and fork._flat is mt._flat)
+            self.assertTrue(fork.labels.base is mt.labels.base)
+
+            fork.label_points([20, 30, 40], [0.1, 0.2, 0.3])
+            fork.label_point(50, 0.4)
+            ref.label_points([20, 30, 40], [0.1, 0.2, 0.3])
+            ref.label_point(50, 0.4)
+
+            self.assertEqual(mt.predict(self.data), preds)
+            self.assertEqual(mt._num_labelled, self.n_labelled)
+            self.assertTrue(np.isnan(mt.labels[20:]).all())
+            self.assertEqual(sum(len(leaf.labelled_index) for leaf in mt._leaves()), self.n_labelled)
+            self.assertEqual(fork.predict(self.data), ref.predict(self.data))
+            self.assertEqual([leaf.labelled_index for leaf in fork._leaves()], 
+                [leaf.labelled_index for leaf in ref._leaves()])
+
+    def test_fork_labelling_original(self):
+        self.mt1.update_life_time(self.a, set_seed=1)
+        self.mt1.input_data(self.data, self.labelled_indices, self.labels)
+        preds = self.mt1.predict(self.data)
+        fork = self.mt1.fork()
+        self.mt1.label_points(range(20, 60), [0.5]*40)
+        self.assertEqual(fork.predict(self.data), preds)
+        self.assertEqual(fork._num_labelled, self.n_labelled)
+        self.assertEqual(self.mt1._num_labelled, 60)
+
+    def test_fork_copied_path_keeps_parents(self):
+        self.mt1.update_life_time(2, set_seed=1)
+        self.mt1.input_data(self.data, self.labelled_indices, self.labels)
+        fork = self.mt1.fork()
+        fork.label_point(30, 0.5)
+        leaf = fork._leaf(int(fork._point_leaf[30]))
+        self.assertFalse(leaf is self.mt1._leaf(leaf.leaf_id))
+        node = leaf
+        while node.parent_node is not None:
+            self.assertTrue(node in [node.parent_node.left_child, node.parent_node.right_child])
+            node = node.parent_node
+        self.assertTrue(node is fork._root)
+
+    def test_fork_add_data_and_grow(self):
+        for growth in ['walk', 'lazy']:
+            mt = Mondrian_Tree(self.linear_dims, growth=growth)
+            mt.update_life_time(self.a, set_seed=1)
+            mt.input_data(self.data, self.labelled_indices, self.labels)
+            ref = copy.deepcopy(mt)
+            num_leaves = len(mt._leaves())
+            fork = mt.fork()
+            fork.add_data_points([[0.5]*self.d, [0.2]*self.d], [1, None])
+            fork.update_life_time(2*self.a, set_seed=2)
+            ref.add_data_points([[0.5]*self.d, [0.2]*self.d], [1, None])
+            ref.update_life_time(2*self.a, set_seed=2)
+
+            self.assertEqual(mt._num_points, self.n_points)
+            self.assertEqual(len(mt._leaves()), num_leaves)
+            self.assertEqual(mt._life_time, self.a)
+            self.assertEqual(fork.predict(self.data), ref.predict(self.data))
+            self.assertEqual(fork._point_leaf.tolist(), ref._point_leaf.tolist())
+
+    def test_split_times_stored(self):
+        for engine in ['node', 'flat']:
+            mt = Mondrian_Tree(self.linear_dims, engine=engine)
+            mt.update_life_time(2, set_seed=1)
+            parent, split_time = mt._node_arrays()
+            for leaf in mt._leaves():
+                node = leaf.leaf_id
+                while parent[node] >= 0:
+                    self.assertTrue(split_time[parent[node]] < split_time[node])
+                    node = parent[node]
+                self.assertEqual(node, 0)
+            split_times = split_time[np.isfinite(split_time)]
+            self.assertEqual(len(split_times), mt._num_leaves - 1)
+            self.assertTrue((split_times < 2).all())
+
+    def test_update_life_time_smaller_prunes(self):
+        for engine in ['node', 'flat']:
+            for growth in ['walk', 'fenwick']:
+                mt = Mondrian_Tree(self.linear_dims, engine=engine, growth=growth)
+                mt.update_life_time(1, set_seed=1)
+                mt.input_data(self.data, self.labelled_indices, self.labels)
+                pruned = Mondrian_Tree(self.linear_dims, engine=engine, growth=growth)
+                pruned.update_life_time(3, set_seed=1)
+                pruned.input_data(self.data, self.labelled_indices, self.labels)
+                pruned.update_life_time(1)
+
+                self.assertEqual(pruned._life_time, 1)
+                self.assertEqual(pruned._num_leaves, mt._num_leaves)
+                self.assertEqual(
+                    [(leaf.leaf_id, leaf.linear_dims, leaf.labelled_index, leaf.unlabelled_index) 
+                        for leaf in pruned._leaves()],
+                    [(leaf.leaf_id, leaf.linear_dims, leaf.labelled_index, leaf.unlabelled_index) 
+                        for leaf in mt._leaves()])
+                self.assertEqual(pruned.predict(self.data), mt.predict(self.data))
+                self.assertAlmostEqual(pruned._total_linear_dim(), mt._total_linear_dim())
+
+    def test_update_life_time_prune_then_grow(self):
+        for engine in ['node', 'flat']:
+            for growth in ['walk', 'top_down', 'lazy']:
+                mt = Mondrian_Tree(self.linear_dims, engine=engine, growth=growth)
+                mt.update_life_time(3, set_seed=1)
+                mt.input_data(self.data, self.labelled_indices, self.labels)
+                mt.update_life_time(0.5)
+                mt.update_life_time(2, set_seed=2)
+                self.assertEqual(mt._num_leaves, len(mt._leaves()))
+                self.assertEqual(mt._point_leaf.tolist(), mt.leaf_for_points(self.data).tolist())
+                self.assertEqual(sorted(itertools.chain.from_iterable(
+                    leaf.labelled_index + leaf.unlabelled_index for leaf in mt._leaves())), 
+                    list(range(self.n_points)))
+
+    def test_truncate(self):
+        self.mt1.update_life_time(3, set_seed=1)
+        self.mt1.input_data(self.data, self.labelled_indices, self.labels)
+        num_leaves = self.mt1._num_leaves
+        truncated = self.mt1.truncate(1)
+        self.assertEqual(truncated._life_time, 1)
+        self.assertTrue(truncated._num_leaves < num_leaves)
+        self.assertEqual(self.mt1._num_leaves, num_leaves)
+        self.assertEqual(self.mt1._life_time, 3)
+        with self.assertRaises(ValueError):
+            self.mt1.truncate(4)
+
+    def test_predict_life_times(self):
+        for engine in ['node', 'flat']:
+            mt = Mondrian_Tree(self.linear_dims, engine=engine)
+            mt.update_life_time(4, set_seed=1)
+            mt.input_data(self.data, self.labelled_indices, self.labels)
+            life_times = [2, 0.5, 4, 1]
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                preds = mt.predict_life_times(self.data, life_times)
+                self.assertEqual(preds.shape, (4, self.n_points))
+                for i, life_time in enumerate(life_times):
+                    self.assertEqual(preds[i].tolist(), mt.truncate(life_time).predict(self.data))
+            with self.assertRaises(ValueError):
+                mt.predict_life_times(self.data, [5])
+
+    def test_life_time_error_curve(self):
+        for engine in ['node', 'flat']:
+            mt = Mondrian_Tree(self.linear_dims, engine=engine)
+            mt.update_life_time(4, set_seed=1)
+            mt.input_data(self.data[:80], range(80), [x[0] + x[1] for x in self.data[:80]])
+            val_points = self.data[80:]
+            val_labels = [x[0] + x[1] for x in val_points]
+
+            life_times, errors = mt.life_time_error_curve(val_points, val_labels, num_life_times=40)
+            self.assertEqual(len(life_times), 40)
+            self.assertEqual(life_times[-1], 4)
+            for i in [0, 13, 39]:
+                preds = np.array(mt.truncate(life_times[i]).predict(val_points))
+                self.assertAlmostEqual(errors[i], ((preds - val_labels)**2).mean())
+
+            life_times, errors = mt.life_time_error_curve(val_points, val_labels, life_times=[3, 1])
+            self.assertEqual(life_times.tolist(), [3, 1])
+            self.assertEqual(errors.tolist(), 
+                mt.life_time_error_curve(val_points, val_labels, life_times=[1, 3])[1][::-1].tolist())
+            with self.assertRaises(ValueError):
+                mt.life_time_error_curve(val_points, val_labels[1:])
+
+    def test_loo_residuals_match_refitting(self):
+        labelled = list(range(0, self.n_points, 3))
+        labels = [x[0] * x[1] for x in self.data]
+        for engine in ['node', 'flat']:
+            mt = Mondrian_Tree(self.linear_dims, engine=engine)
+            mt.update_life_time(2, set_seed=1)
+            mt.input_data(self.data, labelled, [labels[i] for i in labelled])
+            residuals = mt.loo_residuals()
+            self.assertEqual(len(residuals), len(labelled))
+            self.assertTrue((mt._leaf_num_labelled[mt._point_leaf[labelled]] == 1).any())
+
+            for j, i in enumerate(labelled):
+                rest = [k for k in labelled if k != i]
+                refit = Mondrian_Tree(self.linear_dims, engine=engine)
+                refit.update_life_time(2, set_seed=1)
+                refit.input_data(self.data, rest, [labels[k] for k in rest])
+                refit.set_default_pred_global_mean()
+                self.assertAlmostEqual(residuals[j], labels[i] - refit.predict(self.data[i]))
+            self.assertAlmostEqual(mt.loo_error(), (residuals**2).mean())
+
+    def test_loo_error_no_labels(self):
+        self.mt1.update_life_time(1, set_seed=1)
+        self.mt1.input_data(self.data, [], [])
+        self.assertEqual(len(self.mt1.loo_residuals()), 0)
+        with self.assertRaises(RuntimeError):
+            self.mt1.loo_error()
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file